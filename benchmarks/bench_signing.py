@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark of transaction signing throughput: serial signing vs. `ParallelSigner` process pool
+
+Usage (from the repository root):
+    python -m benchmarks.bench_signing --txs 500 --signatories 3 --processes 4
+"""
+import os
+import json
+import time
+import argparse as ap
+
+from fetchai.ledger.crypto import Entity, Address
+
+from fet_tools.tools import create_action_tx, sign_txs
+
+
+def build_txs(count: int, signatories):
+    contract_address = Address(Entity())
+    txs = []
+    for _ in range(count):
+        tx = create_action_tx(contract_address, Address(signatories[0]), "accept", 10000, signatories)
+        tx.valid_from = 0
+        tx.valid_until = 100
+        txs.append((tx, signatories))
+    return txs
+
+
+def measure(count: int, signatories, processes: int) -> dict:
+    txs = build_txs(count, signatories)
+    started = time.perf_counter()
+    signed = sign_txs(txs, processes)
+    elapsed = time.perf_counter() - started
+
+    assert all(tx.is_valid() for tx in signed)
+    signatures = count * len(signatories)
+    return {
+        "processes": processes,
+        "txs": count,
+        "signatures": signatures,
+        "elapsed_s": round(elapsed, 4),
+        "signatures_per_s": round(signatures / elapsed, 1),
+    }
+
+
+def main():
+    parser = ap.ArgumentParser(description='Benchmark of serial vs. parallel transaction signing')
+    parser.add_argument("--txs", type=int, default=500, help="Number of transactions to sign")
+    parser.add_argument("--signatories", type=int, default=3, help="Number of signatories per transaction")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Size of the signing process pool")
+    args = parser.parse_args()
+
+    signatories = [Entity() for _ in range(args.signatories)]
+    serial = measure(args.txs, signatories, 0)
+    parallel = measure(args.txs, signatories, args.processes)
+    print(json.dumps({
+        "serial": serial,
+        "parallel": parallel,
+        "speedup": round(parallel["signatures_per_s"] / serial["signatures_per_s"], 2),
+    }, indent=4))
+
+
+if __name__ == '__main__':
+    main()
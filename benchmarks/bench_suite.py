@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite of the CLI and `fet_tools` hot paths against in-process stub ledger (`fet_tools.stub`)
+
+Measures:
+  * cli_startup     - wall time of `contract_cli.py --help` (fresh interpreter per run)
+  * action_sign     - build + sign throughput of contract action txs (`ContractTxFactory.action`)
+  * deploy_contract - end-to-end latency of `deploy_contract` (build, validity, sign, submit, sync)
+  * status_decode   - `ContractStatus.from_dict` decode throughput
+  * status_columns  - bulk `decode_status_columns` decode throughput
+  * status_query    - `query_contract_status` throughput (stub query + decode)
+  * balance_query   - `tokens.balance` throughput
+  * simulator       - escrow workflow (deploy, deposit, accept by both parties) executed by simulated ledger
+                      (`fet_tools.simulator`), txs are built up front and not signed
+  * scheduler       - scheduling (`ExpiryScheduler.track`) and popping due contracts of the expiry heap,
+                      `size` contracts tracked at once
+  * multinode       - concurrent status queries through `MultiNodeLedgerApi` over 3 local stub nodes with
+                      different latencies, one of which goes down halfway (failover)
+
+Results are printed (or written with `--output`) as JSON. With `--baseline` the primary metric of each
+benchmark is compared with the previous results and benchmarks slower by more than `--tolerance` are
+reported as regressions (non-zero exit code).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_suite --output bench.json
+    python -m benchmarks.bench_suite --only deploy_contract status_decode --baseline bench.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import subprocess
+import argparse as ap
+from pathlib import Path
+from typing import Dict, List
+
+from fetchai.ledger.crypto import Entity, Address
+
+from fet_tools.tools import create_action_tx, create_deploy_tx, sign_tx, deploy_contract, get_contract_template
+from fet_tools.status import ContractStatus, query_contract_status, decode_status_columns
+from fet_tools.stub import StubLedgerApi, StubNode
+from fet_tools.multinode import MultiNodeLedgerApi, Endpoint
+from fet_tools.status import query_status_many
+from fet_tools.simulator import SimulatedLedgerApi
+from fet_tools.scheduler import ExpiryScheduler, FakeBlockClock, RELEASE_TIMEOUT_BLOCKS
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CONTRACT_FILE = REPO_ROOT / "escrow.etch"
+RESULTS_VERSION = 1
+
+
+def _percentile(ordered: List[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def _latency_stats(latencies: List[float]) -> dict:
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    return {
+        "count": len(ordered),
+        "elapsed_s": round(total, 4),
+        "per_s": round(len(ordered) / total, 1) if total > 0 else 0.0,
+        "latency_mean_ms": round(total / len(ordered) * 1000, 4),
+        "latency_p50_ms": round(_percentile(ordered, 50) * 1000, 4),
+        "latency_p95_ms": round(_percentile(ordered, 95) * 1000, 4),
+        "latency_max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+def _throughput(count: int, elapsed: float) -> dict:
+    return {
+        "count": count,
+        "elapsed_s": round(elapsed, 4),
+        "per_s": round(count / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def _status_record(seller: Address, buyer: Address, escrow: Address) -> dict:
+    return ContractStatus(buyer=buyer, seller=seller, escrow=escrow, balance=1000, start=1234,
+                          sellerOk=True, buyerOk=False).to_dict(encode_json=True)
+
+
+def bench_cli_startup(runs: int) -> dict:
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, str(REPO_ROOT / "contract_cli.py"), "--help"], cwd=str(REPO_ROOT),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    interpreter = time.perf_counter() - started
+
+    result = _latency_stats(latencies)
+    result["interpreter_ms"] = round(interpreter * 1000, 4)
+    return result
+
+
+def bench_action_sign(count: int, signatories: int = 1) -> dict:
+    entities = [Entity() for _ in range(signatories)]
+    contract_address = Address(Entity())
+    from_address = Address(entities[0])
+
+    started = time.perf_counter()
+    for _ in range(count):
+        tx = create_action_tx(contract_address, from_address, "accept", 10000, entities)
+        tx.valid_from = 0
+        tx.valid_until = 100
+        sign_tx(tx, entities)
+    elapsed = time.perf_counter() - started
+
+    result = _throughput(count, elapsed)
+    result["signatories"] = signatories
+    return result
+
+
+def bench_deploy_contract(count: int) -> dict:
+    api = StubLedgerApi()
+    owner, seller, buyer = Entity(), Entity(), Entity()
+    template = get_contract_template(CONTRACT_FILE)
+    transfers = [(Address(seller), 1), (Address(buyer), 1)]
+
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        contract = template.instantiate(owner, f"bench-{i}".encode())
+        deploy_contract(api, contract, 600000, [owner], transfers)
+        latencies.append(time.perf_counter() - started)
+
+    assert len(api.submitted) == count
+    return _latency_stats(latencies)
+
+
+def bench_status_decode(count: int) -> dict:
+    record = _status_record(Address(Entity()), Address(Entity()), Address(Entity()))
+    started = time.perf_counter()
+    for _ in range(count):
+        ContractStatus.from_dict(record)
+    return _throughput(count, time.perf_counter() - started)
+
+
+def bench_status_columns(count: int) -> dict:
+    records = [_status_record(Address(Entity()), Address(Entity()), Address(Entity()))] * count
+    started = time.perf_counter()
+    decode_status_columns(records)
+    return _throughput(count, time.perf_counter() - started)
+
+
+def bench_status_query(count: int) -> dict:
+    api = StubLedgerApi()
+    contract_address = Address(Entity())
+    api.set_contract_status(contract_address,
+                            _status_record(Address(Entity()), Address(Entity()), Address(Entity())))
+    started = time.perf_counter()
+    for _ in range(count):
+        assert query_contract_status(api, contract_address) is not None
+    return _throughput(count, time.perf_counter() - started)
+
+
+def bench_balance_query(count: int) -> dict:
+    api = StubLedgerApi()
+    address = Address(Entity())
+    api.balances[address] = 1000
+    started = time.perf_counter()
+    for _ in range(count):
+        api.tokens.balance(address)
+    return _throughput(count, time.perf_counter() - started)
+
+
+def bench_simulator(count: int) -> dict:
+    api = SimulatedLedgerApi()
+    owner, seller, buyer = Entity(), Entity(), Entity()
+    template = get_contract_template(CONTRACT_FILE)
+    transfers = [(Address(seller), 1), (Address(buyer), 1)]
+
+    txs = []
+    for i in range(count):
+        contract = template.instantiate(owner, f"bench-{i}".encode())
+        txs.append(create_deploy_tx(contract, 600000, [owner], transfers))
+        txs.append(create_action_tx(contract.address, Address(buyer), "deposit", 10000, [buyer],
+                                    [(contract.address, 1000)]))
+        txs.append(create_action_tx(contract.address, Address(buyer), "accept", 10000, [buyer]))
+        txs.append(create_action_tx(contract.address, Address(seller), "accept", 10000, [seller]))
+    for tx in txs:
+        api.set_validity_period(tx)
+
+    started = time.perf_counter()
+    for tx in txs:
+        api.tokens.submit_signed_tx(tx)
+    elapsed = time.perf_counter() - started
+
+    assert api.contract_count == count and api.balance(seller) == count * 990
+    result = _throughput(len(txs), elapsed)
+    result["contracts"] = count
+    return result
+
+
+def bench_scheduler(count: int) -> dict:
+    scheduler = ExpiryScheduler(None, None, FakeBlockClock(), batch_size=count)
+    statuses = [ContractStatus(start=i % 100000, buyerOk=i % 2 == 0, sellerOk=False) for i in range(count)]
+    addresses = [f"contract-{i}" for i in range(count)]
+
+    started = time.perf_counter()
+    for address, status in zip(addresses, statuses):
+        scheduler.track(address, status, 0)
+    due = 0
+    for block in range(0, RELEASE_TIMEOUT_BLOCKS + 101001, 1000):
+        due += len(scheduler._pop_due(block))
+    elapsed = time.perf_counter() - started
+
+    assert due == count
+    result = _throughput(count, elapsed)
+    result["contracts"] = count
+    return result
+
+
+def bench_multinode(count: int) -> dict:
+    ledger = StubLedgerApi()
+    nodes = [StubNode(ledger, "fast", 0.0005), StubNode(ledger, "medium", 0.002), StubNode(ledger, "slow", 0.01)]
+    api = MultiNodeLedgerApi([Endpoint(node.name, node) for node in nodes])
+    addresses = []
+    for _ in range(100):
+        address = Address(Entity())
+        ledger.set_contract_status(address, _status_record(Address(Entity()), Address(Entity()), Address(Entity())))
+        addresses.append(str(address))
+
+    half = count // 2
+    started = time.perf_counter()
+    errors = sum(1 for r in query_status_many(api, (addresses[i % 100] for i in range(half)), 16) if r.error)
+    nodes[0].down = True
+    errors += sum(1 for r in query_status_many(api, (addresses[i % 100] for i in range(count - half)), 16) if r.error)
+    elapsed = time.perf_counter() - started
+
+    assert errors == 0
+    result = _throughput(count, elapsed)
+    result["requests"] = {name: stats["requests"] for name, stats in api.stats().items()}
+    return result
+
+
+# name -> (function, default size, primary metric, True if higher value of the metric is better)
+BENCHMARKS = {
+    "cli_startup": (bench_cli_startup, 5, "latency_p50_ms", False),
+    "action_sign": (bench_action_sign, 500, "per_s", True),
+    "deploy_contract": (bench_deploy_contract, 200, "latency_p50_ms", False),
+    "status_decode": (bench_status_decode, 200000, "per_s", True),
+    "status_columns": (bench_status_columns, 200000, "per_s", True),
+    "status_query": (bench_status_query, 20000, "per_s", True),
+    "balance_query": (bench_balance_query, 100000, "per_s", True),
+    "simulator": (bench_simulator, 2000, "per_s", True),
+    "scheduler": (bench_scheduler, 200000, "per_s", True),
+    "multinode": (bench_multinode, 5000, "per_s", True),
+}  # type: Dict[str, tuple]
+
+
+def run(names: List[str], scale: float = 1.0) -> dict:
+    results = {}
+    for name in names:
+        func, size, metric, _ = BENCHMARKS[name]
+        result = func(max(1, int(size * scale)))
+        result["metric"] = metric
+        results[name] = result
+    return {
+        "version": RESULTS_VERSION,
+        "timestamp": int(time.time()),
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "benchmarks": results,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[dict]:
+    """
+    Compares primary metric of each benchmark with baseline results
+
+    :param tolerance: Relative slowdown (e.g. 0.1 = 10%) above which the benchmark is reported as regression
+    :return: Regressions
+    """
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous:
+            continue
+        metric = result["metric"]
+        higher_is_better = BENCHMARKS[name][3]
+        old, new = previous[metric], result[metric]
+        if old <= 0 or new <= 0:
+            continue
+        slowdown = (old / new if higher_is_better else new / old) - 1.0
+        result["change"] = round(-slowdown, 4)
+        if slowdown > tolerance:
+            regressions.append({"benchmark": name, "metric": metric, "baseline": old, "current": new,
+                                "slowdown": round(slowdown, 4)})
+    return regressions
+
+
+def main():
+    parser = ap.ArgumentParser(description='Benchmark suite of contract_cli.py & fet_tools against stub ledger')
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS.keys()), default=list(BENCHMARKS.keys()),
+                        help="Benchmarks to run (all by default)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier of the number of iterations")
+    parser.add_argument("--output", type=str, default=None, help="File to write JSON results to (stdout by default)")
+    parser.add_argument("--baseline", type=str, default=None, help="Previous JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative slowdown reported as regression when compared with the baseline")
+    args = parser.parse_args()
+
+    # fetchai warns about default shard mask for every action tx
+    logging.getLogger().setLevel(logging.ERROR)
+    results = run(args.only, args.scale)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results["regressions"] = regressions
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if regressions:
+        for r in regressions:
+            print(f'Regression: {r["benchmark"]} {r["metric"]} {r["baseline"]} -> {r["current"]}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
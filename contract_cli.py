@@ -1,20 +1,89 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
 import argparse as ap
 import traceback
-from dataclasses import dataclass, field
-from dataclasses_json import dataclass_json, config
-from typing import Tuple
-
-from fetchai.ledger.crypto import Entity, Address
-from fetchai.ledger.contract import Contract
-from fetchai.ledger.api import LedgerApi
-from fetchai.ledger.api.contracts import ContractTxFactory
-from fet_tools.tools import deploy_contract, track_cost, connect_ledger,\
-                            collect_private_keys_from_user_input,\
-                            encode_bool, decode_bool, \
-                            encode_fetch_address, decode_fetch_address, \
-                            FetchTxDigest
+from getpass import getpass
+from typing import Tuple, Optional, TYPE_CHECKING
+
+from fet_tools.startup import StartupProfiler
+
+# Heavy dependencies (fetchai.ledger, requests, ...) are imported lazily by sub-command handlers which need them
+if TYPE_CHECKING:
+    from fetchai.ledger.crypto import Address
+    from fetchai.ledger.api import LedgerApi
+    from fet_tools.status import ContractStatus
+    from fet_tools.index import ContractIndex
+    from fet_tools.keys import KeyProvider
+    from fet_tools.costs import CostAccountant, CostItem, BalanceSnapshot, FeeModel
+    from fet_tools.deeds import DeedCache, SignatorySelector
+    from fet_tools.preflight import PreflightChecker
+
+# The same as `fet_tools.index.ROLES`, duplicated to keep argument parsing free of heavy imports
+PARTY_ROLES = ("seller", "buyer", "escrow")
+
+# Contract action -> name used in messages of the `action` sub-command
+ACTION_MESSAGES = {
+    "deposit": "Deposit",
+    "accept": "Accept action",
+    "cancel": "Cancel action",
+    "kill": "Kill action",
+    "withdrawExcessBalance": "Withdrawal of excess balance",
+}
+
+
+class LazyLedgerApi:
+    """
+    Proxy of `LedgerApi` connecting to the ledger on the first use, so sub-commands which do not talk
+    to the ledger never touch the network
+    """
+    def __init__(self, args, profiler: Optional[StartupProfiler] = None):
+        self._args = args
+        self._profiler = profiler
+        self._api = None
+
+    def _connect(self) -> LedgerApi:
+        started = time.perf_counter()
+        if self._args.simulate:
+            from fet_tools.simulator import SimulatedLedgerApi
+            from fet_tools.metrics import instrument
+            self._api = instrument(SimulatedLedgerApi.open(self._args.simulate))
+        elif self._args.endpoints:
+            from fet_tools.multinode import MultiNodeLedgerApi, parse_endpoints
+            from fet_tools.metrics import instrument
+            try:
+                endpoints = parse_endpoints(self._args.endpoints)
+            except ValueError as ex:
+                print(str(ex))
+                exit(-1)
+            multi = MultiNodeLedgerApi.connect(endpoints, request_timeout=self._args.request_timeout)
+            multi.start_health_checks(self._args.health_interval)
+            self._api = instrument(multi)
+        else:
+            from fet_tools.tools import connect_ledger
+            self._api = connect_ledger(network=self._args.network, host=self._args.hostname, port=self._args.port)
+        if self._profiler is not None:
+            self._profiler.phases.append(("ledger connect", time.perf_counter() - started))
+        return self._api
+
+    def __getattr__(self, name):
+        api = self._api if self._api is not None else self._connect()
+        return getattr(api, name)
+
+    def close(self):
+        """
+        Persists state of the simulated ledger (`--simulate`) and stops health checks of ledger nodes (`--endpoints`),
+        if it has been used
+        """
+        if self._args.simulate and self._api is not None:
+            self._api.save(self._args.simulate)
+        elif self._args.endpoints and self._api is not None:
+            self._api.close()
 
 
 class ExtendAction(ap.Action):
@@ -24,56 +93,194 @@ class ExtendAction(ap.Action):
         setattr(namespace, self.dest, items)
 
 
-@dataclass_json
-@dataclass(order=True)
-class ContractStatus:
-    buyer: Address = field(
-        default=None,
-        metadata=config(
-            encoder=encode_fetch_address,
-            decoder=decode_fetch_address,
-        ))
-    seller: Address = field(
-        default=None,
-        metadata=config(
-            encoder=encode_fetch_address,
-            decoder=decode_fetch_address,
-        ))
-    escrow: Address = field(
-        default=None,
-        metadata=config(
-            encoder=encode_fetch_address,
-            decoder=decode_fetch_address,
-        ))
-    balance: int = field(
-        default=0,
-        metadata=config(
-            field_name="deposited_balance"
-        ))
-    start: int = 0
-    settledSinceBlock: int = 0xFFFFFFFFFFFFFFFF
-    sellerOk: bool = field(
-        default=None,
-        metadata=config(
-            encoder=encode_bool,
-            decoder=decode_bool,
-        ))
-    buyerOk: bool = field(
-        default=None,
-        metadata=config(
-            encoder=encode_bool,
-            decoder=decode_bool,
-        ))
+def open_index(args) -> Optional[ContractIndex]:
+    """
+    Opens contract index if it has been configured (`--index` option or `ESCROW_INDEX` env. variable)
+    """
+    if not args.index:
+        return None
+    if getattr(args, "_index", None) is None:
+        from fet_tools.index import ContractIndex
+        args._index = ContractIndex(args.index)
+    return args._index
+
+
+def get_cost_accountant(args) -> Optional[CostAccountant]:
+    """
+    Opens cost statistics file if it has been configured (`--costs` option or `ESCROW_COSTS` env. variable)
+    """
+    if not args.costs:
+        return None
+    if getattr(args, "_costs", None) is None:
+        from fet_tools.costs import CostAccountant
+        args._costs = CostAccountant(args.costs)
+    return args._costs
+
+
+def get_fee_model(args) -> FeeModel:
+    """
+    Fee model learning charges per action from cost statistics (`--costs`), without them only from Txs of this run
+    """
+    if getattr(args, "_fee_model", None) is None:
+        from fet_tools.costs import CostAccountant, FeeModel
+        args._fee_model = FeeModel(get_cost_accountant(args) or CostAccountant(), margin=args.fee_margin)
+    return args._fee_model
+
+
+def select_fee(args, action: str) -> int:
+    """
+    Fee of Tx of the `action`: explicit `--fee`, otherwise chosen by the fee model
+    """
+    return args.fee if args.fee is not None else get_fee_model(args).fee(action)
+
+
+def get_preflight(api: LedgerApi, args) -> Optional[PreflightChecker]:
+    """
+    Pre-flight checker of contract actions, None if disabled (`--no-preflight`) or in offline mode (no ledger access)
+    """
+    if args.no_preflight or getattr(args, "offline", None):
+        return None
+    if getattr(args, "_preflight", None) is None:
+        from fet_tools.preflight import PreflightChecker, StatusCache
+        args._preflight = PreflightChecker(StatusCache(api))
+    return args._preflight
+
+
+def get_key_provider(args) -> Optional[KeyProvider]:
+    """
+    Creates (once per process) key provider from `--keystore`, `--keys-env`, `--keys-file`, `--keys-fd`
+    and `--signer-agent` options, returns None if none of them is used (=> keys are collected interactively)
+    """
+    from fet_tools.keys import KeyProviderChain, KeystoreProvider, EnvKeyProvider, StreamKeyProvider, SignerAgentClient
+
+    if getattr(args, "_key_provider", None) is not None:
+        return args._key_provider
+
+    providers = []
+    if args.keystore:
+        password = os.environ.get("ESCROW_KEYSTORE_PASSWORD") or getpass(f"Password for {args.keystore} keystore: ")
+        providers.append(KeystoreProvider(args.keystore, password))
+    if args.keys_env:
+        providers.append(EnvKeyProvider(args.keys_env))
+    if args.keys_file:
+        providers.append(StreamKeyProvider.from_file(args.keys_file))
+    if args.keys_fd is not None:
+        providers.append(StreamKeyProvider.from_fd(args.keys_fd))
+    if args.signer_agent:
+        providers.append(SignerAgentClient(args.signer_agent))
+
+    args._key_provider = KeyProviderChain(providers) if providers else None
+    return args._key_provider
+
+
+def get_deed_cache(api: LedgerApi, args) -> DeedCache:
+    """
+    Process-wide cache of deeds (`--deed-ttl`)
+    """
+    if getattr(args, "_deed_cache", None) is None:
+        from fet_tools.deeds import DeedCache
+        args._deed_cache = DeedCache(api, ttl=args.deed_ttl)
+    return args._deed_cache
+
+
+def get_signatory_selector(api: LedgerApi, args) -> SignatorySelector:
+    """
+    Process-wide selector of minimal signatories from deed thresholds, keys come from configured key provider
+    or are collected interactively (only for the signees needed). Deeds are not looked up in offline mode.
+    """
+    if getattr(args, "_signatory_selector", None) is None:
+        from fet_tools.deeds import SignatorySelector
+        from fet_tools.tools import collect_single_signatory_from_user_input
+
+        provider = get_key_provider(args)
+        key_for = provider.get if provider is not None else collect_single_signatory_from_user_input
+        deeds = None if getattr(args, "offline", None) else get_deed_cache(api, args)
+        args._signatory_selector = SignatorySelector(deeds, key_for)
+    return args._signatory_selector
+
+
+def select_signatories(api: LedgerApi, args, address: Address, operations):
+    """
+    Minimal set of signatories for tx of the `address` meeting deed thresholds of the `operations`
+    (`fet_tools.deeds.tx_operations`), the key of the address itself if it has no deed
+    """
+    from fetchai.ledger.crypto import Address
+
+    try:
+        signatories = get_signatory_selector(api, args).select(address, operations)
+    except ValueError as ex:
+        print(f"{ex}.")
+        print("Exiting ...")
+        exit(-1)
+
+    print(f"Using signatory(ies) with address(es) {', '.join(str(Address(s)) for s in signatories)} for {address}")
+    return signatories
+
+
+def create_keystore(api: LedgerApi, args):
+    from fetchai.ledger.crypto import Entity
+    from fet_tools.tools import collect_private_keys_from_user_input
+    from fet_tools.keys import write_keystore
+
+    print("Provide private keys to be stored in the keystore.")
+    signatories = collect_private_keys_from_user_input()
+
+    password = getpass("Keystore password: ")
+    while not Entity.is_strong_password(password):
+        password = getpass("Weak password please try again: ")
+    if getpass("Confirm keystore password: ") != password:
+        print("Passwords do not match.")
+        exit(-1)
+
+    write_keystore(args.file, signatories, password)
+    print(f"Keystore with {len(signatories)} key(s) has been written to {args.file}")
+
+
+def run_signer_agent(api: LedgerApi, args):
+    from fetchai.ledger.crypto import Entity
+    from fet_tools.tools import collect_private_keys_from_user_input
+    from fet_tools.keys import SignerAgent
+
+    provider = get_key_provider(args)
+    if provider is None:
+        print("Provide private keys of all signatories the agent will sign with.")
+        signatories = collect_private_keys_from_user_input()
+    else:
+        signatories = [s for s in provider.entities() if isinstance(s, Entity)]
+
+    try:
+        agent = SignerAgent(args.socket, signatories)
+    except ValueError as ex:
+        print(f"{ex}.")
+        print("Exiting ...")
+        exit(-1)
+    print(f"Signer agent with {len(signatories)} key(s) listening on {args.socket}")
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        print("Exiting ...")
+    finally:
+        agent.server_close()
+        os.unlink(args.socket)
 
 
 def deploy_contract_local(api: LedgerApi, args):
-    contract_owner_address = Address(args.contract_owner_address)
+    from fetchai.ledger.crypto import Address
+    from fet_tools.tools import deploy_contract, get_contract_template, create_deploy_tx, sign_tx
+    from fet_tools.deeds import tx_operations
+    from fet_tools.preflight import check_deploy
+    from fet_tools.costs import CostItem, BalanceSnapshot
 
-    with open(args.contract_file, 'r') as ct:
-        contract_text = ct.read()
+    contract_owner_address = Address(args.contract_owner_address)
+    transfers = parse_transfers(args)
+    reason = None if args.no_preflight else check_deploy(transfers)
+    if reason is not None:
+        print(f"Contract deployment would fail: {reason}\nUse --no-preflight to submit it anyway.")
+        exit(-1)
 
     # create the smart contract
-    contract = Contract(contract_text, contract_owner_address, args.contract_deployment_nonce.encode())
+    template = get_contract_template(args.contract_file)
+    contract = template.instantiate(contract_owner_address, args.contract_deployment_nonce.encode())
     print(f"contract source code:\n{contract.source}\n\n")
     print(f"owner address: {contract.owner}")
     print(f"nonce: {contract.nonce}")
@@ -86,7 +293,6 @@ def deploy_contract_local(api: LedgerApi, args):
         print("Exiting ...")
         exit(-1)
 
-    transfers = parse_transfers(args)
     if transfers:
         print("Transfers:")
         for address, amount in transfers:
@@ -98,20 +304,82 @@ def deploy_contract_local(api: LedgerApi, args):
             print("Exiting ...")
             exit(-1)
 
-    signatories = collect_private_keys_from_user_input()
+    signatories = select_signatories(api, args, contract.owner, tx_operations("create", bool(transfers)))
+
+    if args.offline:
+        tx = create_deploy_tx(contract, select_fee(args, "deploy"), signatories, transfers)
+        set_validity(api, args, tx)
+        sign_tx(tx, signatories)
+        write_offline_tx(args, "deploy", tx)
+        print(f"contract address: {contract.address}")
+        return
 
-    with track_cost(api.tokens, contract.owner, "Cost of creation: "):
-        api.sync(deploy_contract(api, contract, args.fee, signatories, transfers))
+    if args.no_sync:
+        tx_hash = deploy_contract(api, contract, select_fee(args, "deploy"), signatories, transfers, sync=False)
+        print(f"Contract deployment Tx has been submitted, digest: {tx_hash}")
+        return
+
+    snapshot = BalanceSnapshot(api, [contract.owner])
+    tx_hash = deploy_contract(api, contract, select_fee(args, "deploy"), signatories, transfers, sync=False)
+    statuses = api.sync([tx_hash])
+    report_cost(args, CostItem("deploy", str(contract.owner), tx_hash, sum(a for _, a in transfers or ())),
+                statuses[0] if statuses else None, snapshot, "Cost of creation: ")
 
     print("Contract has been successfully deployed.")
 
+    index = open_index(args)
+    if index is not None and len(transfers) == 2:
+        index.record_deployment(contract.owner, args.contract_deployment_nonce, transfers[0][0], transfers[1][0])
+
+
+def deploy_contracts_batch_local(api: LedgerApi, args):
+    from fet_tools.tools import get_contract_template
+    from fet_tools.batch import read_manifest, deploy_contracts_batch, SUCCESSFUL_STATUSES
+
+    contract_text = get_contract_template(args.contract_file).source
+
+    rows = read_manifest(args.manifest)
+    owners = sorted(set(row.owner for row in rows))
+    print(f"contract file: {args.contract_file}")
+    print(f"manifest: {args.manifest} ({len(rows)} rows, {len(owners)} distinct owner(s))")
+    print(f"results file: {args.results}")
+
+    if not args.yes:
+        resp = input("\n\nAre contract deployment data above correct? [y/N]: ").lower()
+
+        if resp != "y":
+            print("Exiting ...")
+            exit(-1)
+
+    # Deeds of all owners are fetched concurrently up front, signatories are then selected from the cache
+    get_deed_cache(api, args).get_many(owners)
+    records = deploy_contracts_batch(api, contract_text, rows, select_fee(args, "deploy"),
+                                     get_signatory_selector(api, args).select,
+                                     args.results, sync_timeout=args.timeout, index=open_index(args),
+                                     sign_processes=args.sign_processes, costs=get_cost_accountant(args),
+                                     pipeline=args.pipeline)
+
+    succeeded = sum(1 for r in records if r["status"] in SUCCESSFUL_STATUSES)
+    print(f"Processed {len(records)} contract(s): {succeeded} deployed, {len(records) - succeeded} failed/pending")
+    print(f"Per-row results have been written to {args.results}")
+
+    costs = get_cost_accountant(args)
+    if costs is not None:
+        costs.save()
+        print(f"Cost statistics have been written to {args.costs}")
+
 
 def query_contract_status_ex(api: LedgerApi, args) -> Tuple[ContractStatus, Address]:
+    from fetchai.ledger.crypto import Address
+    from fet_tools.status import query_contract_status as query_status
+
     addr = Address(args.contract_address)
-    success, contract_status = api.contracts.query(addr, "status")
-    ms = None
-    if success and contract_status and contract_status["status"] == "success":
-        ms = ContractStatus.from_dict(contract_status["result"])
+    ms = query_status(api, addr)
+
+    index = open_index(args)
+    if index is not None and ms is not None:
+        index.update_from_status(addr, ms)
+
     return ms, addr
 
 
@@ -119,7 +387,65 @@ def query_contract_status(api: LedgerApi, args):
     ms, addr = query_contract_status_ex(api, args)
     print(f'Contract status of the contract at the {{{addr}}} address: {ms!s}')
 
+def query_contract_status_many(api: LedgerApi, args):
+    from fet_tools.status import QueryStats, StatusResultWriter, query_status_many, read_addresses
+
+    infile = sys.stdin if args.addresses == "-" else open(args.addresses, 'r')
+    outfile = sys.stdout if args.output == "-" else open(args.output, 'w', newline='')
+    stats = QueryStats()
+    try:
+        writer = StatusResultWriter(outfile, args.format)
+        for result in query_status_many(api, read_addresses(infile), args.parallelism, stats):
+            writer.write(result)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    print(f"Query statistics: {json.dumps(stats.to_dict())}", file=sys.stderr)
+
+def export_statuses(api: LedgerApi, args):
+    from itertools import islice
+    from fet_tools.status import QueryStats, query_status_many, read_addresses
+    from fet_tools.export import ExportWriter
+
+    infile = None
+    if args.addresses:
+        infile = sys.stdin if args.addresses == "-" else open(args.addresses, 'r')
+    addresses = read_addresses(infile) if infile is not None else iter(())
+    if args.from_index:
+        from itertools import chain
+        addresses = chain(addresses, require_index(args).open_addresses())
+
+    stats = QueryStats()
+    try:
+        with ExportWriter(args.output) as writer:
+            while True:
+                chunk = list(islice(addresses, args.chunk_size))
+                if not chunk:
+                    break
+                # Status of each contract is queried at or after this block
+                block = api.tokens.current_block_number()
+                writer.write((r.address, r.status, block)
+                             for r in query_status_many(api, chunk, args.parallelism, stats))
+                print(f"Exported {writer.rows} contract(s)", file=sys.stderr)
+    finally:
+        if infile is not None and infile is not sys.stdin:
+            infile.close()
+
+    print(f"Query statistics: {json.dumps(stats.to_dict())}", file=sys.stderr)
+
+
+def export_summary(api: LedgerApi, args):
+    from fet_tools.export import locked_by_escrow
+
+    print(json.dumps(locked_by_escrow(args.file), indent=4))
+
+
 def query_deposited_balance(api: LedgerApi, args):
+    from fetchai.ledger.crypto import Address
+
     addr = Address(args.contract_address)
     success, response = api.contracts.query(addr, "deposited_balance")
     ms = None
@@ -127,133 +453,377 @@ def query_deposited_balance(api: LedgerApi, args):
         balance = response["result"]
     print(f'Deposited balance of the contract: {balance} [Canonical FET]')
 
-def action_deposit(api: LedgerApi, args):
-    fetch_contract_addr = Address(args.contract_address)
-    source_fetch_addr = Address(args.from_address)
-    signatories = collect_private_keys_from_user_input()
-
-    tx = ContractTxFactory.action(source_fetch_addr,
-                                  fetch_contract_addr,
-                                  "deposit",
-                                  args.fee,
-                                  signatories)
+def report_cost(args, item: CostItem, status, snapshot: BalanceSnapshot, cost_message: str = "Cost of Tx: "):
+    """
+    Prints cost of the executed Tx and records it to cost statistics: fee reported by the node in Tx status,
+    or balance spent by the sender since the `snapshot` (minus transferred amount) if the node does not report it
+    """
+    from fet_tools.costs import CostAccountant
 
-    api.set_validity_period(tx)
-    tx.add_transfer(fetch_contract_addr, args.amount)
-    for signatory in signatories:
-        tx.sign(signatory)
+    accountant = get_cost_accountant(args)
+    cost = (accountant or CostAccountant()).account([item], {item.digest: status}, snapshot).get(item.digest)
+    if cost is None:
+        print(cost_message + "unknown (fee is not reported by the node, balance of the sender has not changed yet)")
+        return
 
-    with track_cost(api.tokens, source_fetch_addr, "Cost of Tx: "):
-        api.sync(api.submit_signed_tx(tx))
+    print(cost_message + "{} TOK".format(cost))
+    if accountant is not None:
+        accountant.save()
 
-    print(f'Deposit has been successful')
 
+def set_validity(api: LedgerApi, args, tx):
+    """
+    Sets validity period of the Tx: explicit window in offline mode (no ledger access), otherwise from the ledger
+    """
+    if not args.offline:
+        api.set_validity_period(tx)
+        return
 
-def action_accept(api: LedgerApi, args):
-    fetch_contract_addr = Address(args.contract_address)
-    source_fetch_addr = Address(args.from_address)
-    signatories = collect_private_keys_from_user_input()
+    from fet_tools.offline import set_validity_window
 
-    tx = ContractTxFactory.action(source_fetch_addr,
-                                  fetch_contract_addr,
-                                  "accept",
-                                  args.fee,
-                                  signatories)
+    if args.valid_until is None:
+        print("Offline mode requires explicit validity window, use --valid-until (and --valid-from) option.")
+        exit(-1)
+    set_validity_window(tx, args.valid_from, args.valid_until)
+
+
+def write_offline_tx(args, action: str, tx):
+    from fet_tools.offline import BatchWriter
 
-    api.set_validity_period(tx)
-    for signatory in signatories:
-        tx.sign(signatory)
+    with BatchWriter(args.offline) as writer:
+        writer.write(action, tx)
+    print(f"Signed Tx has been appended to {args.offline} batch file (valid for blocks [{tx.valid_from}, {tx.valid_until}))")
 
-    with track_cost(api.tokens, source_fetch_addr, "Cost of Tx: "):
-        api.sync(api.submit_signed_tx(tx))
 
-    print(f'Accept action has been successful')
+def submit_tx(api: LedgerApi, args, tx, action: str, cost_message: str = "Cost of Tx: ") -> bool:
+    """
+    Submits signed Tx and waits for its execution, unless submit-only mode (`--no-sync`) has been requested,
+    in offline mode (`--offline`) the Tx is appended to batch file instead
+
+    :return: True if the Tx has been executed, False if it has only been submitted or written to batch file
+    """
+    if args.offline:
+        write_offline_tx(args, action, tx)
+        return False
+
+    if args.no_sync:
+        print(f"Tx has been submitted, digest: {api.submit_signed_tx(tx)}")
+        return False
+
+    from fet_tools.costs import CostItem, BalanceSnapshot
+
+    snapshot = BalanceSnapshot(api, [tx.from_address])
+    digest = api.submit_signed_tx(tx)
+    statuses = api.sync(digest)
+    report_cost(args, CostItem(action, str(tx.from_address), digest, sum(tx.transfers.values())),
+                statuses[0] if statuses else None, snapshot, cost_message)
+    return True
+
+
+def submit_tx_batch(api: LedgerApi, args):
+    from fet_tools.offline import read_batch, submit_batch, summarize
+
+    with open(args.report, 'a') as report:
+        results = submit_batch(api, read_batch(args.batch), pipeline=args.pipeline, sync=args.sync,
+                               sync_timeout=args.timeout, report=report)
+
+    print(f"Processed {len(results)} Tx(s): {json.dumps(summarize(results))}")
+    print(f"Digest report has been appended to {args.report}")
+
+
+def track_txs(api: LedgerApi, args):
+    from fet_tools.status import read_addresses
+    from fet_tools.confirm import ConfirmationTracker
+
+    infile = sys.stdin if args.digests == "-" else open(args.digests, 'r')
+    outfile = sys.stdout if args.output == "-" else open(args.output, 'a')
+    try:
+        tracker = ConfirmationTracker(api, timeout=args.timeout, max_interval=args.max_interval,
+                                      updates_stream=outfile)
+        for digest in read_addresses(infile):
+            tracker.add(digest)
+
+        confirmations = tracker.wait_all()
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    succeeded = sum(1 for c in confirmations if c.successful)
+    print(f"Tracked {len(confirmations)} Tx(s): {succeeded} successful, {len(confirmations) - succeeded} failed/timed out",
+          file=sys.stderr)
+
+
+def watch_contracts(api: LedgerApi, args):
+    from fet_tools.status import read_addresses
+    from fet_tools.watch import EscrowWatcher
+
+    addresses = []
+    if args.addresses:
+        with (sys.stdin if args.addresses == "-" else open(args.addresses, 'r')) as infile:
+            addresses.extend(read_addresses(infile))
+    if args.from_index:
+        addresses.extend(require_index(args).open_addresses())
+
+    watcher = EscrowWatcher(api, addresses, checkpoint=args.checkpoint, min_interval=args.min_interval,
+                            max_interval=args.max_interval, parallelism=args.parallelism)
+    print(f"Watching {watcher.active} active contract(s)", file=sys.stderr)
+
+    index = open_index(args)
+    outfile = sys.stdout if args.output == "-" else open(args.output, 'a')
+    count = 0
+    try:
+        for event in watcher.events(until_settled=args.until_settled):
+            outfile.write(json.dumps(event.to_dict()) + "\n")
+            outfile.flush()
+            count += 1
+            if index is not None and event.event in ("paid", "refunded"):
+                index.mark_settled(event.contract_address, event.block)
+    except KeyboardInterrupt:
+        print("Exiting ...", file=sys.stderr)
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
 
+    print(f"Emitted {count} event(s), {watcher.active} contract(s) still active", file=sys.stderr)
+
+
+def run_scheduler(api: LedgerApi, args):
+    from fet_tools.status import read_addresses
+    from fet_tools.actions import ActionEngine
+    from fet_tools.scheduler import ExpiryScheduler, BlockClock, FakeBlockClock
+
+    if args.fast_forward and not args.simulate:
+        print("--fast-forward requires simulated ledger (--simulate).")
+        exit(-1)
 
-def action_cancel(api: LedgerApi, args):
+    addresses = []
+    if args.addresses:
+        with (sys.stdin if args.addresses == "-" else open(args.addresses, 'r')) as infile:
+            addresses.extend(read_addresses(infile))
+    if args.from_index:
+        addresses.extend(require_index(args).open_addresses())
+
+    fee_model = get_fee_model(args)
+    engine = ActionEngine(api, get_signatory_selector(api, args).select, fee=args.fee, pipeline=args.pipeline,
+                          sync=not args.no_sync, sync_timeout=args.timeout, costs=fee_model.costs,
+                          fee_model=fee_model)
+    clock = FakeBlockClock(ledger=api) if args.fast_forward else BlockClock(api, block_time=args.block_time)
+    scheduler = ExpiryScheduler(api, engine, clock, from_address=args.from_address, sender_role=args.sender_role,
+                                batch_size=args.batch_size, refresh_blocks=args.refresh_blocks,
+                                retry_blocks=args.retry_blocks, parallelism=args.parallelism, index=open_index(args))
+    scheduler.add_many(addresses)
+    print(f"Tracking {len(scheduler)} contract(s)", file=sys.stderr)
+
+    report = open(args.report, 'a') if args.report else None
+    try:
+        scheduler.run(report, until_empty=args.until_empty, until_block=args.until_block)
+    except KeyboardInterrupt:
+        print("Exiting ...", file=sys.stderr)
+    finally:
+        if report is not None:
+            report.close()
+        if args.costs:
+            fee_model.costs.save()
+
+    print(f"Scheduler stopped at block {clock.current()}, {len(scheduler)} contract(s) still tracked: "
+          f"{json.dumps(scheduler.stats)}", file=sys.stderr)
+
+
+def run_action(api: LedgerApi, args):
+    """
+    Executes single contract action (`args.contract_action`) of the `action` sub-command: build -> validity ->
+    sign -> submit (-> sync)
+    """
+    from fetchai.ledger.crypto import Address
+    from fet_tools.tools import create_action_tx, sign_txs
+    from fet_tools.deeds import tx_operations
+
+    action = args.contract_action
     fetch_contract_addr = Address(args.contract_address)
     source_fetch_addr = Address(args.from_address)
-    signatories = collect_private_keys_from_user_input()
-
-    tx = ContractTxFactory.action(source_fetch_addr,
-                                  fetch_contract_addr,
-                                  "cancel",
-                                  args.fee,
-                                  signatories)
-
-    api.set_validity_period(tx)
-    for signatory in signatories:
-        tx.sign(signatory)
+    transfers = [(fetch_contract_addr, args.amount)] if action == "deposit" else None
+    checker = get_preflight(api, args)
+    if checker is not None:
+        reason = checker.check(fetch_contract_addr, action, source_fetch_addr, transfers,
+                               checker.statuses.get(fetch_contract_addr))
+        if reason is not None:
+            print(f"{ACTION_MESSAGES[action]} would fail: {reason}\nUse --no-preflight to submit it anyway.")
+            exit(-1)
+    signatories = select_signatories(api, args, source_fetch_addr, tx_operations(action, bool(transfers)))
 
-    with track_cost(api.tokens, source_fetch_addr, "Cost of Tx: "):
-        api.sync(api.submit_signed_tx(tx))
+    tx = create_action_tx(fetch_contract_addr, source_fetch_addr, action, select_fee(args, action), signatories,
+                          transfers)
+    set_validity(api, args, tx)
+    sign_txs([(tx, signatories)], args.sign_processes)
 
-    print(f'Cancel action has been successful')
+    if submit_tx(api, args, tx, action):
+        print(f'{ACTION_MESSAGES[action]} has been successful')
 
 
-def action_kill(api: LedgerApi, args):
-    fetch_contract_addr = Address(args.contract_address)
-    source_fetch_addr = Address(args.from_address)
-    signatories = collect_private_keys_from_user_input()
+def run_action_batch(api: LedgerApi, args):
+    from fet_tools.actions import ActionEngine, read_action_items, summarize, summarize_rejected
 
-    tx = ContractTxFactory.action(source_fetch_addr,
-                                  fetch_contract_addr,
-                                  "kill",
-                                  args.fee,
-                                  signatories)
+    items = read_action_items(args.items, args.action, args.from_address)
+    senders = sorted(set(item.from_address for item in items))
+    print(f"items: {args.items} ({len(items)} action(s), {len(senders)} distinct sender(s))")
+    print(f"report file: {args.report}")
 
-    api.set_validity_period(tx)
-    for signatory in signatories:
-        tx.sign(signatory)
+    if not args.yes:
+        resp = input("\n\nAre action data above correct? [y/N]: ").lower()
 
-    with track_cost(api.tokens, source_fetch_addr, "Cost of Tx: "):
-        api.sync(api.submit_signed_tx(tx))
+        if resp != "y":
+            print("Exiting ...")
+            exit(-1)
 
-    print(f'Kill action has been successful')
+    costs = get_cost_accountant(args)
+    fee_model = get_fee_model(args)
+    # Sender without sufficient keys fails its items only (`select` raises), rather than the whole run
+    get_deed_cache(api, args).get_many(senders)
+    engine = ActionEngine(api, get_signatory_selector(api, args).select, fee=args.fee,
+                          pipeline=args.pipeline, chunk_size=args.chunk_size, sign_processes=args.sign_processes,
+                          sync=not args.no_sync, sync_timeout=args.timeout, costs=fee_model.costs,
+                          fee_model=fee_model, preflight=get_preflight(api, args))
+    with open(args.report, 'a') as report:
+        results = engine.run(items, report)
+
+    print(f"Processed {len(results)} action(s): {json.dumps(summarize(results))}")
+    rejected = summarize_rejected(results)
+    if rejected:
+        print(f"Rejected by pre-flight check (not submitted): {json.dumps(rejected)}")
+    print(f"Per-action report has been appended to {args.report}")
+    if costs is not None:
+        costs.save()
+        print(f"Cost statistics have been written to {args.costs}")
+
+
+def query_deeds_many(api: LedgerApi, args):
+    from fet_tools.status import read_addresses
+    from fet_tools.deeds import query_deeds
+
+    infile = sys.stdin if args.addresses == "-" else open(args.addresses, 'r')
+    outfile = sys.stdout if args.output == "-" else open(args.output, 'w')
+    count = errors = 0
+    try:
+        for result in query_deeds(api, read_addresses(infile), args.parallelism):
+            outfile.write(json.dumps(result.to_dict()) + "\n")
+            count += 1
+            errors += 1 if result.error else 0
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    print(f"Queried deeds of {count} address(es), {errors} failed", file=sys.stderr)
+
+
+def deploy_deeds_batch_local(api: LedgerApi, args):
+    from fet_tools.deeds import read_deed_items, deploy_deeds_batch
+
+    with open(args.manifest, 'r') as f:
+        items = read_deed_items(f)
+    print(f"manifest: {args.manifest} ({len(items)} deed(s))")
+    print(f"report file: {args.report}")
+
+    if not args.yes:
+        resp = input("\n\nAre deed data above correct? [y/N]: ").lower()
 
+        if resp != "y":
+            print("Exiting ...")
+            exit(-1)
 
-def action_withdrawExcessBalance(api: LedgerApi, args):
-    fetch_contract_addr = Address(args.contract_address)
-    source_fetch_addr = Address(args.from_address)
-    signatories = collect_private_keys_from_user_input()
+    get_deed_cache(api, args).get_many(item.address for item in items)
+    results = deploy_deeds_batch(api, items, get_signatory_selector(api, args).select, fee=args.fee,
+                                 pipeline=args.pipeline, sign_processes=args.sign_processes, sync=not args.no_sync,
+                                 sync_timeout=args.timeout)
+    with open(args.report, 'a') as report:
+        for result in results:
+            report.write(json.dumps(result.to_dict()) + "\n")
+
+    summary = {}
+    for result in results:
+        summary[result.status] = summary.get(result.status, 0) + 1
+    print(f"Processed {len(results)} deed(s): {json.dumps(summary)}")
+    print(f"Per-deed report has been appended to {args.report}")
+
+
+def run_daemon(api: LedgerApi, args):
+    import signal
+    import threading
+    from fet_tools.tools import collect_private_keys_from_user_input, get_contract_template
+    from fet_tools.daemon import EscrowService, EscrowDaemon
+
+    contract_text = get_contract_template(args.contract_file).source
+
+    provider = get_key_provider(args)
+    if provider is None:
+        print("Provide private keys of all signatories the daemon will sign Txs with.")
+        signatories = collect_private_keys_from_user_input()
+    else:
+        signatories = provider.entities()
+
+    costs = get_cost_accountant(args)
+    service = EscrowService(api, contract_text, signatories, index=open_index(args), costs=costs,
+                            fee_model=get_fee_model(args), preflight=not args.no_preflight)
+    server = EscrowDaemon(service, args.listen, args.listen_port, max_concurrency=args.max_concurrency,
+                          max_queue=args.max_queue)
+    print(f"Escrow daemon listening on http://{args.listen}:{args.listen_port}")
+
+    # SIGTERM stops the server the same way as Ctrl+C, so costs, simulator state & metrics are saved on the way out
+    # (`shutdown` waits for `serve_forever` to return, so it must not be called from the serving thread)
+    def terminate(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    previous_handler = signal.signal(signal.SIGTERM, terminate)
+    try:
+        server.serve_forever()
+        print("Exiting ...")
+    except KeyboardInterrupt:
+        print("Exiting ...")
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        server.server_close()
+        if costs is not None:
+            costs.save()
 
-    tx = ContractTxFactory.action(source_fetch_addr,
-                                  fetch_contract_addr,
-                                  "withdrawExcessBalance",
-                                  args.fee,
-                                  signatories)
 
-    api.set_validity_period(tx)
-    for signatory in signatories:
-        tx.sign(signatory)
+def print_costs(api: LedgerApi, args):
+    costs = get_cost_accountant(args)
+    if costs is None:
+        print("Cost statistics file is not configured, use --costs option or ESCROW_COSTS env. variable.")
+        exit(-1)
+    result = costs.to_dict()
+    result["fees"] = get_fee_model(args).to_dict()
+    print(json.dumps(result, indent=4))
 
-    with track_cost(api.tokens, source_fetch_addr, "Cost of Tx: "):
-        api.sync(api.submit_signed_tx(tx))
 
-    print(f'Kill action has been successful')
+def print_endpoints(api: LedgerApi, args):
+    if not args.endpoints or args.simulate:
+        print("Ledger endpoints are not configured, use --endpoints option or ESCROW_ENDPOINTS env. variable.")
+        exit(-1)
+    print(json.dumps(api.check_health(), indent=4))
 
 
-def action_withdrawExcessBalance(api: LedgerApi, args):
-    ms, fetch_contract_addr = query_contract_status_ex(api, args)
-    if ms is None:
-        raise RuntimeError("Unable to fetch ContractStatus from the contract")
+def require_index(args) -> ContractIndex:
+    index = open_index(args)
+    if index is None:
+        print("Contract index is not configured, use --index option or ESCROW_INDEX env. variable.")
+        exit(-1)
+    return index
 
-    signatories = collect_private_keys_from_user_input()
 
-    tx = ContractTxFactory.action(ms.authAddr,
-                                  fetch_contract_addr,
-                                  "refund",
-                                  args.fee,
-                                  signatories,
-                                  args.swap_id)
-    api.set_validity_period(tx)
-    for signatory in signatories:
-        tx.sign(signatory)
+def index_by_nonce(api: LedgerApi, args):
+    entry = require_index(args).by_owner_nonce(args.owner, args.nonce)
+    print(f"Index entry: {entry}")
 
-    with track_cost(api.tokens, ms.authAddr, "Cost of refund action Tx: "):
-        api.sync(api.submit_signed_tx(tx))
 
-    print(f'Refund has been successful')
+def index_by_party(api: LedgerApi, args):
+    entries = require_index(args).by_party(args.address, args.roles or PARTY_ROLES, open_only=args.open_only)
+    for entry in entries:
+        print(json.dumps(entry.__dict__))
+    print(f"Found {len(entries)} contract(s)", file=sys.stderr)
 
 
 def parse_arguments():
@@ -263,6 +833,43 @@ def parse_arguments():
     parser.add_argument("--hostname", type=str, default="127.0.0.1", help="Hostname of the node")
     parser.add_argument("--port", type=int, default="8000", help="Port of the node")
     parser.add_argument("--network", type=str, default=None, help="Fetch network to deploy contract to")
+    parser.add_argument("--endpoints", type=str, default=os.environ.get("ESCROW_ENDPOINTS"), metavar="HOST:PORT,...",
+                        help="Comma separated ledger nodes to use instead of --hostname/--port: queries are spread across healthy nodes by latency, \
+                              submits fail over to another node when one is down or times out. Defaults to ESCROW_ENDPOINTS env. variable.")
+    parser.add_argument("--request-timeout", type=float, default=30, help="Timeout in [s] of single request to a node of --endpoints")
+    parser.add_argument("--health-interval", type=float, default=10, help="Interval in [s] between health checks of --endpoints nodes")
+    parser.add_argument("--index", type=str, default=os.environ.get("ESCROW_INDEX"),
+                        help="SQLite file of local contract index (owner+nonce -> contract address -> parties), filled at deploy time and from status queries. \
+                              Defaults to ESCROW_INDEX env. variable, index is disabled if not set.")
+    parser.add_argument("--costs", type=str, default=os.environ.get("ESCROW_COSTS"),
+                        help="JSON file to accumulate per-action cost statistics (count, sum, p50/p95 of fees) in. \
+                              Defaults to ESCROW_COSTS env. variable, cost accounting is disabled if not set.")
+    parser.add_argument("--fee-margin", type=float, default=0.2,
+                        help="Safety margin of fees chosen automatically (commands run without --fee): fee of an action is p99 of its charges \
+                              observed so far (see --costs) increased by the margin, 0.2 = +20%%. Defaults are used until enough charges are observed.")
+    parser.add_argument("--no-preflight", action='store_true',
+                        help="Do not check Txs against contract asserts (transfers, sender, settled contract) locally before signing, \
+                              doomed Txs are then submitted and fail on the ledger")
+    parser.add_argument("--keystore", type=str, default=None,
+                        help="Encrypted keystore file to take signing keys from (unattended operation). \
+                              Password is taken from ESCROW_KEYSTORE_PASSWORD env. variable or asked once.")
+    parser.add_argument("--keys-env", type=str, default=None,
+                        help="Name of env. variable with private keys (hex or base64, comma or whitespace separated)")
+    parser.add_argument("--keys-file", type=str, default=None, help="File with private keys (hex or base64), one per line")
+    parser.add_argument("--keys-fd", type=int, default=None, help="File descriptor to read private keys from (hex or base64), one per line")
+    parser.add_argument("--signer-agent", type=str, default=None, help="Unix socket of signer agent to sign with")
+    parser.add_argument("--simulate", type=str, default=os.environ.get("ESCROW_SIMULATE"), metavar="STATE_FILE",
+                        help="Run against in-process escrow contract simulator instead of ledger node, simulator state is loaded from & saved to STATE_FILE \
+                              (see `python -m fet_tools.simulator`). Defaults to ESCROW_SIMULATE env. variable.")
+    parser.add_argument("--metrics", type=str, default=os.environ.get("ESCROW_METRICS"), metavar="FILE",
+                        help="JSON file to dump metrics of ledger operations to (latency histograms, error & retry counts per operation), \
+                              written every --metrics-interval seconds and on exit. Defaults to ESCROW_METRICS env. variable.")
+    parser.add_argument("--metrics-interval", type=float, default=10, help="Interval in [s] between metrics dumps")
+    parser.add_argument("--trace", type=str, default=None, metavar="FILE",
+                        help="JSONL file to append trace span of each ledger operation to (operation, start, duration, contract address, tx digest)")
+    parser.add_argument("--deed-ttl", type=float, default=300, help="Time-to-live in [s] of cached deeds")
+    parser.add_argument("--profile-startup", action='store_true',
+                        help="Print breakdown of startup time (phases, import time per package) to stderr on exit")
 
     subparsers = parser.add_subparsers(help='sub-command help')
 
@@ -271,13 +878,37 @@ def parse_arguments():
     parser_deploy.add_argument("contract_file", type=str, metavar="contract_file", help="Filename of the etch contract code")
     parser_deploy.add_argument("contract_owner_address", type=str, help="Contract owner address")
     parser_deploy.add_argument("contract_deployment_nonce", type=str, help="Nonce of the contract deployment")
-    parser_deploy.add_argument('--fee', type=int, default=600000,
-                           help="Fee for Tx execution in [Canonical FET]")
+    parser_deploy.add_argument('--fee', type=int, default=None,
+                           help="Fee for Tx execution in [Canonical FET] (default: chosen per action from observed charges, see --fee-margin)")
     parser_deploy.add_argument("--transfers", type=str, action="extend", nargs="+",
                         help="List of exactly 2 transfers - the first transfer' dest. address represents SELLER, the second transfer' dest. address represents BUYER. Each transfer in form of coma separated vector DEST_FET_ADDR,AMOUNT \
                               where AMOUNT is specified in Canonical FET unit (**minimum** amount value is 1 [Canonical FET] (due to limitation in python fetch ledger api, not ledger itself)")
+    parser_deploy.add_argument('--no-sync', action='store_true',
+                               help="Submit-only mode: print digest of the submitted Tx without waiting for its execution")
+    parser_deploy.add_argument('--offline', type=str, default=None, metavar="BATCH_FILE",
+                     help="Offline mode: sign the Tx with explicit validity window and append it to binary batch file (see submit-batch) instead of submitting it, ledger is not accessed")
+    parser_deploy.add_argument('--valid-from', type=int, default=0, help="Offline mode: first block the Tx is valid in")
+    parser_deploy.add_argument('--valid-until', type=int, default=None, help="Offline mode: block the Tx is valid until (exclusive)")
     parser_deploy.set_defaults(func=deploy_contract_local)
 
+    parser_deploy_batch = subparsers.add_parser('deploy-batch', help='Deploys contracts for all rows of the manifest file')
+    parser_deploy_batch.add_argument("contract_file", type=str, help="Filename of the etch contract code")
+    parser_deploy_batch.add_argument("manifest", type=str,
+                                     help="CSV (with header) or JSONL manifest file with owner, nonce, seller, buyer, seller_amount, buyer_amount \
+                                           fields per row (amounts in [Canonical FET], optional, default 1)")
+    parser_deploy_batch.add_argument("results", type=str,
+                                     help="JSONL file to append per-row results to (contract address, tx digest, status). \
+                                           Rows already deployed according to this file are skipped => re-run resumes the batch.")
+    parser_deploy_batch.add_argument('--fee', type=int, default=None,
+                                     help="Fee for each deployment Tx execution in [Canonical FET] (default: chosen per action from observed charges, see --fee-margin)")
+    parser_deploy_batch.add_argument('--timeout', type=int, default=120,
+                                     help="Max. time in [s] to wait for the whole batch of Txs to be executed")
+    parser_deploy_batch.add_argument('--yes', action='store_true', help="Do not ask for confirmation")
+    parser_deploy_batch.add_argument('--sign-processes', type=int, default=0,
+                                     help="Number of worker processes to sign Txs in, 0 = serial signing")
+    parser_deploy_batch.add_argument('--pipeline', type=int, default=16, help="Max. number of submissions in flight")
+    parser_deploy_batch.set_defaults(func=deploy_contracts_batch_local)
+
     parser_query = subparsers.add_parser('query', help='Query contract states')
     parser_query.add_argument('contract_address', type=str, help="Address where the contract is deployed")
     query_subparsers = parser_query.add_subparsers(help='sub-command help')
@@ -288,54 +919,250 @@ def parse_arguments():
     parser_query_contract_status = query_subparsers.add_parser('status', help='Query contract status structure')
     parser_query_contract_status.set_defaults(func=query_contract_status)
 
+    parser_query_many = subparsers.add_parser('query-many', help='Query states of many contracts concurrently')
+    query_many_subparsers = parser_query_many.add_subparsers(help='sub-command help')
+
+    parser_query_status_many = query_many_subparsers.add_parser('status', help='Query contract status structure of many contracts, results are streamed as they finish')
+    parser_query_status_many.add_argument('addresses', type=str, help="File with contract addresses, one per line ('-' for stdin)")
+    parser_query_status_many.add_argument('output', type=str, help="Output file ('-' for stdout)")
+    parser_query_status_many.add_argument('--format', type=str, choices=("jsonl", "csv"), default="jsonl", help="Output format")
+    parser_query_status_many.add_argument('--parallelism', type=int, default=16, help="Max. number of concurrent queries")
+    parser_query_status_many.set_defaults(func=query_contract_status_many)
+
+    parser_export = subparsers.add_parser('export', help='Appends statuses of many contracts to columnar, memory-mappable binary export file (see fet_tools.export)')
+    parser_export.add_argument('output', type=str, help="Export file (created if it does not exist, appended to otherwise)")
+    parser_export.add_argument('addresses', type=str, nargs="?", default=None, help="File with contract addresses, one per line ('-' for stdin)")
+    parser_export.add_argument('--from-index', action='store_true', help="Export all not yet settled contracts from the contract index (requires --index)")
+    parser_export.add_argument('--chunk-size', type=int, default=10000, help="Number of contracts queried & appended to the file at once")
+    parser_export.add_argument('--parallelism', type=int, default=16, help="Max. number of concurrent queries")
+    parser_export.set_defaults(func=export_statuses)
+
+    parser_export_summary = subparsers.add_parser('export-summary', help='Prints deposited balance locked in not yet settled contracts per escrow from export file')
+    parser_export_summary.add_argument('file', type=str, help="Export file")
+    parser_export_summary.set_defaults(func=export_summary)
+
     parser_action = subparsers.add_parser('action', help='Executes contract actions')
     parser_action.add_argument('contract_address', type=str, help="Address where the contract is deployed")
     parser_action.add_argument('from_address', type=str,
                                       help="Fetch native address of the party which is interacting with the contract (escrow, buyer, seller, etc. ...)")
-    parser_action.add_argument('--fee', type=int, default=10000,
-                                       help="Fee for Tx execution in [Canonical FET]")
+    parser_action.add_argument('--fee', type=int, default=None,
+                                       help="Fee for Tx execution in [Canonical FET] (default: chosen per action from observed charges, see --fee-margin)")
+    parser_action.add_argument('--no-sync', action='store_true',
+                               help="Submit-only mode: print digest of the submitted Tx without waiting for its execution")
+    parser_action.add_argument('--sign-processes', type=int, default=0,
+                               help="Number of worker processes to sign Tx in (pays off for many signatories only), 0 = serial signing")
+    parser_action.add_argument('--offline', type=str, default=None, metavar="BATCH_FILE",
+                     help="Offline mode: sign the Tx with explicit validity window and append it to binary batch file (see submit-batch) instead of submitting it, ledger is not accessed")
+    parser_action.add_argument('--valid-from', type=int, default=0, help="Offline mode: first block the Tx is valid in")
+    parser_action.add_argument('--valid-until', type=int, default=None, help="Offline mode: block the Tx is valid until (exclusive)")
     action_subparsers = parser_action.add_subparsers(help='sub-command help')
 
     parser_action_deposit = action_subparsers.add_parser('deposit', help='Deposits funds to escrow contract')
     parser_action_deposit.add_argument('amount', type=int,
                                        help="Amount of FET tokens to deposit in [Canonical FET]")
-    parser_action_deposit.set_defaults(func=action_deposit)
+    parser_action_deposit.set_defaults(func=run_action, contract_action="deposit")
 
 
     parser_action_accept = action_subparsers.add_parser('accept', help='Accepts the terms in escrow')
-    parser_action_accept.set_defaults(func=action_accept)
+    parser_action_accept.set_defaults(func=run_action, contract_action="accept")
 
 
     parser_action_cancel = action_subparsers.add_parser('cancel', help='Cancels participation in escrow contract, and returns locked balance funds to buyer IF both sides cancelled')
-    parser_action_cancel.set_defaults(func=action_cancel)
+    parser_action_cancel.set_defaults(func=run_action, contract_action="cancel")
 
 
     parser_action_kill = action_subparsers.add_parser('kill', help='Kills escrow contract and refunds locked balnce funds to buyer')
-    parser_action_kill.set_defaults(func=action_cancel)
+    parser_action_kill.set_defaults(func=run_action, contract_action="kill")
 
 
     parser_action_withdraw_excess = action_subparsers.add_parser('withdraw-excess', help='Withdraws excess balance(= everything **above** locked balance) from contract and sends it to owner/escrow address.')
-    parser_action_withdraw_excess.set_defaults(func=action_withdrawExcessBalance)
+    parser_action_withdraw_excess.set_defaults(func=run_action, contract_action="withdrawExcessBalance")
+
+    parser_action_batch = subparsers.add_parser('action-batch', help='Executes many contract actions in one go: Txs are signed and submitted in chunks with pipelining, appends JSONL report')
+    parser_action_batch.add_argument('items', type=str,
+                                     help="CSV (with header) or JSONL file with contract_address, action, from_address, amount (deposit), fee fields per row, \
+                                           or plain list of contract addresses (one per line) with --action and --from-address")
+    parser_action_batch.add_argument('report', type=str, help="JSONL file to append per-action report (index, contract address, digest, status, fee) to")
+    parser_action_batch.add_argument('--action', type=str, default=None, help="Action of rows without one (e.g. withdraw-excess, kill)")
+    parser_action_batch.add_argument('--from-address', type=str, default=None, help="Sender of rows without one")
+    parser_action_batch.add_argument('--fee', type=int, default=None, help="Fee for each Tx execution in [Canonical FET] (rows may override it) (default: chosen per action from observed charges, see --fee-margin)")
+    parser_action_batch.add_argument('--pipeline', type=int, default=16, help="Max. number of submissions in flight")
+    parser_action_batch.add_argument('--chunk-size', type=int, default=500, help="Number of Txs signed & submitted per validity period lookup")
+    parser_action_batch.add_argument('--sign-processes', type=int, default=0, help="Number of worker processes to sign Txs in, 0 = serial signing")
+    parser_action_batch.add_argument('--no-sync', action='store_true', help="Submit-only mode: do not wait for execution of the Txs")
+    parser_action_batch.add_argument('--timeout', type=int, default=300, help="Max. time in [s] to wait for execution of all Txs")
+    parser_action_batch.add_argument('--yes', action='store_true', help="Do not ask for confirmation")
+    parser_action_batch.set_defaults(func=run_action_batch)
+
+    parser_submit_batch = subparsers.add_parser('submit-batch', help='Submits pre-signed Txs from binary batch file (created in offline mode) with pipelining, appends JSONL digest report')
+    parser_submit_batch.add_argument('batch', type=str, help="Binary batch file with signed Txs")
+    parser_submit_batch.add_argument('report', type=str, help="JSONL file to append per-Tx report (index, action, digest, status) to")
+    parser_submit_batch.add_argument('--pipeline', type=int, default=16, help="Max. number of submissions in flight")
+    parser_submit_batch.add_argument('--sync', action='store_true', help="Wait for execution of submitted Txs and report their final status & fee")
+    parser_submit_batch.add_argument('--timeout', type=int, default=120, help="Max. time in [s] to wait for execution of all Txs (with --sync)")
+    parser_submit_batch.set_defaults(func=submit_tx_batch)
+
+    parser_track = subparsers.add_parser('track', help='Tracks execution of submitted Txs, writes JSONL status update for each Tx once it is executed/failed')
+    parser_track.add_argument('digests', type=str, help="File with Tx digests, one per line ('-' for stdin)")
+    parser_track.add_argument('--output', type=str, default="-", help="File to append JSONL status updates to ('-' for stdout)")
+    parser_track.add_argument('--timeout', type=float, default=300, help="Max. time in [s] to wait for each Tx")
+    parser_track.add_argument('--max-interval', type=float, default=10, help="Max. interval in [s] between polls of Tx status")
+    parser_track.set_defaults(func=track_txs)
+
+    parser_watch = subparsers.add_parser('watch', help='Follows active contracts and streams their state-transition events (deposited, buyer-ok, seller-ok, paid, refunded) as JSONL')
+    parser_watch.add_argument('addresses', type=str, nargs="?", default=None, help="File with contract addresses, one per line ('-' for stdin)")
+    parser_watch.add_argument('--from-index', action='store_true', help="Watch all not yet settled contracts from the contract index (requires --index)")
+    parser_watch.add_argument('--output', type=str, default="-", help="File to append JSONL events to ('-' for stdout)")
+    parser_watch.add_argument('--checkpoint', type=str, default=None, help="Checkpoint file, restarted watch resumes from the last observed states")
+    parser_watch.add_argument('--min-interval', type=float, default=10, help="Min. interval in [s] between polls of a contract")
+    parser_watch.add_argument('--max-interval', type=float, default=600, help="Max. interval in [s] between polls of a contract which does not change")
+    parser_watch.add_argument('--parallelism', type=int, default=16, help="Max. number of concurrent status queries")
+    parser_watch.add_argument('--until-settled', action='store_true', help="Exit once all watched contracts are settled")
+    parser_watch.set_defaults(func=watch_contracts)
+
+    parser_schedule = subparsers.add_parser('schedule', help='Tracks contracts and submits accept (release to buyer) as soon as their release timeout passes')
+    parser_schedule.add_argument('addresses', type=str, nargs="?", default=None, help="File with contract addresses, one per line ('-' for stdin)")
+    parser_schedule.add_argument('--from-index', action='store_true', help="Track all not yet settled contracts from the contract index (requires --index)")
+    parser_schedule.add_argument('--report', type=str, default=None, help="File to append JSONL report of submitted actions to")
+    parser_schedule.add_argument('--from-address', type=str, default=None, help="Sender of all accept Txs, otherwise the contract party given by --sender-role")
+    parser_schedule.add_argument('--sender-role', type=str, default="escrow", choices=("escrow", "buyer"), help="Contract party sending accept Txs")
+    parser_schedule.add_argument('--fee', type=int, default=None, help="Fee of accept Txs (default: chosen per action from observed charges, see --fee-margin)")
+    parser_schedule.add_argument('--batch-size', type=int, default=1000, help="Max. number of due contracts processed at once")
+    parser_schedule.add_argument('--refresh-blocks', type=int, default=360, help="Interval in blocks between status refreshes of contracts not waiting for release")
+    parser_schedule.add_argument('--retry-blocks', type=int, default=6, help="Blocks until contract is re-checked after its action or failed query")
+    parser_schedule.add_argument('--block-time', type=float, default=10, help="Expected block time in [s]")
+    parser_schedule.add_argument('--parallelism', type=int, default=16, help="Max. number of concurrent status queries")
+    parser_schedule.add_argument('--pipeline', type=int, default=16, help="Max. number of Tx submissions in flight")
+    parser_schedule.add_argument('--no-sync', action='store_true', help="Do not wait for execution of submitted Txs")
+    parser_schedule.add_argument('--timeout', type=int, default=120, help="Timeout in [s] of Tx execution sync")
+    parser_schedule.add_argument('--until-empty', action='store_true', help="Exit once no contract is tracked any more")
+    parser_schedule.add_argument('--until-block', type=int, default=None, help="Exit once the block has been processed")
+    parser_schedule.add_argument('--fast-forward', action='store_true', help="Jump simulated ledger (--simulate) right to the next due block instead of waiting")
+    parser_schedule.set_defaults(func=run_scheduler)
+
+    parser_index = subparsers.add_parser('index', help='Lookups in local contract index (requires --index)')
+    index_subparsers = parser_index.add_subparsers(help='sub-command help')
+
+    parser_index_nonce = index_subparsers.add_parser('by-nonce', help='Lookup contract by owner address & deployment nonce')
+    parser_index_nonce.add_argument('owner', type=str, help="Contract owner address")
+    parser_index_nonce.add_argument('nonce', type=str, help="Nonce of the contract deployment")
+    parser_index_nonce.set_defaults(func=index_by_nonce)
+
+    parser_index_party = index_subparsers.add_parser('by-party', help='Lookup contracts by party address, prints JSONL')
+    parser_index_party.add_argument('address', type=str, help="Address of seller, buyer or escrow")
+    parser_index_party.add_argument('--role', dest="roles", type=str, choices=PARTY_ROLES, action="append",
+                                    help="Role(s) of the address to look for, all roles by default")
+    parser_index_party.add_argument('--open-only', action='store_true', help="Only contracts which have not been settled yet")
+    parser_index_party.set_defaults(func=index_by_party)
+
+    parser_deed = subparsers.add_parser('deed', help='Bulk deed queries & deployments')
+    deed_subparsers = parser_deed.add_subparsers(help='sub-command help')
+
+    parser_deed_query = deed_subparsers.add_parser('query', help='Queries deeds of many addresses concurrently, writes JSONL')
+    parser_deed_query.add_argument('addresses', type=str, help="File with addresses, one per line ('-' for stdin)")
+    parser_deed_query.add_argument('output', type=str, help="Output file ('-' for stdout)")
+    parser_deed_query.add_argument('--parallelism', type=int, default=16, help="Max. number of concurrent queries")
+    parser_deed_query.set_defaults(func=query_deeds_many)
+
+    parser_deed_deploy = deed_subparsers.add_parser('deploy-batch', help='Deploys deeds of many accounts in one pipelined run')
+    parser_deed_deploy.add_argument('manifest', type=str,
+                                    help="JSONL file with `address` and either `deed` object (null removes the deed) or `signees` ({address: weight}) \
+                                          & `thresholds` ({amend|transfer|execute: threshold}) per line")
+    parser_deed_deploy.add_argument('report', type=str, help="JSONL file to append per-deed report (address, digest, status) to")
+    parser_deed_deploy.add_argument('--fee', type=int, default=10000, help="Fee for each deed Tx execution in [Canonical FET]")
+    parser_deed_deploy.add_argument('--pipeline', type=int, default=16, help="Max. number of submissions in flight")
+    parser_deed_deploy.add_argument('--sign-processes', type=int, default=0, help="Number of worker processes to sign Txs in, 0 = serial signing")
+    parser_deed_deploy.add_argument('--no-sync', action='store_true', help="Submit-only mode: do not wait for execution of the Txs")
+    parser_deed_deploy.add_argument('--timeout', type=int, default=120, help="Max. time in [s] to wait for execution of all Txs")
+    parser_deed_deploy.add_argument('--yes', action='store_true', help="Do not ask for confirmation")
+    parser_deed_deploy.set_defaults(func=deploy_deeds_batch_local)
+
+    parser_costs = subparsers.add_parser('costs', help='Prints accumulated per-action cost statistics as JSON (requires --costs)')
+    parser_costs.set_defaults(func=print_costs)
+
+    parser_endpoints = subparsers.add_parser('endpoints', help='Checks health of --endpoints nodes and prints per-node latency & error statistics as JSON')
+    parser_endpoints.set_defaults(func=print_endpoints)
+
+    parser_keystore = subparsers.add_parser('keystore', help='Creates encrypted keystore file from interactively entered keys')
+    parser_keystore.add_argument('file', type=str, help="Keystore file to write")
+    parser_keystore.set_defaults(func=create_keystore)
+
+    parser_signer_agent = subparsers.add_parser('signer-agent', help='Runs signer agent holding keys in memory and signing for local processes over unix socket')
+    parser_signer_agent.add_argument('socket', type=str, help="Unix socket path to listen on")
+    parser_signer_agent.set_defaults(func=run_signer_agent)
+
+    parser_daemon = subparsers.add_parser('daemon', help='Runs long-lived daemon exposing deploy, query & action commands over local HTTP/JSON API')
+    parser_daemon.add_argument("--contract-file", type=str, default="escrow.etch", help="Filename of the etch contract code used for deployments")
+    parser_daemon.add_argument("--listen", type=str, default="127.0.0.1", help="Address the daemon listens on")
+    parser_daemon.add_argument("--listen-port", type=int, default=8765, help="Port the daemon listens on")
+    parser_daemon.add_argument("--max-concurrency", type=int, default=8, help="Max. number of concurrently executed requests")
+    parser_daemon.add_argument("--max-queue", type=int, default=64, help="Max. number of requests waiting for execution, excess requests are rejected")
+    parser_daemon.set_defaults(func=run_daemon)
 
     return parser.parse_args(), parser
 
 
+def start_metrics(args):
+    """
+    Enables process-wide metrics of ledger operations if `--metrics` or `--trace` is used
+
+    :return: Dumper periodically writing metrics to the `--metrics` file and flushing trace spans (stop it to write
+             the final dump), None if metrics are disabled
+    """
+    if not (args.metrics or args.trace):
+        return None
+
+    from fet_tools.metrics import Metrics, MetricsDumper, enable_metrics
+
+    metrics = Metrics(trace=open(args.trace, 'a') if args.trace else None)
+    enable_metrics(metrics)
+    dumper = MetricsDumper(metrics, args.metrics, args.metrics_interval)
+    dumper.start()
+    return dumper
+
+
 def parse_transfers(args):
+    from fetchai.ledger.crypto import Address
+
     transfers = []
-    for tran in args.transfers:
+    for tran in args.transfers or []:
         address, amount_str = tuple(tran.split(","))
         transfers.append((Address(address), int(amount_str)))
     return transfers
 
 
 def main():
-    args, parser = parse_arguments()
-    print(f"Arguments = {args}")
-
-    api = connect_ledger(network=args.network, host=args.hostname, port=args.port)
-    print("=======================")
-    args.func(api, args)
-    print("=======================")
+    # Profiler has to be installed before arguments are parsed to see all lazy imports
+    profiler = StartupProfiler() if "--profile-startup" in sys.argv else None
+    if profiler is not None:
+        profiler.install()
+
+    try:
+        if profiler is not None:
+            with profiler.phase("parse arguments"):
+                args, parser = parse_arguments()
+        else:
+            args, parser = parse_arguments()
+        print(f"Arguments = {args}")
+
+        metrics_dumper = start_metrics(args)
+        api = LazyLedgerApi(args, profiler)
+        print("=======================")
+        try:
+            if profiler is not None:
+                with profiler.phase("command (incl. imports & connect)"):
+                    args.func(api, args)
+            else:
+                args.func(api, args)
+        finally:
+            api.close()
+            if metrics_dumper is not None:
+                metrics_dumper.stop()
+        print("=======================")
+    finally:
+        if profiler is not None:
+            profiler.uninstall()
+            profiler.report()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,311 @@
+import csv
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Iterable, Iterator, List, Tuple, Callable, Dict, TextIO, FrozenSet
+
+from fetchai.ledger.api import LedgerApi
+from fetchai.ledger.crypto import Address
+from fetchai.ledger.crypto.deed import Operation
+
+from fet_tools.tools import EntityList, create_action_tx, sign_txs, set_validity_period_batch, submit_txs_pipelined,\
+                            sync_txs
+from fet_tools.costs import CostAccountant, CostItem, FeeModel, BalanceSnapshot, DEFAULT_FEE
+from fet_tools.deeds import tx_operations
+from fet_tools.preflight import PreflightChecker
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_ACTION_FEE = DEFAULT_FEE
+DEFAULT_CHUNK_SIZE = 500
+
+# Action name used by CLI & daemon -> contract action
+ACTIONS = {
+    "deposit": "deposit",
+    "accept": "accept",
+    "cancel": "cancel",
+    "kill": "kill",
+    "withdraw-excess": "withdrawExcessBalance",
+}
+CONTRACT_ACTIONS = frozenset(ACTIONS.values())
+
+STATUS_SUBMITTED = "Submitted"
+STATUS_SUBMIT_FAILED = "SubmitFailed"
+STATUS_TIMEOUT = "Timeout"
+STATUS_REJECTED = "Rejected"
+
+
+def contract_action(action: str) -> str:
+    """
+    Contract action for CLI/daemon action name (e.g. `withdraw-excess`) or contract action name itself
+
+    :raises: ValueError for unknown action
+    """
+    if action in CONTRACT_ACTIONS:
+        return action
+    if action in ACTIONS:
+        return ACTIONS[action]
+    raise ValueError(f'Unknown action "{action}"')
+
+
+@dataclass
+class ActionItem:
+    """
+    One contract action to execute
+
+    :param args: Arguments of the contract action
+    :param transfers: Native transfers of the tx, (destination address, amount)
+    :param fee: Fee of the tx, the engine fee (or fee model) is used if None
+    """
+    contract_address: str
+    action: str
+    from_address: str
+    args: tuple = ()
+    transfers: List[Tuple[str, int]] = field(default_factory=list)
+    fee: Optional[int] = None
+
+    @staticmethod
+    def from_dict(data: dict, action: Optional[str] = None, from_address: Optional[str] = None) -> 'ActionItem':
+        """
+        :param data: Record with `contract_address`, `action`, `from_address` and optional `amount` (deposit to the
+                     contract), `transfers` (list of [address, amount]), `args` and `fee`
+        :param action: Default action for records without one
+        :param from_address: Default sender for records without one
+        """
+        contract_address = str(data.get("contract_address") or "").strip()
+        item_action = str(data.get("action") or action or "").strip()
+        item_from = str(data.get("from_address") or from_address or "").strip()
+        missing = [name for name, value in (("contract_address", contract_address), ("action", item_action),
+                                            ("from_address", item_from)) if not value]
+        if missing:
+            raise ValueError(f"Action item {data} is missing mandatory field(s): {', '.join(missing)}")
+
+        transfers = [(str(a), int(v)) for a, v in (data.get("transfers") or [])]
+        if data.get("amount"):
+            transfers.append((contract_address, int(data["amount"])))
+        return ActionItem(contract_address=contract_address,
+                          action=contract_action(item_action),
+                          from_address=item_from,
+                          args=tuple(data.get("args") or ()),
+                          transfers=transfers,
+                          fee=int(data["fee"]) if data.get("fee") else None)
+
+
+@dataclass
+class ActionResult:
+    index: int
+    contract_address: str
+    action: str
+    digest: Optional[str] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
+    fee: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        record = {"index": self.index, "contract_address": self.contract_address, "action": self.action,
+                  "digest": self.digest, "status": self.status}
+        if self.fee is not None:
+            record["fee"] = self.fee
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+def read_action_items(path, action: Optional[str] = None, from_address: Optional[str] = None) -> List[ActionItem]:
+    """
+    Reads action items from CSV file with header or JSONL file, or from plain list of contract addresses (one per
+    line) if both `action` and `from_address` are given
+
+    Columns/keys: contract_address, action, from_address, amount, fee (`transfers` & `args` in JSONL only)
+    """
+    path = Path(path)
+    with open(path, 'r', newline='') as f:
+        if path.suffix.lower() in (".jsonl", ".json"):
+            records = [json.loads(line) for line in f if line.strip()]
+        elif path.suffix.lower() == ".csv":
+            records = list(csv.DictReader(f))
+        else:
+            records = [{"contract_address": line.strip()} for line in f
+                       if line.strip() and not line.lstrip().startswith("#")]
+    return [ActionItem.from_dict(r, action, from_address) for r in records]
+
+
+class ActionEngine:
+    """
+    Executes many contract actions: txs are built, signed and submitted in chunks, with one block number query
+    for validity period per chunk and up to `pipeline` submissions in flight, and synced as one set at the end
+
+    :param signatories_for: Provides signatories for given sender address & deed operations of the tx (called once
+                            per distinct sender & operations, see `fet_tools.deeds.SignatorySelector`)
+    :param chunk_size: Number of txs built, signed & submitted at once (bounds memory and the time between
+                       validity period lookup and submission)
+    :param fee: Fee of txs of items without own fee, if None it is chosen per action by the `fee_model`
+                (`DEFAULT_ACTION_FEE` without it)
+    :param sign_processes: Number of processes to sign txs in, 0 = serial signing
+    :param costs: Optional accountant fees of synced txs are recorded to (from tx statuses, falling back to
+                  balances of the senders taken once per run before their first tx)
+    :param fee_model: Optional fee model choosing fee per action (asked once per chunk), with the `costs` as its
+                      statistics fees follow charges of the previous runs (e.g. scheduler rounds)
+    :param preflight: Optional checker items which would fail contract asserts are rejected by (status `Rejected`,
+                      the assert message as error) before signing, statuses are prefetched once per chunk
+    """
+    def __init__(self, api: LedgerApi, signatories_for: Callable[[Address, FrozenSet[Operation]], EntityList],
+                 fee: Optional[int] = None, pipeline: int = 16, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 sign_processes: int = 0, sync: bool = True, sync_timeout: Optional[float] = 120,
+                 costs: Optional[CostAccountant] = None, fee_model: Optional[FeeModel] = None,
+                 preflight: Optional[PreflightChecker] = None):
+        self.api = api
+        self.signatories_for = signatories_for
+        self.fee = fee
+        self.fee_model = fee_model
+        self.preflight = preflight
+        self.pipeline = pipeline
+        self.chunk_size = chunk_size
+        self.sign_processes = sign_processes
+        self.sync = sync
+        self.sync_timeout = sync_timeout
+        self.costs = costs
+        self._signatories = {}  # type: Dict[Tuple[Address, FrozenSet[Operation]], EntityList]
+
+    def _signatories_for(self, from_address: Address, operations: FrozenSet[Operation]) -> EntityList:
+        key = (from_address, operations)
+        signatories = self._signatories.get(key)
+        if signatories is None:
+            signatories = self._signatories[key] = self.signatories_for(from_address, operations)
+        return signatories
+
+    def _fee_for(self, action: str, fees: Dict[str, int]) -> int:
+        if self.fee is not None:
+            return self.fee
+        if self.fee_model is None:
+            return DEFAULT_ACTION_FEE
+        fee = fees.get(action)
+        if fee is None:
+            fee = fees[action] = self.fee_model.fee(action)
+        return fee
+
+    def _chunks(self, items: Iterable[ActionItem]) -> Iterator[List[Tuple[int, ActionItem]]]:
+        chunk = []
+        for index, item in enumerate(items):
+            chunk.append((index, item))
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _submit_chunk(self, chunk: List[Tuple[int, ActionItem]]) -> List[ActionResult]:
+        results = []
+        txs = []
+        fees = {}  # type: Dict[str, int]
+        statuses = {}
+        if self.preflight is not None:
+            statuses = self.preflight.prefetch(item.contract_address for _, item in chunk)
+        for index, item in chunk:
+            result = ActionResult(index, item.contract_address, item.action)
+            results.append(result)
+            try:
+                from_address = Address(item.from_address)
+                transfers = [(Address(a), v) for a, v in item.transfers]
+                if self.preflight is not None:
+                    reason = self.preflight.check(item.contract_address, item.action, from_address, transfers,
+                                                  statuses.get(item.contract_address))
+                    if reason is not None:
+                        result.status = STATUS_REJECTED
+                        result.error = reason
+                        continue
+                signatories = self._signatories_for(from_address, tx_operations(item.action, bool(transfers)))
+                tx = create_action_tx(item.contract_address, from_address, item.action,
+                                      self._fee_for(item.action, fees) if item.fee is None else item.fee,
+                                      signatories, transfers, item.args)
+                txs.append((result, tx, signatories))
+            except Exception as ex:
+                result.status = STATUS_SUBMIT_FAILED
+                result.error = f"{type(ex).__name__}: {ex}"
+
+        set_validity_period_batch(self.api, (tx for _, tx, _ in txs))
+        signed = sign_txs([(tx, signatories) for _, tx, signatories in txs], self.sign_processes)
+        for (result, _, _), (digest, error) in zip(txs, submit_txs_pipelined(self.api, signed, self.pipeline)):
+            result.digest = digest
+            result.status = STATUS_SUBMITTED if digest else STATUS_SUBMIT_FAILED
+            if error is not None:
+                result.error = f"{type(error).__name__}: {error}"
+        return results
+
+    def _invalidate(self, results: Iterable[ActionResult]):
+        """
+        Drops cached statuses of contracts the submitted txs may have changed, so pre-flight checks query them again
+        """
+        if self.preflight is not None:
+            for result in results:
+                if result.digest:
+                    self.preflight.statuses.invalidate(result.contract_address)
+
+    def run(self, items: Iterable[ActionItem], report: Optional[TextIO] = None) -> List[ActionResult]:
+        """
+        :param report: Optional text stream JSONL report is written to: one record per item as soon as its chunk
+                       is submitted and, with sync, one more record per submitted tx with its final status & fee
+        :return: Results in order of the items
+        """
+        results = []  # type: List[ActionResult]
+        senders = {}  # type: Dict[int, Tuple[str, int]]
+        # Balances of senders before their first tx, for costs of txs whose status does not carry the fee
+        snapshot = None  # type: Optional[BalanceSnapshot]
+        for chunk in self._chunks(items):
+            senders.update((index, (item.from_address, sum(v for _, v in item.transfers))) for index, item in chunk)
+            if self.costs is not None and self.sync:
+                chunk_senders = (item.from_address for _, item in chunk)
+                if snapshot is None:
+                    snapshot = BalanceSnapshot(self.api, chunk_senders)
+                else:
+                    snapshot.add(chunk_senders)
+            chunk_results = self._submit_chunk(chunk)
+            _write_report(report, chunk_results)
+            results.extend(chunk_results)
+            logger.info(f"Submitted {len(results)} action Tx(s)")
+
+        if not self.sync:
+            self._invalidate(results)
+            return results
+
+        submitted = [r for r in results if r.digest]
+        statuses = sync_txs(self.api, (r.digest for r in submitted), timeout=self.sync_timeout)
+        self._invalidate(submitted)
+        fees = {}
+        if self.costs is not None:
+            fees = self.costs.account([CostItem(r.action, senders[r.index][0], r.digest, senders[r.index][1])
+                                       for r in submitted], statuses, snapshot)
+        for result in submitted:
+            status = statuses.get(result.digest)
+            result.status = status.status if status else STATUS_TIMEOUT
+            result.fee = fees.get(result.digest, status.fee if status else None)
+        _write_report(report, submitted)
+        return results
+
+
+def _write_report(report: Optional[TextIO], results: Iterable[ActionResult]):
+    if report is None:
+        return
+    for result in results:
+        report.write(json.dumps(result.to_dict()) + "\n")
+    report.flush()
+
+
+def summarize(results: Iterable[ActionResult]) -> Dict[str, int]:
+    summary = {}
+    for result in results:
+        summary[result.status] = summary.get(result.status, 0) + 1
+    return summary
+
+
+def summarize_rejected(results: Iterable[ActionResult]) -> Dict[str, int]:
+    """
+    Number of items rejected by pre-flight check per reason
+    """
+    summary = {}
+    for result in results:
+        if result.status == STATUS_REJECTED:
+            summary[result.error] = summary.get(result.error, 0) + 1
+    return summary
@@ -0,0 +1,239 @@
+import csv
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Dict, Optional, Callable, Iterable, FrozenSet, Set
+
+from fetchai.ledger.api import LedgerApi
+from fetchai.ledger.crypto import Address
+from fetchai.ledger.crypto.deed import Operation
+
+from fet_tools.tools import EntityList, create_deploy_tx, sign_txs, set_validity_period_batch, submit_txs_pipelined,\
+                            sync_txs, get_contract_template_from_text
+from fet_tools.index import ContractIndex
+from fet_tools.costs import CostAccountant, CostItem, BalanceSnapshot
+from fet_tools.deeds import tx_operations
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MANIFEST_FIELDS = ("owner", "nonce", "seller", "buyer", "seller_amount", "buyer_amount")
+RESULT_FIELDS = ("owner", "nonce", "contract_address", "tx_digest", "valid_until", "status", "fee", "error")
+
+# Local marker of tx which has been sent but not confirmed yet (distinct from ledger's "Submitted" tx status)
+STATUS_SENT = "Sent"
+STATUS_SUBMIT_FAILED = "SubmitFailed"
+STATUS_TIMEOUT = "Timeout"
+# Successful terminal states of `TxStatus`
+SUCCESSFUL_STATUSES = ("Executed", "Submitted")
+PENDING_STATUSES = (STATUS_SENT, STATUS_TIMEOUT, "Unknown", "Pending")
+
+
+@dataclass
+class ManifestRow:
+    owner: str
+    nonce: str
+    seller: str
+    buyer: str
+    seller_amount: int = 1
+    buyer_amount: int = 1
+
+    @property
+    def key(self):
+        return self.owner, self.nonce
+
+    @property
+    def transfers(self):
+        return [(Address(self.seller), self.seller_amount), (Address(self.buyer), self.buyer_amount)]
+
+    @staticmethod
+    def from_dict(data: dict) -> 'ManifestRow':
+        missing = [f for f in MANIFEST_FIELDS[:4] if not data.get(f)]
+        if missing:
+            raise ValueError(f"Manifest row {data} is missing mandatory field(s): {', '.join(missing)}")
+
+        return ManifestRow(owner=str(data["owner"]).strip(),
+                           nonce=str(data["nonce"]).strip(),
+                           seller=str(data["seller"]).strip(),
+                           buyer=str(data["buyer"]).strip(),
+                           seller_amount=int(data.get("seller_amount") or 1),
+                           buyer_amount=int(data.get("buyer_amount") or 1))
+
+
+def _is_jsonl(path: Path):
+    return path.suffix.lower() in (".jsonl", ".json")
+
+
+def read_manifest(path) -> List[ManifestRow]:
+    """
+    Reads deployment manifest, either CSV file with header or JSONL file (one JSON object per line)
+
+    Columns/keys: owner, nonce, seller, buyer, seller_amount, buyer_amount (amounts are optional, default 1)
+    """
+    path = Path(path)
+    with open(path, 'r', newline='') as f:
+        if _is_jsonl(path):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = list(csv.DictReader(f))
+
+    rows = [ManifestRow.from_dict(r) for r in records]
+
+    keys = set()
+    for row in rows:
+        if row.key in keys:
+            raise ValueError(f"Duplicate (owner, nonce) = {row.key} in the manifest")
+        keys.add(row.key)
+
+    return rows
+
+
+def load_results(path) -> Dict[tuple, dict]:
+    """
+    Loads results file written by previous run(s), the latest record for given (owner, nonce) wins
+    """
+    path = Path(path)
+    results = {}
+    if not path.exists():
+        return results
+
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                results[(record["owner"], record["nonce"])] = record
+    return results
+
+
+def append_results(path, records: Iterable[dict]):
+    with open(path, 'a') as f:
+        for record in records:
+            f.write(json.dumps({k: record.get(k) for k in RESULT_FIELDS}) + "\n")
+
+
+def _expired_keys(api: LedgerApi, records: List[dict]) -> Set[tuple]:
+    """
+    Keys of pending records whose tx is past its validity period and still has not been executed (so it never will)
+    """
+    candidates = [r for r in records if r.get("valid_until") is not None]
+    if not candidates:
+        return set()
+
+    block = api.tokens.current_block_number()
+    candidates = [r for r in candidates if block > r["valid_until"]]
+    if not candidates:
+        return set()
+
+    statuses = sync_txs(api, (r["tx_digest"] for r in candidates), timeout=0)
+    return set((r["owner"], r["nonce"]) for r in candidates if statuses.get(r["tx_digest"]) is None)
+
+
+def deploy_contracts_batch(api: LedgerApi,
+                           contract_text: str,
+                           rows: List[ManifestRow],
+                           fee: int,
+                           signatories_for: Callable[[Address, FrozenSet[Operation]], EntityList],
+                           results_path,
+                           sync_timeout: Optional[float] = 120,
+                           index: Optional[ContractIndex] = None,
+                           sign_processes: int = 0,
+                           costs: Optional[CostAccountant] = None,
+                           pipeline: int = 16) -> List[dict]:
+    """
+    Deploys contracts for all manifest rows in one go: all txs are built & signed up front, submitted
+    back to back and then synced as one set.
+
+    Rows already successfully deployed (according to the `results_path` file) are skipped, rows which have
+    been submitted but not confirmed are re-synced using their recorded digest rather than re-deployed, unless
+    their tx has expired (current block is past its `valid_until`) without being executed.
+
+    :param signatories_for: Provides signatories for given contract owner address & deed operations of the tx,
+                            rows it raises `ValueError` for are recorded as `SubmitFailed`
+    :param index: Optional contract index successfully deployed contracts are recorded to
+    :param sign_processes: Number of processes to sign txs in, 0 = serial signing
+    :param costs: Optional accountant deployment costs are recorded to (fees from tx statuses, falling back
+                  to one balance snapshot of all owners per batch)
+    :param pipeline: Max. number of submissions in flight
+    :return: List of result records for the rows processed by this run
+    """
+    previous = load_results(results_path)
+
+    to_deploy = []
+    to_resync = []
+    for row in rows:
+        record = previous.get(row.key)
+        if record is None or record["status"] not in SUCCESSFUL_STATUSES + PENDING_STATUSES:
+            to_deploy.append(row)
+        elif record["status"] in PENDING_STATUSES and record.get("tx_digest"):
+            to_resync.append(dict(record))
+
+    expired = _expired_keys(api, to_resync)
+    if expired:
+        logger.info(f"Re-deploying {len(expired)} contract(s) whose tx expired without being executed")
+        to_resync = [r for r in to_resync if (r["owner"], r["nonce"]) not in expired]
+        to_deploy.extend(row for row in rows if row.key in expired)
+
+    logger.info(f"Deploying {len(to_deploy)} contract(s), re-syncing {len(to_resync)} pending tx(s), "
+                f"skipping {len(rows) - len(to_deploy) - len(to_resync)} already deployed")
+
+    template = get_contract_template_from_text(contract_text)
+    records = []
+    failed = []
+    txs = []
+    for row in to_deploy:
+        owner = Address(row.owner)
+        contract = template.instantiate(owner, row.nonce.encode())
+        record = dict(owner=row.owner, nonce=row.nonce, contract_address=str(contract.address),
+                      tx_digest=None, status=None)
+        try:
+            signatories = signatories_for(owner, tx_operations("create", bool(row.transfers)))
+        except ValueError as ex:
+            logger.error(f"Contract {row.key} can not be deployed: {ex}")
+            failed.append(dict(record, status=STATUS_SUBMIT_FAILED, error=str(ex)))
+            continue
+        txs.append((create_deploy_tx(contract, fee, signatories, row.transfers), signatories))
+        records.append(record)
+
+    valid_until = set_validity_period_batch(api, (tx for tx, _ in txs))
+    signed_txs = sign_txs(txs, sign_processes)
+    snapshot = BalanceSnapshot(api, (r["owner"] for r in records)) if costs is not None and records else None
+
+    for record, (digest, error) in zip(records, submit_txs_pipelined(api, signed_txs, pipeline)):
+        record["tx_digest"] = digest
+        record["valid_until"] = valid_until
+        record["status"] = STATUS_SENT if digest else STATUS_SUBMIT_FAILED
+        if error is not None:
+            record["error"] = str(error)
+
+    # Persist digests before syncing, so interrupted run can be resumed without re-deployment
+    append_results(results_path, records)
+
+    records.extend(to_resync)
+    statuses = sync_txs(api, (r["tx_digest"] for r in records if r["status"] != STATUS_SUBMIT_FAILED),
+                        timeout=sync_timeout)
+
+    deployed_keys = set()
+    for record in records:
+        if record["tx_digest"] in statuses:
+            status = statuses[record["tx_digest"]]
+            record["status"] = status.status if status else STATUS_TIMEOUT
+            if status is not None and status.successful:
+                deployed_keys.add((record["owner"], record["nonce"]))
+
+    if costs is not None:
+        deployed = {row.key: row for row in to_deploy}
+        items = [CostItem("deploy", r["owner"], r["tx_digest"], sum(a for _, a in deployed[(r["owner"], r["nonce"])].transfers))
+                 for r in records if r["tx_digest"] and (r["owner"], r["nonce"]) in deployed]
+        fees = costs.account(items, statuses, snapshot)
+        for record in records:
+            record["fee"] = fees.get(record["tx_digest"])
+
+    if index is not None:
+        for row in rows:
+            if row.key in deployed_keys:
+                index.record_deployment(row.owner, row.nonce, row.seller, row.buyer)
+
+    records.extend(failed)
+    append_results(results_path, records)
+    return records
@@ -0,0 +1,249 @@
+import time
+import random
+import logging
+import threading
+from typing import Optional, Iterable, Iterator, Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from fetchai.ledger.api import LedgerApi, TokenApi, ApiError
+from fetchai.ledger.api.token import AddressLike, TokenTxFactory
+from fetchai.ledger.crypto import Address, Identity
+from fetchai.ledger.crypto.deed import Deed
+
+from fet_tools.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_POOL_MAXSIZE = 32
+DEFAULT_CONNECT_DEADLINE = 1000.0
+
+# Errors of the ledger node worth repeating the request for (connection refused/reset, timeout)
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+def query_deed(self, address: AddressLike):
+    """
+    Query the deed for a given address from the remote node
+
+    :param address: The base58 encoded string containing the address of the node
+    :return: The deed json response received from ledger
+    :raises: ApiError on any failures
+    """
+
+    # convert the input to an address
+    address = Address(address)
+
+    # format and make the request
+    request = {
+        'address': str(address)
+    }
+    success, data = self._post_json('queryDeed', request)
+
+    # check for error cases
+    if not success:
+        raise ApiError(f'Failed to query deed for the {address} address')
+
+    return data
+
+
+def deploy_deed(self, address: AddressLike, deed: Optional[Deed], fee: int, signatories: Iterable[Identity]):
+    """
+    Deploys the deed on `address`.
+
+    :param address: Address where the deed will be deployed
+    :param deed: The deed to set
+    :param fee: Fee in Canonical FET
+    :param signatories: The entities that will sign this action
+    :return: The digest of the submitted transaction
+    :raises: ApiError on any failures
+    """
+
+    from fet_tools.deeds import invalidate_deed
+
+    tx = TokenTxFactory.deed(address, deed, fee, signatories)
+    self._set_validity_period(tx)
+
+    for signatory in signatories:
+        tx.sign(signatory)
+
+    digest = self.submit_signed_tx(tx)
+    invalidate_deed(address)
+    return digest
+
+
+_token_api_extended = False
+_token_api_lock = threading.Lock()
+
+
+def extend_token_api():
+    """
+    Extends the TokenApi class with missing `query_deed` and `deed` methods, done only once per process
+    """
+    global _token_api_extended
+    with _token_api_lock:
+        if _token_api_extended:
+            return
+
+        if not callable(getattr(TokenApi, "query_deed", None)):
+            TokenApi.query_deed = query_deed
+
+        # Replaces original `TokenApi.deed(...)` which supports single signatory only
+        TokenApi.deed = deploy_deed
+        _token_api_extended = True
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter, bounded by total deadline
+
+    :param initial: Delay before the first retry in [s]
+    :param maximum: Upper bound of single delay in [s]
+    :param multiplier: Growth factor of the delay
+    :param deadline: Total time budget in [s] measured from the creation of the iterator, None = unbounded
+    """
+    def __init__(self, initial: float = 0.5, maximum: float = 30.0, multiplier: float = 2.0,
+                 deadline: Optional[float] = None):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.deadline = deadline
+
+    def delays(self) -> Iterator[float]:
+        """
+        Yields delays to sleep before the next attempt, stops once the deadline would be exceeded
+        """
+        expires = time.monotonic() + self.deadline if self.deadline is not None else None
+        ceiling = self.initial
+        while True:
+            delay = random.uniform(0, ceiling)
+            if expires is not None:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    return
+                delay = min(delay, remaining)
+            yield delay
+            ceiling = min(self.maximum, ceiling * self.multiplier)
+
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    Adapter applying default timeout to requests sent without one (`LedgerApi` never sets it)
+    """
+    def __init__(self, timeout: Optional[float] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class LedgerClient:
+    """
+    Long-lived ledger client holding one `LedgerApi` instance with pooled keep-alive HTTP connections
+
+    All endpoints of the `LedgerApi` (tokens, contracts, tx, server, ...) share a single `requests.Session`
+    with connection pool sized for concurrent use from multiple threads.
+
+    :param request_timeout: Timeout of HTTP requests in [s], None = wait forever
+    """
+    def __init__(self, network: Optional[str] = None, host: Optional[str] = '127.0.0.1', port: Optional[int] = 8000,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 connect_backoff: Optional[Backoff] = None,
+                 request_timeout: Optional[float] = None):
+        self.network = network
+        self.host = host
+        self.port = port
+        self.pool_maxsize = pool_maxsize
+        self.connect_backoff = connect_backoff or Backoff(deadline=DEFAULT_CONNECT_DEADLINE)
+        self.session = self._create_session(pool_maxsize, request_timeout)
+        self._api = None  # type: Optional[LedgerApi]
+        self._lock = threading.Lock()
+
+        extend_token_api()
+
+    @staticmethod
+    def _create_session(pool_maxsize: int, request_timeout: Optional[float] = None) -> requests.Session:
+        session = requests.Session()
+        adapter = _TimeoutHTTPAdapter(request_timeout, pool_connections=4, pool_maxsize=pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _connect_once(self) -> LedgerApi:
+        if self.network:
+            logger.info(f"Connecting to {self.network} ledger network ...")
+            api = LedgerApi(network=self.network)
+        else:
+            logger.info("Connecting to ledger {}:{} ...".format(self.host, self.port))
+            api = LedgerApi(self.host, self.port)
+
+        for endpoint in (api.tokens, api.contracts, api.tx, api.server, api.governance):
+            endpoint._session = self.session
+
+        return api
+
+    def connect(self) -> LedgerApi:
+        """
+        Connects to the ledger, retrying with exponential backoff until the connect deadline expires
+
+        :raises: ConnectionError if connection could not be established before the deadline
+        """
+        last_error = None
+        delays = self.connect_backoff.delays()
+        metrics = get_metrics()
+        started = time.perf_counter()
+        while True:
+            try:
+                api = self._connect_once()
+                if metrics is not None:
+                    metrics.observe("connect", time.perf_counter() - started)
+                return api
+            except Exception as ex:
+                last_error = ex
+                logger.error("Unable to connect to ledger {}:{} ... {}".format(self.host, self.port, ex))
+
+            delay = next(delays, None)
+            if delay is None:
+                if metrics is not None:
+                    metrics.observe("connect", time.perf_counter() - started, type(last_error).__name__)
+                raise ConnectionError(f"Unable to connect to ledger before deadline: {last_error}")
+            if metrics is not None:
+                metrics.retry("connect")
+            time.sleep(delay)
+
+    @property
+    def api(self) -> LedgerApi:
+        """
+        Ledger API instance, connected lazily on first access
+        """
+        if self._api is None:
+            with self._lock:
+                if self._api is None:
+                    self._api = self.connect()
+        return self._api
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}  # type: Dict[Tuple, LedgerClient]
+_clients_lock = threading.Lock()
+
+
+def get_client(network: Optional[str] = None, host: Optional[str] = '127.0.0.1', port: Optional[int] = 8000,
+               **kwargs) -> LedgerClient:
+    """
+    Returns process-wide shared client for given ledger, creates it on the first call
+    """
+    key = (network, None, None) if network else (None, host, int(port))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = LedgerClient(network=network, host=host, port=port, **kwargs)
+            _clients[key] = client
+    return client
@@ -0,0 +1,200 @@
+import json
+import heapq
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Callable, Dict, List, TextIO, Any
+
+from fetchai.ledger.api import LedgerApi
+from fetchai.ledger.api.tx import TxStatus
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+STATUS_TIMEOUT = "Timeout"
+STATUS_ERROR = "Error"
+
+# Called as callback(confirmation) once the tx reaches terminal state, fails to be queried, or times out
+ConfirmationCallback = Callable[['Confirmation'], None]
+
+
+@dataclass
+class Confirmation:
+    digest: str
+    status: str
+    tx_status: Optional[TxStatus] = None
+    error: Optional[str] = None
+    meta: Any = None
+    elapsed: float = 0.0
+
+    @property
+    def successful(self) -> bool:
+        return self.tx_status is not None and self.tx_status.successful
+
+    def to_dict(self) -> dict:
+        record = {"digest": self.digest, "status": self.status, "elapsed_s": round(self.elapsed, 3)}
+        if self.tx_status is not None:
+            record.update(exit_code=self.tx_status.exit_code, fee=self.tx_status.fee)
+        if self.error:
+            record["error"] = self.error
+        if self.meta is not None:
+            record["meta"] = self.meta
+        return record
+
+
+@dataclass
+class _Pending:
+    digest: str
+    submitted: float
+    deadline: float
+    interval: float
+    callback: Optional[ConfirmationCallback] = None
+    meta: Any = None
+
+
+@dataclass(order=True)
+class _Poll:
+    when: float
+    digest: str = field(compare=False)
+
+
+class ConfirmationTracker:
+    """
+    Tracks many submitted transactions in a single polling loop
+
+    Each pending digest is polled with its own exponentially growing interval (starting at `initial_interval`,
+    capped by `max_interval`), so freshly submitted txs are checked often while long-pending ones do not
+    dominate the query load. Next polls are kept in a heap ordered by time.
+
+    :param api: Ledger API
+    :param timeout: Default time in [s] after which the tx is reported with `Timeout` status
+    :param on_update: Callback invoked for every finished tx (in addition to per-tx callback)
+    :param updates_stream: Optional text stream where JSONL status updates are written to
+    """
+    def __init__(self, api: LedgerApi, timeout: float = 120.0, initial_interval: float = 0.5,
+                 max_interval: float = 10.0, multiplier: float = 2.0,
+                 on_update: Optional[ConfirmationCallback] = None,
+                 updates_stream: Optional[TextIO] = None):
+        self.api = api
+        self.timeout = timeout
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.on_update = on_update
+        self.updates_stream = updates_stream
+        self._pending = {}  # type: Dict[str, _Pending]
+        self._schedule = []  # type: List[_Poll]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, digest: str, callback: Optional[ConfirmationCallback] = None, timeout: Optional[float] = None,
+            meta: Any = None):
+        """
+        Starts tracking the tx, it is polled for the first time after `initial_interval`
+        """
+        now = time.monotonic()
+        pending = _Pending(digest, now, now + (self.timeout if timeout is None else timeout),
+                           self.initial_interval, callback, meta)
+        with self._lock:
+            self._pending[digest] = pending
+            heapq.heappush(self._schedule, _Poll(now + pending.interval, digest))
+
+    def _finish(self, pending: _Pending, status: str, tx_status: Optional[TxStatus] = None,
+                error: Optional[str] = None) -> Confirmation:
+        with self._lock:
+            self._pending.pop(pending.digest, None)
+
+        confirmation = Confirmation(pending.digest, status, tx_status, error, pending.meta,
+                                    time.monotonic() - pending.submitted)
+        for callback in (pending.callback, self.on_update):
+            if callback:
+                try:
+                    callback(confirmation)
+                except Exception:
+                    logger.exception(f"Confirmation callback for {pending.digest} tx failed")
+
+        if self.updates_stream is not None:
+            self.updates_stream.write(json.dumps(confirmation.to_dict()) + "\n")
+            self.updates_stream.flush()
+
+        return confirmation
+
+    def poll_once(self) -> List[Confirmation]:
+        """
+        Polls all digests which are due now
+
+        :return: Confirmations of txs finished in this round
+        """
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            while self._schedule and self._schedule[0].when <= now:
+                poll = heapq.heappop(self._schedule)
+                pending = self._pending.get(poll.digest)
+                if pending is not None:
+                    due.append(pending)
+
+        finished = []
+        for pending in due:
+            try:
+                tx_status = self.api.tx.status(pending.digest)
+            except Exception as ex:
+                tx_status = None
+                logger.warning(f"Unable to query status of {pending.digest} tx: {ex}")
+                if time.monotonic() >= pending.deadline:
+                    finished.append(self._finish(pending, STATUS_ERROR, error=str(ex)))
+                    continue
+
+            if tx_status is not None and not tx_status.non_terminal:
+                finished.append(self._finish(pending, tx_status.status, tx_status))
+            elif time.monotonic() >= pending.deadline:
+                finished.append(self._finish(pending, STATUS_TIMEOUT, tx_status))
+            else:
+                pending.interval = min(self.max_interval, pending.interval * self.multiplier)
+                with self._lock:
+                    heapq.heappush(self._schedule, _Poll(min(time.monotonic() + pending.interval, pending.deadline),
+                                                         pending.digest))
+        return finished
+
+    def _next_poll_delay(self) -> Optional[float]:
+        with self._lock:
+            if not self._schedule:
+                return None
+            return max(0.0, self._schedule[0].when - time.monotonic())
+
+    def wait_all(self) -> List[Confirmation]:
+        """
+        Polls until all tracked txs are finished (or timed out)
+        """
+        finished = []
+        while len(self) > 0 and not self._stop.is_set():
+            finished.extend(self.poll_once())
+            delay = self._next_poll_delay()
+            if delay:
+                self._stop.wait(delay)
+        return finished
+
+    def start(self):
+        """
+        Starts polling in background thread, txs can be added concurrently
+        """
+        def run():
+            while not self._stop.is_set():
+                self.poll_once()
+                delay = self._next_poll_delay()
+                self._stop.wait(self.initial_interval if delay is None else min(delay, self.initial_interval))
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="ConfirmationTracker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,301 @@
+import os
+import json
+import math
+import logging
+import threading
+from dataclasses import dataclass
+from collections import defaultdict
+from typing import Optional, Iterable, Dict, List
+
+from fetchai.ledger.api import LedgerApi
+from fetchai.ledger.api.tx import TxStatus
+from fetchai.ledger.crypto import Address
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SOURCE_RECEIPT = "receipt"
+SOURCE_BALANCE = "balance"
+
+# Max. number of fee samples kept per action for percentiles
+MAX_SAMPLES = 1000
+
+# Fee (charge limit) per action used by `FeeModel` until enough charges are observed, `DEFAULT_FEE` otherwise
+DEFAULT_FEES = {"deploy": 600000}
+DEFAULT_FEE = 10000
+DEFAULT_FEE_MARGIN = 0.2
+
+STATUS_INSUFFICIENT_CHARGE = "insufficient charge"
+
+
+def fee_from_status(status: Optional[TxStatus]) -> Optional[int]:
+    """
+    Fee charged for the tx as reported by the node in tx status
+
+    :return: Fee, or None if it is not known: the tx is not terminal, it has been only `Submitted` (the status
+             some nodes report instead of `Executed`), or the node does not report fees (reports 0)
+    """
+    if status is None or status.non_terminal or status.status == "Submitted" or not status.fee:
+        return None
+    return int(status.fee)
+
+
+def is_insufficient_charge(status: Optional[TxStatus]) -> bool:
+    return status is not None and status.status.lower() == STATUS_INSUFFICIENT_CHARGE
+
+
+def _append_sample(samples: List[int], value: int):
+    samples.append(value)
+    if len(samples) > MAX_SAMPLES:
+        del samples[:len(samples) - MAX_SAMPLES]
+
+
+def _percentile(ordered: List[int], p: float) -> int:
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+class ActionCostStats:
+    """
+    Aggregated costs of one action type, percentiles are computed from the last `MAX_SAMPLES` samples
+
+    `charges` are the samples reported by the node in tx receipts, the fee model learns from them only (costs
+    derived from balance snapshots are skewed by any other balance change in the meantime).
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.sources = defaultdict(int)  # type: Dict[str, int]
+        self.samples = []  # type: List[int]
+        self.charges = []  # type: List[int]
+        self.insufficient = 0
+        self.insufficient_limit = 0
+        self._ordered = None  # type: Optional[List[int]]
+        self._ordered_charges = None  # type: Optional[List[int]]
+
+    def add(self, fee: int, source: str):
+        self.count += 1
+        self.total += fee
+        self.sources[source] += 1
+        _append_sample(self.samples, fee)
+        self._ordered = None
+        if source == SOURCE_RECEIPT:
+            _append_sample(self.charges, fee)
+            self._ordered_charges = None
+
+    def add_insufficient(self, fee: int, charge_limit: int):
+        """
+        Records tx which failed for insufficient charge: its fee is a cost, but not a sample of the charge needed
+        (which is only known to be above the `charge_limit`)
+        """
+        self.count += 1
+        self.total += fee
+        self.sources[SOURCE_RECEIPT] += 1
+        self.insufficient += 1
+        self.insufficient_limit = max(self.insufficient_limit, charge_limit)
+
+    def percentile(self, p: float) -> int:
+        if self._ordered is None:
+            self._ordered = sorted(self.samples)
+        return _percentile(self._ordered, p)
+
+    def charge_percentile(self, p: float) -> int:
+        """
+        Percentile of the charges reported in tx receipts
+        """
+        if self._ordered_charges is None:
+            self._ordered_charges = sorted(self.charges)
+        return _percentile(self._ordered_charges, p)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "min": min(self.samples, default=0),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": max(self.samples, default=0),
+            "sources": dict(self.sources),
+            "insufficient_charge": self.insufficient,
+            "insufficient_limit": self.insufficient_limit,
+            "samples": self.samples,
+            "charges": self.charges,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> 'ActionCostStats':
+        stats = ActionCostStats()
+        stats.count = data["count"]
+        stats.total = data["sum"]
+        stats.sources.update(data.get("sources", {}))
+        stats.samples = list(data.get("samples", []))
+        stats.charges = list(data.get("charges", []))
+        stats.insufficient = data.get("insufficient_charge", 0)
+        stats.insufficient_limit = data.get("insufficient_limit", 0)
+        return stats
+
+
+@dataclass
+class CostItem:
+    """
+    Submitted tx to account the cost of
+
+    :param transferred: Amount transferred out of `from_address` by the tx (not part of the cost), used when
+                        the cost is derived from balance snapshots
+    """
+    action: str
+    from_address: str
+    digest: str
+    transferred: int = 0
+
+
+class BalanceSnapshot:
+    """
+    Balances of a set of addresses, queried once per address (not per tx)
+    """
+    def __init__(self, api: LedgerApi, addresses: Iterable):
+        self.api = api
+        self.before = {}  # type: Dict[str, int]
+        self.add(addresses)
+
+    def add(self, addresses: Iterable):
+        """
+        Adds balances of the addresses not in the snapshot yet (e.g. senders of the next chunk of a streamed batch)
+        """
+        for address in set(str(Address(a)) for a in addresses) - self.before.keys():
+            self.before[address] = self.api.tokens.balance(Address(address))
+
+    def spent(self) -> Dict[str, int]:
+        """
+        Queries balances again and returns amount spent per address since the snapshot
+        """
+        return {a: before - self.api.tokens.balance(Address(a)) for a, before in self.before.items()}
+
+
+class CostAccountant:
+    """
+    Accounts costs of executed txs per action type
+
+    Fee is taken from the tx status (receipt) reported by the node, so no extra queries are needed. Only for txs
+    whose status does not carry the fee, cost is derived from balance snapshot taken once for the whole batch:
+    amount spent by the sender (minus amounts it transferred) is split evenly among its txs of the batch.
+    Both methods are inaccurate if balance of the sender is changed by other txs in the meantime.
+
+    :param path: Optional JSON file statistics are loaded from and saved to (accumulated across runs)
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.stats = defaultdict(ActionCostStats)  # type: Dict[str, ActionCostStats]
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                for action, data in json.load(f).get("actions", {}).items():
+                    self.stats[action] = ActionCostStats.from_dict(data)
+
+    def record(self, action: str, fee: int, source: str = SOURCE_RECEIPT):
+        with self._lock:
+            self.stats[action].add(int(fee), source)
+
+    def record_status(self, action: str, status: Optional[TxStatus]) -> Optional[int]:
+        """
+        Records fee from the tx status if the node reported it (txs failed for insufficient charge are recorded
+        as such, see `ActionCostStats.add_insufficient`)
+
+        :return: Fee, or None if it is not available
+        """
+        fee = fee_from_status(status)
+        if fee is not None and is_insufficient_charge(status):
+            with self._lock:
+                self.stats[action].add_insufficient(fee, status.charge_limit)
+        elif fee is not None:
+            self.record(action, fee)
+        return fee
+
+    def account(self, items: Iterable[CostItem], statuses: Dict[str, Optional[TxStatus]],
+                snapshot: Optional[BalanceSnapshot] = None) -> Dict[str, Optional[int]]:
+        """
+        Records costs of a batch of txs
+
+        :param statuses: Final tx statuses, digest -> TxStatus (e.g. result of `sync_txs`)
+        :param snapshot: Balances of senders taken before the batch was submitted, used for txs without fee
+                         in their status
+        :return: Cost per digest, None where it could not be determined
+        """
+        costs = {}
+        without_fee = defaultdict(list)  # type: Dict[str, List[CostItem]]
+        accounted = defaultdict(int)  # type: Dict[str, int]
+        for item in items:
+            address = str(Address(item.from_address))
+            status = statuses.get(item.digest)
+            costs[item.digest] = self.record_status(item.action, status)
+            accounted[address] += item.transferred + (costs[item.digest] or 0)
+            if costs[item.digest] is None and status is not None and not status.non_terminal:
+                without_fee[address].append(item)
+
+        if without_fee and snapshot is not None:
+            spent = snapshot.spent()
+            for address, address_items in without_fee.items():
+                if address not in spent:
+                    continue
+                share = (spent[address] - accounted[address]) // len(address_items)
+                if share <= 0:
+                    # Charges have not landed yet (e.g. txs only `Submitted`) or balance was topped up meanwhile
+                    continue
+                for item in address_items:
+                    self.record(item.action, share, SOURCE_BALANCE)
+                    costs[item.digest] = share
+        return costs
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"actions": {action: stats.to_dict() for action, stats in sorted(self.stats.items())}}
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if not path:
+            return
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+        os.replace(tmp, path)
+
+
+class FeeModel:
+    """
+    Chooses fee (charge limit) of txs per action from charges of executed txs of the action reported in their
+    receipts and recorded by `costs` (persisted with them): percentile of the observed charges plus safety margin.
+    Default fee is used until `min_samples` charges are observed; fee which turned out insufficient is at least
+    doubled.
+
+    Fees are amounts at charge rate 1, as set by the tx factories.
+
+    :param margin: Safety margin on top of the observed charge (0.2 = +20 %)
+    :param percentile: Percentile of the observed charges the fee is derived from
+    :param defaults: Fee per action until enough charges are observed, `DEFAULT_FEE` for actions not listed
+    """
+    def __init__(self, costs: CostAccountant, margin: float = DEFAULT_FEE_MARGIN, percentile: float = 99,
+                 min_samples: int = 5, defaults: Optional[Dict[str, int]] = None):
+        self.costs = costs
+        self.margin = margin
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.defaults = dict(DEFAULT_FEES if defaults is None else defaults)
+
+    def fee(self, action: str) -> int:
+        with self.costs._lock:
+            stats = self.costs.stats.get(action)
+            if stats is None or len(stats.charges) < self.min_samples:
+                fee = self.defaults.get(action, DEFAULT_FEE)
+            else:
+                fee = math.ceil(stats.charge_percentile(self.percentile) * (1 + self.margin))
+            if stats is not None and fee <= stats.insufficient_limit:
+                fee = 2 * stats.insufficient_limit
+        return max(1, fee)
+
+    def to_dict(self) -> dict:
+        with self.costs._lock:
+            actions = sorted(set(self.defaults) | set(self.costs.stats))
+        return {"margin": self.margin, "percentile": self.percentile,
+                "fees": {action: self.fee(action) for action in actions}}
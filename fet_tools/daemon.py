@@ -0,0 +1,314 @@
+import json
+import inspect
+import logging
+import threading
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, List, Iterable, Tuple
+
+from fetchai.ledger.api import LedgerApi
+from fetchai.ledger.api.tx import TxStatus
+from fetchai.ledger.crypto import Address
+from fetchai.ledger.transaction import Transaction
+
+from fet_tools.tools import EntityList, create_deploy_tx, create_action_tx, sign_tx, sync_txs,\
+                            get_contract_template_from_text
+from fet_tools.status import query_contract_status
+from fet_tools.index import ContractIndex
+from fet_tools.costs import CostAccountant, FeeModel, DEFAULT_FEES
+from fet_tools.metrics import get_metrics
+from fet_tools.actions import ACTIONS
+from fet_tools.deeds import DeedCache, SignatorySelector, tx_operations
+from fet_tools.preflight import PreflightChecker, StatusCache
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_DEPLOY_FEE = DEFAULT_FEES["deploy"]
+
+
+class ServiceError(Exception):
+    def __init__(self, message: str, status: HTTPStatus = HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+class EscrowService:
+    """
+    Executes escrow contract operations (the same as CLI sub-commands) non-interactively using warm ledger
+    connection and signing entities held in memory
+
+    :param api: Ledger API (or `fet_tools.stub.StubLedgerApi` for testing)
+    :param contract_text: Source code of the contract used for deployments
+    :param signatories: Signing entities available to the service
+    :param index: Optional contract index deployed contracts are recorded to and statuses are backfilled to
+    :param costs: Optional accountant fees of synced txs are recorded to
+    :param fee_model: Chooses fee of requests without explicit `fee`, by default it learns from the `costs`
+    :param preflight: Reject actions which would fail contract asserts (409) before signing, checked against cached
+                      contract statuses
+    """
+    def __init__(self, api: LedgerApi, contract_text: str, signatories: EntityList, sync_timeout: float = 120,
+                 index: Optional[ContractIndex] = None, costs: Optional[CostAccountant] = None,
+                 fee_model: Optional[FeeModel] = None, preflight: bool = True):
+        self.api = api
+        self.index = index
+        self.costs = costs
+        self.fee_model = fee_model or FeeModel(costs if costs is not None else CostAccountant())
+        self.template = get_contract_template_from_text(contract_text)
+        self.sync_timeout = sync_timeout
+        self._signatories = {Address(s): s for s in signatories}
+        self._selector = SignatorySelector(DeedCache(api), self._signatories.get)
+        self._preflight = PreflightChecker(StatusCache(api)) if preflight else None
+
+    @property
+    def addresses(self) -> List[str]:
+        return [str(a) for a in self._signatories.keys()]
+
+    def signatories_for(self, from_address: Address, operations, signers: Optional[Iterable[str]] = None) -> EntityList:
+        """
+        Selects signatories for the tx: explicit `signers`, by default the minimal set of loaded keys meeting deed
+        thresholds of the `operations` (the `from_address` itself for non-deed accounts)
+        """
+        if not signers:
+            try:
+                return self._selector.select(from_address, operations)
+            except ValueError as ex:
+                raise ServiceError(str(ex), HTTPStatus.FORBIDDEN)
+
+        signers = [Address(s) for s in signers]
+        missing = [str(s) for s in signers if s not in self._signatories]
+        if missing:
+            raise ServiceError(f"No signing key loaded for address(es): {', '.join(missing)}", HTTPStatus.FORBIDDEN)
+        return [self._signatories[s] for s in signers]
+
+    def _submit(self, action: str, tx: Transaction, signatories: EntityList, sync: bool,
+                contract_address: Address) -> Tuple[dict, Optional[TxStatus]]:
+        """
+        :return: Response & final status of the tx, the status is None without sync or if the sync timed out
+        """
+        self.api.set_validity_period(tx)
+        sign_tx(tx, signatories)
+        try:
+            digest = self.api.submit_signed_tx(tx)
+            return self._track(action, digest, sync)
+        finally:
+            # The tx may have changed the contract state, next pre-flight check queries it again
+            if self._preflight is not None:
+                self._preflight.statuses.invalidate(contract_address)
+
+    def _track(self, action: str, digest: str, sync: bool) -> Tuple[dict, Optional[TxStatus]]:
+        result = {"tx_digest": digest, "status": "Submitted"}
+        status = None
+        if sync:
+            status = sync_txs(self.api, [digest], timeout=self.sync_timeout)[digest]
+            result["status"] = status.status if status else "Timeout"
+            if status:
+                result["fee"] = status.fee
+                if self.costs is not None:
+                    self.costs.record_status(action, status)
+                if self.fee_model.costs is not self.costs:
+                    self.fee_model.costs.record_status(action, status)
+        return result, status
+
+    def deploy(self, owner: str, nonce: str, transfers: List[Tuple[str, int]], fee: Optional[int] = None,
+               signers: Optional[List[str]] = None, sync: bool = True) -> dict:
+        if not transfers or len(transfers) != 2:
+            raise ServiceError("Exactly 2 transfers (seller, buyer) are required")
+
+        owner = Address(owner)
+        contract = self.template.instantiate(owner, str(nonce).encode())
+        signatories = self.signatories_for(owner, tx_operations("create", True), signers)
+        fee = self.fee_model.fee("deploy") if fee is None else int(fee)
+        tx = create_deploy_tx(contract, fee, signatories, [(Address(a), int(v)) for a, v in transfers])
+
+        result = {"contract_address": str(contract.address)}
+        response, status = self._submit("deploy", tx, signatories, sync, contract.address)
+        result.update(response)
+        if self.index is not None and status is not None and status.successful:
+            self.index.record_deployment(owner, str(nonce), transfers[0][0], transfers[1][0])
+        return result
+
+    def query_balance(self, contract_address: str) -> dict:
+        success, response = self.api.contracts.query(Address(contract_address), "deposited_balance")
+        if not (success and response and response["status"] == "success"):
+            raise ServiceError(f"Query of deposited balance of {contract_address} contract failed", HTTPStatus.BAD_GATEWAY)
+        return {"contract_address": contract_address, "balance": response["result"]}
+
+    def query_status(self, contract_address: str) -> dict:
+        status = query_contract_status(self.api, contract_address)
+        if status is None:
+            raise ServiceError(f"Query of status of {contract_address} contract failed", HTTPStatus.BAD_GATEWAY)
+        if self.index is not None:
+            self.index.update_from_status(contract_address, status)
+        if self._preflight is not None:
+            self._preflight.statuses.put(contract_address, status)
+        return {"contract_address": contract_address, "status": status.to_dict(encode_json=True)}
+
+    def action(self, action: str, contract_address: str, from_address: str, fee: Optional[int] = None,
+               amount: Optional[int] = None, signers: Optional[List[str]] = None, sync: bool = True) -> dict:
+        if action not in ACTIONS:
+            raise ServiceError(f'Unknown action "{action}"', HTTPStatus.NOT_FOUND)
+
+        contract_address = Address(contract_address)
+        from_address = Address(from_address)
+        transfers = None
+        if action == "deposit":
+            if amount is None or int(amount) <= 0:
+                raise ServiceError("Positive `amount` is required for deposit")
+            transfers = [(contract_address, int(amount))]
+
+        if self._preflight is not None:
+            reason = self._preflight.check(contract_address, ACTIONS[action], from_address, transfers,
+                                           self._preflight.statuses.get(contract_address))
+            if reason is not None:
+                raise ServiceError(f"{action} of {contract_address} contract would fail: {reason}", HTTPStatus.CONFLICT)
+
+        signatories = self.signatories_for(from_address, tx_operations(ACTIONS[action], bool(transfers)), signers)
+        fee = self.fee_model.fee(ACTIONS[action]) if fee is None else int(fee)
+        tx = create_action_tx(contract_address, from_address, ACTIONS[action], fee, signatories, transfers)
+        return self._submit(ACTIONS[action], tx, signatories, sync, contract_address)[0]
+
+    def dispatch(self, path: str, params: dict) -> dict:
+        """
+        Routes request path (`/deploy`, `/query/{balance,status}`, `/action/<action>`) to the service method
+        """
+        parts = [p for p in path.split("?", 1)[0].split("/") if p]
+        args = ()
+        if parts == ["deploy"]:
+            method = self.deploy
+        elif parts == ["query", "balance"]:
+            method = self.query_balance
+        elif parts == ["query", "status"]:
+            method = self.query_status
+        elif len(parts) == 2 and parts[0] == "action":
+            method, args = self.action, (parts[1],)
+        else:
+            raise ServiceError(f"Unknown endpoint {path}", HTTPStatus.NOT_FOUND)
+
+        try:
+            inspect.signature(method).bind(*args, **params)
+        except TypeError as ex:
+            raise ServiceError(f"Invalid parameters: {ex}")
+
+        try:
+            return method(*args, **params)
+        except ValueError as ex:
+            raise ServiceError(str(ex))
+
+
+class _Limiter:
+    """
+    Limits number of concurrently executed requests, excess requests wait in bounded queue
+    """
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: Optional[float]):
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.queued = 0
+        self.in_flight = 0
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.queued >= self.max_queue:
+                return False
+            self.queued += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self.queued -= 1
+        if acquired:
+            with self._lock:
+                self.in_flight += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = "EscrowDaemon/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status: HTTPStatus, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_params(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length == 0:
+            return {}
+        params = json.loads(self.rfile.read(length))
+        if not isinstance(params, dict):
+            raise ServiceError("Request body must be JSON object")
+        return params
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/health":
+            limiter = self.server.limiter
+            self._reply(HTTPStatus.OK, {"result": {"in_flight": limiter.in_flight,
+                                                   "queued": limiter.queued,
+                                                   "addresses": self.server.service.addresses}})
+        elif self.path.rstrip("/") == "/costs" and self.server.service.costs is not None:
+            result = self.server.service.costs.to_dict()
+            result["fees"] = self.server.service.fee_model.to_dict()
+            self._reply(HTTPStatus.OK, {"result": result})
+        elif self.path.rstrip("/") == "/endpoints" and callable(getattr(self.server.service.api, "stats", None)):
+            self._reply(HTTPStatus.OK, {"result": self.server.service.api.stats()})
+        elif self.path.rstrip("/") == "/metrics" and get_metrics() is not None:
+            self._reply(HTTPStatus.OK, {"result": get_metrics().to_dict()})
+        else:
+            self._reply(HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        try:
+            params = self._read_params()
+        except (ValueError, ServiceError) as ex:
+            self._reply(HTTPStatus.BAD_REQUEST, {"error": f"Invalid request body: {ex}"})
+            return
+
+        limiter = self.server.limiter
+        if not limiter.acquire():
+            self._reply(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Too many requests queued"})
+            return
+
+        try:
+            result = self.server.service.dispatch(self.path, params)
+            self._reply(HTTPStatus.OK, {"result": result})
+        except ServiceError as ex:
+            self._reply(ex.status, {"error": str(ex)})
+        except Exception as ex:
+            logger.exception(f"Request {self.path} failed")
+            self._reply(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(ex).__name__}: {ex}"})
+        finally:
+            limiter.release()
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class EscrowDaemon(ThreadingHTTPServer):
+    """
+    Local HTTP/JSON server exposing `EscrowService`
+
+    Endpoints (all `POST` with JSON object body holding parameters of the respective `EscrowService` method):
+      /deploy, /query/balance, /query/status, /action/{deposit,accept,cancel,kill,withdraw-excess}
+    and `GET /health`, `GET /costs` (per-action cost statistics, if cost accounting is enabled), `GET /metrics`
+    (latency histograms, error & retry counts of ledger operations, if metrics are enabled), `GET /endpoints`
+    (health, latency & error statistics per ledger node, with `fet_tools.multinode.MultiNodeLedgerApi`).
+    Responses are JSON objects with either `result` or `error` key.
+    """
+    daemon_threads = True
+
+    def __init__(self, service: EscrowService, host: str = "127.0.0.1", port: int = 8765,
+                 max_concurrency: int = 8, max_queue: int = 64, queue_timeout: Optional[float] = 60):
+        super().__init__((host, port), _RequestHandler)
+        self.service = service
+        self.limiter = _Limiter(max_concurrency, max_queue, queue_timeout)
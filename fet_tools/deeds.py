@@ -0,0 +1,360 @@
+import json
+import time
+import logging
+import threading
+import weakref
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Iterable, Iterator, Dict, List, Tuple, Callable, TextIO, FrozenSet
+
+from fetchai.ledger.api import LedgerApi
+from fetchai.ledger.api.token import TokenTxFactory
+from fetchai.ledger.crypto import Address, Identity
+from fetchai.ledger.crypto.deed import Deed, Operation
+
+from fet_tools.tools import EntityList, sign_txs, set_validity_period_batch, submit_txs_pipelined, sync_txs
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_DEED_TTL = 300.0
+DEFAULT_DEED_FEE = 10000
+
+STATUS_SUBMITTED = "Submitted"
+STATUS_SUBMIT_FAILED = "SubmitFailed"
+STATUS_TIMEOUT = "Timeout"
+
+# Live deed caches, entries of all of them are invalidated by `invalidate_deed`
+_caches = weakref.WeakSet()  # type: weakref.WeakSet
+_caches_lock = threading.Lock()
+
+
+def parse_deed(data) -> Optional[Deed]:
+    """
+    Decodes result of `query_deed`: either deed JSON itself or object carrying it in `deed` key
+
+    :return: Deed, None if the address has no deed
+    """
+    if isinstance(data, str):
+        data = json.loads(data) if data else None
+    if isinstance(data, dict) and "signees" not in data:
+        data = data.get("deed")
+    if not data or not data.get("signees"):
+        return None
+    return Deed.from_json(data, require_amend=str(Operation.amend) in data.get("thresholds", {}))
+
+
+def deed_to_dict(deed: Optional[Deed]) -> Optional[dict]:
+    if deed is None:
+        return None
+    return {
+        "signees": {str(signee): weight for signee, weight in deed.votes},
+        "thresholds": {str(operation): threshold for operation, threshold in deed.thresholds},
+    }
+
+
+@dataclass
+class DeedResult:
+    address: str
+    deed: Optional[Deed] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {"address": self.address, "deed": deed_to_dict(self.deed), "error": self.error}
+
+
+def query_deed(api: LedgerApi, address) -> Optional[Deed]:
+    return parse_deed(api.tokens.query_deed(Address(address)))
+
+
+def _query_deed_result(api: LedgerApi, address: str) -> DeedResult:
+    result = DeedResult(address)
+    try:
+        result.deed = query_deed(api, address)
+    except Exception as ex:
+        result.error = f"{type(ex).__name__}: {ex}"
+    return result
+
+
+def query_deeds(api: LedgerApi, addresses: Iterable[str], parallelism: int = 16) -> Iterator[DeedResult]:
+    """
+    Queries deeds of many addresses concurrently, results are yielded in order of the addresses
+    """
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        yield from executor.map(lambda address: _query_deed_result(api, str(address)), addresses)
+
+
+class DeedCache:
+    """
+    Cache of deeds (including absence of deed) per address with time-to-live
+
+    Entries are invalidated explicitly after deed tx of the address is submitted (`invalidate`, or
+    `invalidate_deed` for all live caches, which is done by `deploy_deeds_batch` and the patched `TokenApi.deed`).
+
+    :param ttl: Time-to-live of the entries in [s]
+    :param parallelism: Max. number of concurrent queries of `get_many`
+    """
+    def __init__(self, api: LedgerApi, ttl: float = DEFAULT_DEED_TTL, parallelism: int = 16):
+        self.api = api
+        self.ttl = ttl
+        self.parallelism = parallelism
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # type: Dict[str, Tuple[float, Optional[Deed]]]
+        self._lock = threading.Lock()
+        with _caches_lock:
+            _caches.add(self)
+
+    def _lookup(self, address: str) -> Tuple[bool, Optional[Deed]]:
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, None
+
+    def _store(self, address: str, deed: Optional[Deed]):
+        with self._lock:
+            self._entries[address] = (time.monotonic() + self.ttl, deed)
+
+    def get(self, address) -> Optional[Deed]:
+        """
+        :return: Deed of the address, None if it has no deed
+        """
+        address = str(Address(address))
+        cached, deed = self._lookup(address)
+        if not cached:
+            deed = query_deed(self.api, address)
+            self._store(address, deed)
+        return deed
+
+    def get_many(self, addresses: Iterable) -> Dict[str, DeedResult]:
+        """
+        Deeds of many addresses, those not cached are queried concurrently
+
+        :return: Address -> result (with `error` for addresses whose query failed, these are not cached)
+        """
+        results = {}
+        missing = []
+        for address in set(str(a) for a in addresses):
+            try:
+                address = str(Address(address))
+            except Exception as ex:
+                results[address] = DeedResult(address, error=f"{type(ex).__name__}: {ex}")
+                continue
+            cached, deed = self._lookup(address)
+            if cached:
+                results[address] = DeedResult(address, deed)
+            else:
+                missing.append(address)
+
+        for result in query_deeds(self.api, missing, self.parallelism):
+            if result.error is None:
+                self._store(result.address, result.deed)
+            results[result.address] = result
+        return results
+
+    def invalidate(self, address=None):
+        """
+        Drops cached deed of the address, or all entries if `address` is None
+        """
+        with self._lock:
+            if address is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(Address(address)), None)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "ttl_s": self.ttl}
+
+
+def invalidate_deed(address):
+    """
+    Invalidates the address in all live deed caches, to be called once deed tx of the address has been submitted
+    """
+    with _caches_lock:
+        caches = list(_caches)
+    for cache in caches:
+        cache.invalidate(address)
+
+
+def tx_operations(action: Optional[str], transfers: bool = False) -> FrozenSet[Operation]:
+    """
+    Deed operations tx has to be authorised for: `amend` for deed tx, `execute` for contract action (deploy
+    included) and `transfer` if the tx carries native transfers
+    """
+    if action == "deed":
+        return frozenset((Operation.amend,))
+    operations = set()
+    if action is not None:
+        operations.add(Operation.execute)
+    if transfers:
+        operations.add(Operation.transfer)
+    return frozenset(operations)
+
+
+def minimal_signatories(address, deed: Optional[Deed], key_for: Callable[[Address], Optional[Identity]],
+                        operations: Iterable[Operation]) -> EntityList:
+    """
+    Minimum set of available keys meeting the thresholds of all `operations` in the deed of the address, the key
+    of the address itself if it has no deed
+
+    Signees are taken by descending voting weight until the highest of the thresholds is met, which yields
+    the fewest signatures (no k signees weigh more than the k heaviest ones). Keys are requested lazily, so
+    `key_for` is called only for signees needed (+ those whose key turns out to be unavailable).
+
+    :param key_for: Provides key of the signee, None if it is not available
+    :raises: ValueError if the deed does not permit some of the operations or available keys do not meet
+             the threshold
+    """
+    address = Address(address)
+    if deed is None:
+        signatory = key_for(address)
+        if signatory is None:
+            raise ValueError(f"No key for the {address} address is available")
+        return [signatory]
+
+    threshold = 0
+    for operation in operations:
+        operation_threshold = deed.get_threshold(operation)
+        if operation_threshold is None:
+            raise ValueError(f"Deed of the {address} address does not permit '{operation}' operation")
+        threshold = max(threshold, operation_threshold)
+
+    signatories = []
+    weight = 0
+    for signee, signee_weight in sorted(deed.votes, key=lambda v: (-v[1], str(v[0]))):
+        if signatories and weight >= threshold:
+            break
+        signatory = key_for(signee)
+        if signatory is not None:
+            signatories.append(signatory)
+            weight += signee_weight
+
+    if weight < threshold or not signatories:
+        raise ValueError(f"Available keys of the {address} deed signees have voting weight {weight}, "
+                         f"{threshold} is required")
+    return signatories
+
+
+class SignatorySelector:
+    """
+    Selects minimal signatories (`minimal_signatories`) of txs per sender address, selections are cached per
+    address & operations for as long as the deed of the address does not change
+
+    :param deeds: Deed cache, None = deeds are not looked up (offline), every address signs for itself
+    :param key_for: Provides key of the signee, None if it is not available
+    """
+    def __init__(self, deeds: Optional[DeedCache], key_for: Callable[[Address], Optional[Identity]]):
+        self.deeds = deeds
+        self.key_for = key_for
+        self._selections = {}  # type: Dict[Tuple[Address, FrozenSet[Operation]], Tuple[Optional[Deed], EntityList]]
+        self._lock = threading.Lock()
+
+    def select(self, address, operations: Iterable[Operation]) -> EntityList:
+        """
+        :raises: ValueError if the tx cannot be authorised with available keys
+        """
+        address = Address(address)
+        key = (address, frozenset(operations))
+        deed = self.deeds.get(address) if self.deeds is not None else None
+        with self._lock:
+            selection = self._selections.get(key)
+        if selection is not None and (selection[0] is deed or selection[0] == deed):
+            return selection[1]
+
+        signatories = minimal_signatories(address, deed, self.key_for, key[1])
+        with self._lock:
+            self._selections[key] = (deed, signatories)
+        return signatories
+
+
+@dataclass
+class DeedItem:
+    """
+    Deed to deploy on the address
+
+    :param deed: New deed, None removes the deed
+    """
+    address: str
+    deed: Optional[Deed]
+
+    @staticmethod
+    def from_dict(data: dict) -> 'DeedItem':
+        if not data.get("address"):
+            raise ValueError(f"Deed item {data} is missing mandatory field: address")
+        deed_data = data.get("deed", {k: data[k] for k in ("signees", "thresholds") if k in data})
+        deed = None
+        if deed_data:
+            deed = Deed.from_json(deed_data, require_amend=str(Operation.amend) in deed_data.get("thresholds", {}))
+        return DeedItem(str(data["address"]).strip(), deed)
+
+
+def read_deed_items(stream: TextIO) -> List[DeedItem]:
+    """
+    Reads JSONL deed manifest: `address` and either `deed` object or `signees` & `thresholds` keys per line
+    """
+    return [DeedItem.from_dict(json.loads(line)) for line in stream if line.strip()]
+
+
+@dataclass
+class DeedDeployResult:
+    address: str
+    digest: Optional[str] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        record = {"address": self.address, "digest": self.digest, "status": self.status}
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+def deploy_deeds_batch(api: LedgerApi, items: Iterable[DeedItem],
+                       signatories_for: Callable[[Address, FrozenSet[Operation]], EntityList],
+                       fee: int = DEFAULT_DEED_FEE, pipeline: int = 16, sign_processes: int = 0,
+                       sync: bool = True, sync_timeout: Optional[float] = 120) -> List[DeedDeployResult]:
+    """
+    Deploys deeds of many accounts in one pipelined run: txs are built & signed up front (one block number query
+    for validity period of all of them), submitted with up to `pipeline` submissions in flight and synced as one set
+
+    Cached deeds of all the addresses are invalidated once the txs are submitted (and again after sync).
+
+    :param signatories_for: Provides signatories for the deed tx of given address & `amend` operation (its key,
+                            or keys of the current deed signees meeting its `amend` threshold)
+    """
+    results = []
+    txs = []
+    for item in items:
+        result = DeedDeployResult(item.address)
+        results.append(result)
+        try:
+            address = Address(item.address)
+            if item.deed is not None:
+                item.deed.validate()
+            signatories = signatories_for(address, tx_operations("deed"))
+            txs.append((result, TokenTxFactory.deed(address, item.deed, fee, signatories), signatories))
+        except Exception as ex:
+            result.status = STATUS_SUBMIT_FAILED
+            result.error = f"{type(ex).__name__}: {ex}"
+
+    set_validity_period_batch(api, (tx for _, tx, _ in txs))
+    signed = sign_txs([(tx, signatories) for _, tx, signatories in txs], sign_processes)
+    for (result, _, _), (digest, error) in zip(txs, submit_txs_pipelined(api, signed, pipeline)):
+        result.digest = digest
+        result.status = STATUS_SUBMITTED if digest else STATUS_SUBMIT_FAILED
+        if error is not None:
+            result.error = f"{type(error).__name__}: {error}"
+        invalidate_deed(result.address)
+
+    if sync:
+        submitted = [r for r in results if r.digest]
+        statuses = sync_txs(api, (r.digest for r in submitted), timeout=sync_timeout)
+        for result in submitted:
+            status = statuses.get(result.digest)
+            result.status = status.status if status else STATUS_TIMEOUT
+            invalidate_deed(result.address)
+    return results
@@ -0,0 +1,237 @@
+import os
+import sys
+import mmap
+import struct
+import logging
+from array import array
+from typing import Optional, Iterable, Iterator, Dict, Tuple
+
+from fetchai.ledger.crypto import Address
+
+from fet_tools.status import ContractStatus, NOT_SETTLED
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Export file: header (magic + version, 16 bytes), followed by appended chunks. Chunk: header (magic, row count,
+# payload size) followed by payload holding the columns of the chunk rows one after another, each column
+# contiguous & fixed width (little endian), in order of `EXPORT_COLUMNS`, payload is padded to 8 bytes.
+# All columns start 8 bytes aligned, so they can be mapped directly (`memoryview.cast`, `numpy.frombuffer`).
+EXPORT_MAGIC = b"FETX"
+EXPORT_VERSION = 1
+CHUNK_MAGIC = b"CHNK"
+_HEADER = struct.Struct("<4sB11x")
+_CHUNK_HEADER = struct.Struct("<4sIQ")
+
+# Column name -> (`memoryview.cast` format, width in bytes). Addresses are raw 32 bytes (all zero if not known),
+# flags are 1 = true, 0 = false, -1 = not set; `valid` is 0 for contracts whose query failed (all their other
+# columns but `address` & `block` are zero then).
+EXPORT_COLUMNS = (
+    ("address", "B", Address.BYTE_LENGTH),
+    ("escrow", "B", Address.BYTE_LENGTH),
+    ("buyer", "B", Address.BYTE_LENGTH),
+    ("seller", "B", Address.BYTE_LENGTH),
+    ("balance", "Q", 8),
+    ("start", "Q", 8),
+    ("settled_since", "Q", 8),
+    ("block", "Q", 8),
+    ("buyer_ok", "b", 1),
+    ("seller_ok", "b", 1),
+    ("valid", "B", 1),
+)
+_NO_ADDRESS = bytes(Address.BYTE_LENGTH)
+# Max. number of distinct party addresses whose binary form the writer keeps (parties repeat across contracts)
+_MAX_PARTIES = 100000
+
+
+def _flag(value: Optional[bool]) -> int:
+    return -1 if value is None else int(bool(value))
+
+
+class ExportWriter:
+    """
+    Appends contract statuses to export file in chunks (one chunk per `write`), header is written when the file
+    is created. Chunk is written with a single `write` call, so readers never see incomplete chunk of a writer
+    which has not crashed.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            with open(path, 'rb') as f:
+                _check_header(f.read(_HEADER.size), path)
+        self._file = open(path, 'ab')
+        if new:
+            self._file.write(_HEADER.pack(EXPORT_MAGIC, EXPORT_VERSION))
+            self._file.flush()
+        self.rows = 0
+        self._parties = {}  # type: Dict[str, bytes]
+
+    def _party(self, value) -> bytes:
+        if value is None:
+            return _NO_ADDRESS
+        if not isinstance(value, str):
+            return bytes(Address(value))
+        raw = self._parties.get(value)
+        if raw is None:
+            if len(self._parties) >= _MAX_PARTIES:
+                self._parties.clear()
+            raw = self._parties[value] = bytes(Address(value))
+        return raw
+
+    def write(self, rows: Iterable[Tuple[str, Optional[ContractStatus], int]]) -> int:
+        """
+        :param rows: Contract address, its status (None if query failed) & block height of the query
+        :return: Number of rows written
+        """
+        columns = {name: (bytearray() if width == Address.BYTE_LENGTH else array(fmt))
+                   for name, fmt, width in EXPORT_COLUMNS}
+        count = 0
+        for address, status, block in rows:
+            columns["address"] += bytes(Address(address))
+            columns["block"].append(int(block))
+            if status is None:
+                for name in ("escrow", "buyer", "seller"):
+                    columns[name] += _NO_ADDRESS
+                for name in ("balance", "start", "settled_since", "valid"):
+                    columns[name].append(0)
+                for name in ("buyer_ok", "seller_ok"):
+                    columns[name].append(-1)
+            else:
+                for name in ("escrow", "buyer", "seller"):
+                    columns[name] += self._party(status.raw_party(name))
+                columns["balance"].append(int(status.balance or 0))
+                columns["start"].append(int(status.start or 0))
+                columns["settled_since"].append(int(status.settledSinceBlock))
+                columns["buyer_ok"].append(_flag(status.buyerOk))
+                columns["seller_ok"].append(_flag(status.sellerOk))
+                columns["valid"].append(1)
+            count += 1
+        if not count:
+            return 0
+
+        payload = bytearray()
+        for name, _, _ in EXPORT_COLUMNS:
+            column = columns[name]
+            if sys.byteorder == "big" and isinstance(column, array):
+                column.byteswap()
+            payload += column
+        payload += bytes(-len(payload) % 8)
+        self._file.write(_CHUNK_HEADER.pack(CHUNK_MAGIC, count, len(payload)) + payload)
+        self._file.flush()
+        self.rows += count
+        return count
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _check_header(header: bytes, path: str):
+    if len(header) < _HEADER.size or _HEADER.unpack(header)[0] != EXPORT_MAGIC:
+        raise ValueError(f"{path} is not a status export file")
+    version = _HEADER.unpack(header)[1]
+    if version != EXPORT_VERSION:
+        raise ValueError(f"Unsupported export file version {version}")
+
+
+class ExportChunk:
+    """
+    Columns of one chunk: `memoryview`s into the mapped file (no copy) on little endian hosts, address columns
+    are flat byte views (`party()` slices them)
+    """
+    def __init__(self, rows: int, columns: Dict[str, memoryview]):
+        self.rows = rows
+        self.columns = columns
+
+    def __len__(self):
+        return self.rows
+
+    def __getattr__(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def party(self, name: str, i: int) -> Optional[bytes]:
+        value = bytes(self.columns[name][i * Address.BYTE_LENGTH:(i + 1) * Address.BYTE_LENGTH])
+        return None if value == _NO_ADDRESS else value
+
+
+def _chunk(view: memoryview, offset: int, rows: int) -> ExportChunk:
+    columns = {}
+    for name, fmt, width in EXPORT_COLUMNS:
+        column = view[offset:offset + rows * width]
+        if width != Address.BYTE_LENGTH:
+            column = column.cast(fmt)
+            if sys.byteorder == "big" and width > 1:
+                swapped = array(fmt, column)
+                swapped.byteswap()
+                column = memoryview(swapped)
+        columns[name] = column
+        offset += rows * width
+    return ExportChunk(rows, columns)
+
+
+def read_export(path: str) -> Iterator[ExportChunk]:
+    """
+    Maps export file and yields its chunks
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= _HEADER.size:
+            _check_header(f.read(_HEADER.size), path)
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mm)
+    try:
+        _check_header(mm[:_HEADER.size], path)
+        offset = _HEADER.size
+        while offset + _CHUNK_HEADER.size <= len(mm):
+            magic, rows, size = _CHUNK_HEADER.unpack_from(mm, offset)
+            offset += _CHUNK_HEADER.size
+            if magic != CHUNK_MAGIC or offset + size > len(mm):
+                logger.warning(f"Truncated or corrupted chunk at offset {offset - _CHUNK_HEADER.size} of {path}, "
+                               f"ignoring the rest of the file")
+                break
+            yield _chunk(view, offset, rows)
+            offset += size
+    finally:
+        try:
+            view.release()
+            mm.close()
+        except BufferError:
+            # Columns are still referenced by the caller, the mapping is released together with them
+            pass
+
+
+def locked_by_escrow(path: str) -> Dict[str, Dict[str, int]]:
+    """
+    Deposited balance locked in not yet settled contracts per escrow agent, from the latest exported row of each
+    contract (the file may hold several appended snapshots)
+
+    :return: Escrow address -> `locked` balance & number of `contracts`
+    """
+    latest = {}  # type: Dict[bytes, Tuple[Optional[bytes], int]]
+    for chunk in read_export(path):
+        address, balance, settled, valid = chunk.address, chunk.balance, chunk.settled_since, chunk.valid
+        for i in range(chunk.rows):
+            if not valid[i]:
+                continue
+            key = bytes(address[i * Address.BYTE_LENGTH:(i + 1) * Address.BYTE_LENGTH])
+            latest[key] = (chunk.party("escrow", i), balance[i] if settled[i] == NOT_SETTLED else 0)
+
+    totals = {}  # type: Dict[str, Dict[str, int]]
+    for escrow, locked in latest.values():
+        if not locked:
+            continue
+        total = totals.setdefault(str(Address(escrow)) if escrow else "", {"locked": 0, "contracts": 0})
+        total["locked"] += locked
+        total["contracts"] += 1
+    return totals
+
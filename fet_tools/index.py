@@ -0,0 +1,178 @@
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional, List, Iterable, TYPE_CHECKING
+
+from fetchai.ledger.api import LedgerApi
+from fetchai.ledger.crypto import Address
+
+from fet_tools.tools import derive_contract_address
+
+if TYPE_CHECKING:
+    from fet_tools.status import ContractStatus
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+NOT_SETTLED = 0xFFFFFFFFFFFFFFFF
+ROLES = ("seller", "buyer", "escrow")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contracts (
+    address TEXT PRIMARY KEY,
+    owner TEXT,
+    nonce TEXT,
+    seller TEXT,
+    buyer TEXT,
+    escrow TEXT,
+    start INTEGER,
+    settled_since INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS contracts_owner_nonce ON contracts (owner, nonce);
+CREATE INDEX IF NOT EXISTS contracts_seller ON contracts (seller);
+CREATE INDEX IF NOT EXISTS contracts_buyer ON contracts (buyer);
+CREATE INDEX IF NOT EXISTS contracts_escrow ON contracts (escrow);
+"""
+
+
+@dataclass
+class IndexEntry:
+    address: str
+    owner: Optional[str] = None
+    nonce: Optional[str] = None
+    seller: Optional[str] = None
+    buyer: Optional[str] = None
+    escrow: Optional[str] = None
+    start: Optional[int] = None
+    settled_since: Optional[int] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.settled_since is None
+
+    @property
+    def has_parties(self) -> bool:
+        return bool(self.seller and self.buyer and self.escrow)
+
+
+class ContractIndex:
+    """
+    Persistent (SQLite) index of escrow contracts: owner + nonce -> contract address -> seller/buyer/escrow/start
+
+    Entries are recorded at deploy time and backfilled/updated from `status` queries. All lookups (by contract
+    address, by owner + nonce, by any party address) are served by indices, no chain scan is needed.
+    `settled_since` is stored as NULL while the contract is not settled (ledger uses 2^64-1 for that, which
+    does not fit into SQLite integer).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record_deployment(self, owner, nonce: str, seller, buyer, escrow=None) -> str:
+        """
+        Records deployed contract, contract address is derived from `owner` and `nonce`
+
+        :param escrow: Escrow address, defaults to `owner` (the contract `init` sets escrow to owner)
+        :return: Contract address
+        """
+        address = str(derive_contract_address(owner, nonce.encode()))
+        owner = str(Address(owner))
+        escrow = str(Address(escrow)) if escrow else owner
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO contracts (address, owner, nonce, seller, buyer, escrow) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(address) DO UPDATE SET owner=excluded.owner, nonce=excluded.nonce, "
+                "seller=excluded.seller, buyer=excluded.buyer, escrow=excluded.escrow",
+                (address, owner, nonce, str(Address(seller)), str(Address(buyer)), escrow))
+        return address
+
+    def update_from_status(self, address, status: 'ContractStatus'):
+        """
+        Inserts or updates the entry with data from contract `status` query
+        """
+        settled_since = None if status.settledSinceBlock in (None, NOT_SETTLED) else int(status.settledSinceBlock)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO contracts (address, seller, buyer, escrow, start, settled_since) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(address) DO UPDATE SET seller=excluded.seller, buyer=excluded.buyer, "
+                "escrow=excluded.escrow, start=excluded.start, settled_since=excluded.settled_since",
+                (str(Address(address)), str(status.seller), str(status.buyer), str(status.escrow),
+                 int(status.start), settled_since))
+
+    def mark_settled(self, address, block: int):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE contracts SET settled_since = ? WHERE address = ?",
+                               (int(block), str(Address(address))))
+
+    @staticmethod
+    def _entry(row: Optional[sqlite3.Row]) -> Optional[IndexEntry]:
+        return IndexEntry(**dict(row)) if row is not None else None
+
+    def get(self, address) -> Optional[IndexEntry]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM contracts WHERE address = ?", (str(Address(address)),)).fetchone()
+        return self._entry(row)
+
+    def by_owner_nonce(self, owner, nonce: str) -> Optional[IndexEntry]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM contracts WHERE owner = ? AND nonce = ?",
+                                     (str(Address(owner)), nonce)).fetchone()
+        return self._entry(row)
+
+    def by_party(self, address, roles: Iterable[str] = ROLES, open_only: bool = False) -> List[IndexEntry]:
+        """
+        Returns contracts where `address` acts in any of the `roles` (seller, buyer, escrow)
+        """
+        roles = list(roles)
+        unknown = set(roles) - set(ROLES)
+        if unknown:
+            raise ValueError(f"Unknown role(s): {', '.join(unknown)}")
+
+        address = str(Address(address))
+        # One indexed SELECT per role, so each of them uses its own index
+        query = " UNION ".join(f"SELECT * FROM contracts WHERE {role} = ?" for role in roles)
+        if open_only:
+            query = f"SELECT * FROM ({query}) WHERE settled_since IS NULL"
+        with self._lock:
+            rows = self._conn.execute(query, [address] * len(roles)).fetchall()
+        return [self._entry(r) for r in rows]
+
+    def open_addresses(self) -> List[str]:
+        """
+        Addresses of all contracts which have not been settled yet (according to the last status seen)
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT address FROM contracts WHERE settled_since IS NULL").fetchall()
+        return [r["address"] for r in rows]
+
+    def get_or_query(self, api: LedgerApi, address) -> Optional[IndexEntry]:
+        """
+        Returns the entry, lazily backfilling it from `status` query if it is missing or incomplete
+        """
+        # Imported here, so index lookups do not pay for loading of the status codec
+        from fet_tools.status import query_contract_status
+
+        entry = self.get(address)
+        if entry is not None and entry.has_parties and entry.start is not None:
+            return entry
+
+        status = query_contract_status(api, address)
+        if status is None:
+            return entry
+
+        self.update_from_status(address, status)
+        return self.get(address)
@@ -0,0 +1,272 @@
+import os
+import json
+import stat
+import socket
+import base64 as b64
+import logging
+import threading
+import socketserver
+from typing import Optional, List, Dict, Iterable, TextIO
+
+from fetchai.ledger.crypto import Entity, Address, Identity
+from fetchai.ledger.crypto.entity import _encrypt, _decrypt
+
+from fet_tools.tools import EntityList, entity_from_string
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+KEYSTORE_VERSION = 1
+
+
+class KeyProvider:
+    """
+    Source of signing entities for unattended operation, entities are loaded once and held in memory
+    """
+    def __init__(self):
+        self._by_address = None  # type: Optional[Dict[Address, Identity]]
+
+    def entities(self) -> List[Identity]:
+        raise NotImplementedError()
+
+    def get(self, address) -> Optional[Identity]:
+        """
+        Returns signing entity for the address, or None if the provider does not hold its key
+        """
+        if self._by_address is None:
+            self._by_address = {Address(e): e for e in self.entities()}
+        return self._by_address.get(Address(address))
+
+
+class KeyProviderChain(KeyProvider):
+    """
+    Combines multiple providers, the first provider holding key for given address wins
+    """
+    def __init__(self, providers: Iterable[KeyProvider]):
+        super().__init__()
+        self.providers = list(providers)
+
+    def entities(self) -> List[Identity]:
+        return [e for p in self.providers for e in p.entities()]
+
+    def get(self, address) -> Optional[Identity]:
+        for provider in self.providers:
+            entity = provider.get(address)
+            if entity is not None:
+                return entity
+        return None
+
+
+class StaticKeyProvider(KeyProvider):
+    def __init__(self, entities: Iterable[Identity]):
+        super().__init__()
+        self._entities = list(entities)
+
+    def entities(self) -> List[Identity]:
+        return self._entities
+
+
+def _parse_keys(lines: Iterable[str], source: str) -> EntityList:
+    entities = []
+    for line in lines:
+        for key in line.replace(",", " ").split():
+            entity = entity_from_string(key)
+            if entity is None:
+                raise ValueError(f"Invalid key in {source}: Unable to parse the key.")
+            entities.append(entity)
+    return entities
+
+
+class EnvKeyProvider(StaticKeyProvider):
+    """
+    Private keys (hex or base64) separated by comma or whitespace in environment variable
+    """
+    def __init__(self, variable: str = "ESCROW_PRIVATE_KEYS"):
+        value = os.environ.get(variable)
+        if value is None:
+            raise ValueError(f"Environment variable {variable} is not set")
+        super().__init__(_parse_keys([value], f"{variable} env. variable"))
+
+
+class StreamKeyProvider(StaticKeyProvider):
+    """
+    Private keys (hex or base64) read from file descriptor (e.g. `3<keys.txt`) or file, one or more per line
+    """
+    def __init__(self, stream: TextIO):
+        super().__init__(_parse_keys(stream, getattr(stream, "name", "key stream")))
+
+    @staticmethod
+    def from_fd(fd: int) -> 'StreamKeyProvider':
+        with os.fdopen(fd, 'r') as stream:
+            return StreamKeyProvider(stream)
+
+    @staticmethod
+    def from_file(path: str) -> 'StreamKeyProvider':
+        with open(path, 'r') as stream:
+            return StreamKeyProvider(stream)
+
+
+def write_keystore(path: str, entities: Iterable[Entity], password: str):
+    """
+    Writes keystore file with all private keys encrypted together (key derivation is paid once per unlock)
+    """
+    if not Entity.is_strong_password(password):
+        raise ValueError("Password is too weak")
+
+    entities = list(entities)
+    plaintext = json.dumps([e.private_key for e in entities]).encode()
+    encrypted, length, init_vec, salt = _encrypt(password, plaintext)
+    keystore = {
+        "version": KEYSTORE_VERSION,
+        "addresses": [str(Address(e)) for e in entities],
+        "key_length": length,
+        "init_vector": b64.b64encode(init_vec).decode(),
+        "password_salt": b64.b64encode(salt).decode(),
+        "keys": b64.b64encode(encrypted).decode(),
+    }
+    with open(path, 'w') as f:
+        json.dump(keystore, f, indent=4)
+
+
+def read_keystore(path: str, password: str) -> EntityList:
+    with open(path, 'r') as f:
+        keystore = json.load(f)
+
+    if keystore.get("version") != KEYSTORE_VERSION:
+        raise ValueError(f"Unsupported keystore version {keystore.get('version')}")
+
+    plaintext = _decrypt(password,
+                         b64.b64decode(keystore["password_salt"]),
+                         b64.b64decode(keystore["keys"]),
+                         keystore["key_length"],
+                         b64.b64decode(keystore["init_vector"]))
+    try:
+        keys = json.loads(plaintext.decode())
+    except (UnicodeDecodeError, ValueError):
+        raise ValueError("Unable to unlock the keystore: invalid password")
+
+    entities = [Entity.from_base64(k) for k in keys]
+    if [str(Address(e)) for e in entities] != keystore["addresses"]:
+        raise ValueError("Keystore is corrupted: keys do not match the addresses")
+    return entities
+
+
+class KeystoreProvider(StaticKeyProvider):
+    """
+    Encrypted keystore file (see `write_keystore`), unlocked once with the password
+    """
+    def __init__(self, path: str, password: str):
+        super().__init__(read_keystore(path, password))
+
+
+class RemoteSigner(Identity):
+    """
+    Identity signing through signer agent, private key never leaves the agent process
+    """
+    def __init__(self, public_key: bytes, client: 'SignerAgentClient'):
+        super().__init__(public_key)
+        self._client = client
+
+    def sign(self, message: bytes) -> bytes:
+        return self._client.sign(self.public_key_bytes, message)
+
+
+class SignerAgentClient(KeyProvider):
+    """
+    Client of the signer agent listening on unix socket (see `SignerAgent`)
+    """
+    def __init__(self, socket_path: str):
+        super().__init__()
+        self.socket_path = socket_path
+        self._sock = None  # type: Optional[socket.socket]
+        self._reader = None
+        self._lock = threading.Lock()
+        self._entities = None  # type: Optional[List[RemoteSigner]]
+
+    def _request(self, request: dict) -> dict:
+        with self._lock:
+            if self._sock is None:
+                self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._sock.connect(self.socket_path)
+                self._reader = self._sock.makefile('r')
+
+            self._sock.sendall((json.dumps(request) + "\n").encode())
+            line = self._reader.readline()
+
+        if not line:
+            raise ConnectionError("Signer agent closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(f"Signer agent: {response['error']}")
+        return response
+
+    def entities(self) -> List[Identity]:
+        if self._entities is None:
+            response = self._request({"op": "list"})
+            self._entities = [RemoteSigner(b64.b64decode(k), self) for k in response["public_keys"]]
+        return self._entities
+
+    def sign(self, public_key: bytes, message: bytes) -> bytes:
+        response = self._request({"op": "sign",
+                                  "public_key": b64.b64encode(public_key).decode(),
+                                  "payload": b64.b64encode(message).decode()})
+        return b64.b64decode(response["signature"])
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None:
+                self._reader.close()
+                self._sock.close()
+                self._sock = None
+
+
+class _SignerAgentHandler(socketserver.StreamRequestHandler):
+    def _handle_request(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "list":
+            return {"public_keys": [e.public_key for e in self.server.signatories.values()]}
+        elif op == "sign":
+            entity = self.server.signatories.get(b64.b64decode(request["public_key"]))
+            if entity is None:
+                return {"error": "Unknown key"}
+            return {"signature": b64.b64encode(entity.sign(b64.b64decode(request["payload"]))).decode()}
+        return {"error": f"Unknown operation {op}"}
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self._handle_request(json.loads(line))
+            except Exception as ex:
+                response = {"error": f"{type(ex).__name__}: {ex}"}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+
+
+class SignerAgent(socketserver.ThreadingUnixStreamServer):
+    """
+    Holds signing entities in memory and signs payloads on request of local processes over unix socket
+
+    Protocol: one JSON object per line, `{"op": "list"}` -> `{"public_keys": [...]}`,
+    `{"op": "sign", "public_key": <b64>, "payload": <b64>}` -> `{"signature": <b64>}`.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, entities: Iterable[Entity]):
+        """
+        :raises: ValueError if `socket_path` exists and is not a socket (e.g. mistyped path of a key file)
+        """
+        if os.path.lexists(socket_path):
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise ValueError(f"{socket_path} exists and is not a socket, refusing to replace it")
+            # Stale socket of previous agent
+            os.unlink(socket_path)
+        self.signatories = {e.public_key_bytes: e for e in entities}  # type: Dict[bytes, Entity]
+
+        super().__init__(socket_path, _SignerAgentHandler, bind_and_activate=False)
+        try:
+            self.server_bind()
+            # Socket is accessible by the owner only, restricted before it starts accepting connections
+            os.chmod(socket_path, 0o600)
+            self.server_activate()
+        except BaseException:
+            self.server_close()
+            raise
@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import functools
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Optional, Dict, TextIO, Callable
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Upper bounds of latency histogram buckets in [ms], the last bucket is unbounded
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Operations of `LedgerApi` & its endpoints which are instrumented: attribute -> operation name
+API_OPERATIONS = {
+    "submit_signed_tx": "submit",
+    "sync": "sync",
+    "set_validity_period": "set_validity_period",
+}
+ENDPOINT_OPERATIONS = {
+    "tokens": {
+        "balance": "balance",
+        "query_deed": "deed",
+        "deed": "deed_deploy",
+        "submit_signed_tx": "submit",
+        "current_block_number": "block_number",
+    },
+    "contracts": {
+        "query": "query",
+    },
+    "tx": {
+        "status": "tx_status",
+    },
+}
+
+
+class Histogram:
+    """
+    Latency histogram with fixed log-scale buckets (`BUCKET_BOUNDS_MS`), percentiles are estimated as upper
+    bound of the bucket they fall into
+    """
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, elapsed_ms: float):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, elapsed_ms)] += 1
+        self.count += 1
+        self.total += elapsed_ms
+        if elapsed_ms > self.max:
+            self.max = elapsed_ms
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                return BUCKET_BOUNDS_MS[bucket] if bucket < len(BUCKET_BOUNDS_MS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max, 4),
+            "buckets": {("inf" if i == len(BUCKET_BOUNDS_MS) else str(BUCKET_BOUNDS_MS[i])): c
+                        for i, c in enumerate(self.counts) if c},
+        }
+
+
+class OperationStats:
+    __slots__ = ("latency", "errors", "retries")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = defaultdict(int)  # type: Dict[str, int]
+        self.retries = 0
+
+    def to_dict(self) -> dict:
+        data = self.latency.to_dict()
+        data["errors"] = sum(self.errors.values())
+        data["errors_by_type"] = dict(self.errors)
+        data["retries"] = self.retries
+        return data
+
+
+class Metrics:
+    """
+    Latency histograms, error & retry counts per ledger operation, optionally with trace spans
+
+    :param trace: Optional text stream trace spans are written to as JSONL (one span per operation, carrying
+                  contract address and tx digest where the operation has them)
+    """
+    def __init__(self, trace: Optional[TextIO] = None):
+        self.trace = trace
+        self.started = time.time()
+        self._operations = defaultdict(OperationStats)  # type: Dict[str, OperationStats]
+        self._lock = threading.Lock()
+
+    def observe(self, operation: str, elapsed: float, error: Optional[str] = None, **attributes):
+        """
+        Records one operation
+
+        :param elapsed: Duration of the operation in [s]
+        :param error: Type of error the operation failed with, None if it succeeded
+        :param attributes: Span attributes (e.g. `contract_address`, `digest`), used only if tracing is enabled
+        """
+        with self._lock:
+            stats = self._operations[operation]
+            stats.latency.observe(elapsed * 1000)
+            if error is not None:
+                stats.errors[error] += 1
+            if self.trace is not None:
+                span = {"operation": operation, "start": round(time.time() - elapsed, 6),
+                        "duration_ms": round(elapsed * 1000, 4)}
+                span.update((k, v) for k, v in attributes.items() if v is not None)
+                if error is not None:
+                    span["error"] = error
+                self.trace.write(json.dumps(span) + "\n")
+
+    def retry(self, operation: str, count: int = 1):
+        with self._lock:
+            self._operations[operation].retries += count
+
+    @contextmanager
+    def timed(self, operation: str, **attributes):
+        """
+        Records duration of the block as the `operation`, failed if the block raises
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as ex:
+            self.observe(operation, time.perf_counter() - started, type(ex).__name__, **attributes)
+            raise
+        self.observe(operation, time.perf_counter() - started, **attributes)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "started": int(self.started),
+                "timestamp": int(time.time()),
+                "operations": {op: stats.to_dict() for op, stats in sorted(self._operations.items())},
+            }
+
+    def save(self, path: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+        os.replace(tmp, path)
+
+    def flush(self):
+        if self.trace is not None:
+            with self._lock:
+                self.trace.flush()
+
+
+class MetricsDumper(threading.Thread):
+    """
+    Periodically writes metrics to JSON file (atomically replaced) and flushes trace spans, the last dump
+    is written on `stop()`
+
+    :param path: JSON file to write metrics to, None = only trace spans are flushed
+    """
+    def __init__(self, metrics: Metrics, path: Optional[str], interval: float = 10.0):
+        super().__init__(name="metrics-dumper", daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self._dump()
+
+    def _dump(self):
+        try:
+            if self.path:
+                self.metrics.save(self.path)
+            self.metrics.flush()
+        except OSError as ex:
+            logger.warning(f"Unable to write metrics to {self.path}: {ex}")
+
+    def stop(self):
+        self._stopped.set()
+        self._dump()
+
+
+_metrics = None  # type: Optional[Metrics]
+
+
+def enable_metrics(metrics: Optional[Metrics]):
+    """
+    Sets process-wide metrics (None disables them) used by `fet_tools` for operations not going through
+    `InstrumentedLedgerApi` (connect, retries, `sync_txs`)
+    """
+    global _metrics
+    _metrics = metrics
+
+
+def get_metrics() -> Optional[Metrics]:
+    return _metrics
+
+
+def _span_attributes(operation: str, args: tuple, result) -> dict:
+    if operation == "query":
+        return {"contract_address": str(args[0]), "query": args[1] if len(args) > 1 else None} if args else {}
+    if operation in ("balance", "deed"):
+        return {"address": str(args[0])} if args else {}
+    if operation == "submit":
+        tx = args[0] if args else None
+        contract_address = getattr(tx, "contract_address", None)
+        return {"contract_address": str(contract_address) if contract_address is not None else None,
+                "action": getattr(tx, "action", None), "digest": result}
+    if operation == "tx_status":
+        return {"digest": args[0]} if args else {}
+    if operation == "sync" and args:
+        digests = [args[0]] if isinstance(args[0], str) else list(args[0])
+        return {"digest": digests[0] if len(digests) == 1 else None, "txs": len(digests)}
+    return {}
+
+
+def _instrument(metrics: Metrics, operation: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as ex:
+            elapsed = time.perf_counter() - started
+            attributes = _span_attributes(operation, args, None) if metrics.trace is not None else {}
+            metrics.observe(operation, elapsed, type(ex).__name__, **attributes)
+            raise
+        elapsed = time.perf_counter() - started
+
+        # Contract queries report failure in the result rather than by exception
+        error = None
+        if operation == "query" and not (result and result[0]):
+            error = "QueryFailed"
+        attributes = _span_attributes(operation, args, result) if metrics.trace is not None else {}
+        metrics.observe(operation, elapsed, error, **attributes)
+        return result
+    return wrapper
+
+
+class _InstrumentedEndpoint:
+    def __init__(self, endpoint, metrics: Metrics, operations: Dict[str, str]):
+        self._endpoint = endpoint
+        for name, operation in operations.items():
+            func = getattr(endpoint, name, None)
+            if callable(func):
+                setattr(self, name, _instrument(metrics, operation, func))
+
+    def __getattr__(self, name):
+        return getattr(self._endpoint, name)
+
+
+class InstrumentedLedgerApi:
+    """
+    Proxy of `LedgerApi` (or stub/simulated ledger) recording every ledger operation to `metrics`
+
+    Only the proxy is instrumented, the wrapped api is untouched, so there is no overhead at all when
+    instrumentation is disabled (the api is simply not wrapped).
+    """
+    def __init__(self, api, metrics: Metrics):
+        self._api = api
+        self.metrics = metrics
+        for name, operation in API_OPERATIONS.items():
+            func = getattr(api, name, None)
+            if callable(func):
+                setattr(self, name, _instrument(metrics, operation, func))
+        for endpoint, operations in ENDPOINT_OPERATIONS.items():
+            if hasattr(api, endpoint):
+                setattr(self, endpoint, _InstrumentedEndpoint(getattr(api, endpoint), metrics, operations))
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+
+def instrument(api, metrics: Optional[Metrics] = None):
+    """
+    Wraps the api with `InstrumentedLedgerApi` if metrics are given (or enabled process-wide), returns the api
+    as is otherwise
+    """
+    metrics = metrics if metrics is not None else get_metrics()
+    if metrics is None or isinstance(api, InstrumentedLedgerApi):
+        return api
+    return InstrumentedLedgerApi(api, metrics)
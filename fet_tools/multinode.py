@@ -0,0 +1,321 @@
+import time
+import random
+import logging
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Dict, List, Tuple
+
+from fet_tools.client import LedgerClient, Backoff, TRANSIENT_ERRORS
+from fet_tools.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_PORT = 8000
+DEFAULT_HEALTH_INTERVAL = 10.0
+DEFAULT_REQUEST_TIMEOUT = 30.0
+DEFAULT_CONNECT_DEADLINE = 3.0
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_MAX_LAG = 10
+# Weight of the latest sample in the moving average of endpoint latency
+LATENCY_ALPHA = 0.2
+
+# Errors of the node (connection refused, timeout, failed connect) after which the call moves to another node
+FAILOVER_ERRORS = TRANSIENT_ERRORS + (ConnectionError,)
+
+READ = "read"
+SUBMIT = "submit"
+SINGLE = "single"
+
+# Routing of `LedgerApi` operations: reads are spread across nodes, submits go to the fastest node. Both move to
+# another node on `FAILOVER_ERRORS` (re-submitted signed tx has the same digest, so the ledger executes it once).
+# `single` operations are not repeated on another node (deed deployment builds new tx on every call).
+API_ROUTES = {
+    "submit_signed_tx": SUBMIT,
+    "sync": READ,
+    "set_validity_period": READ,
+    "wait_for_blocks": READ,
+}
+ENDPOINT_ROUTES = {
+    "tokens": {
+        "balance": READ,
+        "query_deed": READ,
+        "current_block_number": READ,
+        "submit_signed_tx": SUBMIT,
+        "deed": SINGLE,
+    },
+    "contracts": {
+        "query": READ,
+    },
+    "tx": {
+        "status": READ,
+    },
+}
+
+
+def parse_endpoints(spec: str) -> List[Tuple[str, int]]:
+    """
+    Parses comma separated list of `host[:port]` ledger endpoints
+
+    :raises: ValueError for malformed entry
+    """
+    endpoints = []
+    for entry in (e.strip() for e in spec.split(",")):
+        if not entry:
+            continue
+        host, _, port = entry.rpartition(":") if ":" in entry else (entry, "", str(DEFAULT_PORT))
+        if not host or not port.isdigit():
+            raise ValueError(f'Malformed ledger endpoint "{entry}", expected host[:port]')
+        endpoints.append((host, int(port)))
+    if not endpoints:
+        raise ValueError("No ledger endpoint given")
+    return endpoints
+
+
+class Endpoint:
+    """
+    One ledger node: its api (connected lazily by `connect`), health and request statistics
+
+    Node is `up` until `max_failures` consecutive calls fail with `FAILOVER_ERRORS`, it is up again after the next
+    successful call or health check. It is `lagging` if its block number falls behind the most advanced node by more
+    than `max_lag` blocks (see `MultiNodeLedgerApi.check_health`).
+    """
+    def __init__(self, name: str, api=None, connect: Optional[Callable] = None,
+                 max_failures: int = DEFAULT_MAX_FAILURES):
+        if api is None and connect is None:
+            raise ValueError("Either api or connect function of the endpoint is required")
+        self.name = name
+        self.max_failures = max_failures
+        self.up = True
+        self.lagging = False
+        self.block = None  # type: Optional[int]
+        self.latency = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.failovers = 0
+        self.in_flight = 0
+        self.last_error = None  # type: Optional[str]
+        self.histogram = Histogram()
+        self._api = api
+        self._connect = connect
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def api(self):
+        if self._api is None:
+            with self._lock:
+                if self._api is None:
+                    self._api = self._connect()
+        return self._api
+
+    @property
+    def healthy(self) -> bool:
+        return self.up and not self.lagging
+
+    @property
+    def score(self) -> float:
+        """
+        Expected latency of the next call, the lower the better
+        """
+        return self.latency * (1 + self.in_flight)
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def finish(self, elapsed: float, error: Optional[Exception] = None, failover: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            self._observe(elapsed)
+            if error is None:
+                self._failures = 0
+                self.up = True
+                return
+            self.errors += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            if failover:
+                self.failovers += 1
+                self._failures += 1
+                if self._failures >= self.max_failures and self.up:
+                    logger.warning(f"Ledger node {self.name} is down: {self.last_error}")
+                    self.up = False
+
+    def _observe(self, elapsed: float):
+        self.histogram.observe(elapsed * 1000)
+        self.latency = elapsed if self.histogram.count == 1 else \
+            LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * self.latency
+
+    def checked(self, elapsed: float, block: Optional[int], error: Optional[Exception] = None):
+        """
+        Records result of health check
+        """
+        with self._lock:
+            if error is None:
+                self._observe(elapsed)
+                self._failures = 0
+                self.up = True
+                self.block = block
+            else:
+                self.up = False
+                self.last_error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            latency = self.histogram.to_dict()
+            latency.pop("buckets", None)
+            return {"healthy": self.healthy, "up": self.up, "lagging": self.lagging, "block": self.block,
+                    "requests": self.requests, "errors": self.errors, "failovers": self.failovers,
+                    "in_flight": self.in_flight, "latency_ewma_ms": round(self.latency * 1000, 3),
+                    "latency": latency, "last_error": self.last_error}
+
+
+class _RoutedEndpoint:
+    def __init__(self, multi: 'MultiNodeLedgerApi', group: str, routes: Dict[str, str]):
+        self._multi = multi
+        self._group = group
+        for name, kind in routes.items():
+            setattr(self, name, functools.partial(multi.call, kind, group, name))
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(getattr(self._multi.primary.api, self._group), name)
+
+
+class MultiNodeLedgerApi:
+    """
+    `LedgerApi` spreading calls over several ledger nodes: reads go to one of two randomly picked healthy nodes
+    (the one with lower expected latency, so load is spread and slow nodes get less of it), submits go to the
+    fastest healthy node, and both fail over to the other nodes (fastest first, unhealthy ones last) when a node
+    is unreachable or times out. Other attributes are taken from the fastest healthy node.
+
+    :param endpoints: Nodes, e.g. `Endpoint(name, api)` over `fet_tools.stub.StubNode`s for tests
+    :param max_lag: Max. number of blocks node may fall behind the most advanced one and still be healthy
+    """
+    def __init__(self, endpoints: List[Endpoint], max_lag: int = DEFAULT_MAX_LAG):
+        if not endpoints:
+            raise ValueError("At least one ledger endpoint is required")
+        self.endpoints = endpoints
+        self.max_lag = max_lag
+        self._stop = threading.Event()
+        self._health_thread = None  # type: Optional[threading.Thread]
+        for name, kind in API_ROUTES.items():
+            setattr(self, name, functools.partial(self.call, kind, None, name))
+        for group, routes in ENDPOINT_ROUTES.items():
+            setattr(self, group, _RoutedEndpoint(self, group, routes))
+
+    @classmethod
+    def connect(cls, endpoints: List[Tuple[str, int]], request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                connect_deadline: float = DEFAULT_CONNECT_DEADLINE, **kwargs) -> 'MultiNodeLedgerApi':
+        """
+        Multi-node api over `(host, port)` ledger nodes, each connected lazily on its first use
+
+        :param request_timeout: Timeout of single HTTP request in [s], the call fails over to another node then
+        :param connect_deadline: Time budget in [s] for connecting to a node
+        """
+        nodes = []
+        for host, port in endpoints:
+            client = LedgerClient(host=host, port=port, request_timeout=request_timeout,
+                                  connect_backoff=Backoff(initial=0.1, maximum=1.0, deadline=connect_deadline))
+            nodes.append(Endpoint(f"{host}:{port}", connect=lambda client=client: client.api))
+        return cls(nodes, **kwargs)
+
+    @property
+    def primary(self) -> Endpoint:
+        return self._candidates(SUBMIT)[0]
+
+    def _candidates(self, kind: str) -> List[Endpoint]:
+        healthy = [e for e in self.endpoints if e.healthy]
+        others = sorted((e for e in self.endpoints if not e.healthy), key=lambda e: e.score)
+        healthy.sort(key=lambda e: e.score)
+        if kind == READ and len(healthy) > 1:
+            first, second = random.sample(range(len(healthy)), 2)
+            healthy.insert(0, healthy.pop(min(first, second)))
+        return healthy + others
+
+    def call(self, kind: str, group: Optional[str], name: str, *args, **kwargs):
+        """
+        Calls `name` operation (of `group` endpoint of the api, e.g. `tokens`) on the nodes in order of
+        preference until one of them does not fail with `FAILOVER_ERRORS`
+        """
+        candidates = self._candidates(kind)
+        if kind == SINGLE:
+            candidates = candidates[:1]
+        for i, endpoint in enumerate(candidates):
+            endpoint.begin()
+            started = time.perf_counter()
+            try:
+                target = endpoint.api if group is None else getattr(endpoint.api, group)
+                result = getattr(target, name)(*args, **kwargs)
+            except FAILOVER_ERRORS as ex:
+                endpoint.finish(time.perf_counter() - started, ex, failover=True)
+                if i + 1 == len(candidates):
+                    raise
+                logger.warning(f"Ledger node {endpoint.name} failed ({type(ex).__name__}: {ex}), "
+                               f"retrying {name} on {candidates[i + 1].name}")
+                continue
+            except Exception as ex:
+                endpoint.finish(time.perf_counter() - started, ex)
+                raise
+            endpoint.finish(time.perf_counter() - started)
+            return result
+
+    def _check(self, endpoint: Endpoint):
+        started = time.perf_counter()
+        try:
+            block = endpoint.api.tokens.current_block_number()
+        except Exception as ex:
+            endpoint.checked(time.perf_counter() - started, None, ex)
+            return
+        endpoint.checked(time.perf_counter() - started, block)
+
+    def check_health(self) -> Dict[str, dict]:
+        """
+        Queries block number of all nodes concurrently: unreachable nodes are marked down, nodes behind the most
+        advanced one by more than `max_lag` blocks as lagging
+
+        :return: Endpoint statistics (see `stats`)
+        """
+        with ThreadPoolExecutor(max_workers=len(self.endpoints)) as executor:
+            list(executor.map(self._check, self.endpoints))
+        heights = [e.block for e in self.endpoints if e.up and e.block is not None]
+        top = max(heights, default=None)
+        for endpoint in self.endpoints:
+            endpoint.lagging = endpoint.up and top is not None and endpoint.block is not None and \
+                top - endpoint.block > self.max_lag
+        return self.stats()
+
+    def start_health_checks(self, interval: float = DEFAULT_HEALTH_INTERVAL):
+        """
+        Runs `check_health` in background thread every `interval` seconds, until `close()`
+        """
+        def run():
+            while True:
+                try:
+                    self.check_health()
+                except Exception as ex:
+                    logger.warning(f"Health check of ledger nodes failed: {ex}")
+                if self._stop.wait(interval):
+                    return
+
+        self._health_thread = threading.Thread(target=run, name="ledger-health", daemon=True)
+        self._health_thread.start()
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Health, request & error counts and latency per endpoint
+        """
+        return {endpoint.name: endpoint.to_dict() for endpoint in self.endpoints}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.primary.api, name)
+
+    def close(self):
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
@@ -0,0 +1,216 @@
+import io
+import os
+import json
+import struct
+import logging
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Iterator, Iterable, List, TextIO, Dict, NamedTuple
+
+from fetchai.ledger.api import LedgerApi
+from fetchai.ledger.serialisation import transaction as tx_codec
+from fetchai.ledger.transaction import Transaction
+
+from fet_tools.tools import sync_txs
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Batch file: header (magic + version), followed by records: action code (u8), length (u32, big endian), tx bytes
+# as encoded by `fetchai.ledger.serialisation.transaction.encode_transaction`
+BATCH_MAGIC = b"FETB"
+BATCH_VERSION = 1
+_HEADER = struct.Struct(">4sB")
+_RECORD = struct.Struct(">BI")
+
+# Contract action <-> code of the record in batch file
+ACTION_CODES = {
+    "deploy": 0,
+    "deposit": 1,
+    "accept": 2,
+    "cancel": 3,
+    "kill": 4,
+    "withdrawExcessBalance": 5,
+}
+ACTIONS_BY_CODE = {code: action for action, code in ACTION_CODES.items()}
+
+STATUS_SUBMITTED = "Submitted"
+STATUS_SUBMIT_FAILED = "SubmitFailed"
+STATUS_EXPIRED = "Expired"
+STATUS_TIMEOUT = "Timeout"
+
+
+def set_validity_window(tx: Transaction, valid_from: int, valid_until: int):
+    """
+    Sets explicit validity window of the tx (offline replacement of `api.set_validity_period`)
+    """
+    if valid_until <= valid_from:
+        raise ValueError(f"Invalid validity window [{valid_from}, {valid_until}): valid_until must be above valid_from")
+    tx.valid_from = valid_from
+    tx.valid_until = valid_until
+
+
+class BatchWriter:
+    """
+    Appends signed txs to binary batch file, header is written when the file is created
+    """
+    def __init__(self, path: str):
+        self.path = path
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'ab')
+        if new:
+            self._file.write(_HEADER.pack(BATCH_MAGIC, BATCH_VERSION))
+        self.count = 0
+
+    def write(self, action: str, tx: Transaction):
+        if action not in ACTION_CODES:
+            raise ValueError(f'Unknown action "{action}"')
+        if not tx.is_valid():
+            raise ValueError("Transaction is not completely and validly signed")
+        data = tx_codec.encode_transaction(tx)
+        self._file.write(_RECORD.pack(ACTION_CODES[action], len(data)))
+        self._file.write(data)
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class BatchRecord(NamedTuple):
+    action: str
+    tx: Transaction
+    verified: bool
+
+
+def read_batch(path: str) -> Iterator[BatchRecord]:
+    """
+    Streams records from batch file, signatures of each tx are verified as it is decoded
+    """
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size or _HEADER.unpack(header)[0] != BATCH_MAGIC:
+            raise ValueError(f"{path} is not a tx batch file")
+        version = _HEADER.unpack(header)[1]
+        if version != BATCH_VERSION:
+            raise ValueError(f"Unsupported batch file version {version}")
+
+        while True:
+            record = f.read(_RECORD.size)
+            if not record:
+                break
+            if len(record) < _RECORD.size:
+                raise ValueError(f"Truncated record in {path}")
+            code, length = _RECORD.unpack(record)
+            data = f.read(length)
+            if len(data) < length:
+                raise ValueError(f"Truncated record in {path}")
+            verified, tx = tx_codec.decode_transaction(io.BytesIO(data))
+            yield BatchRecord(ACTIONS_BY_CODE.get(code, str(code)), tx, verified)
+
+
+@dataclass
+class SubmitResult:
+    index: int
+    action: str
+    digest: Optional[str] = None
+    status: str = STATUS_SUBMITTED
+    error: Optional[str] = None
+    fee: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        record = {"index": self.index, "action": self.action, "digest": self.digest, "status": self.status}
+        if self.fee is not None:
+            record["fee"] = self.fee
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+def _submit_one(api: LedgerApi, index: int, record: BatchRecord, block: int) -> SubmitResult:
+    result = SubmitResult(index, record.action)
+    tx = record.tx
+    if not record.verified:
+        result.status = STATUS_SUBMIT_FAILED
+        result.error = "Signature verification failed"
+        return result
+    if block >= tx.valid_until:
+        result.status = STATUS_EXPIRED
+        result.error = f"Validity window [{tx.valid_from}, {tx.valid_until}) has passed, current block {block}"
+        return result
+    try:
+        # Signatures have been verified when the record was decoded, so `LedgerApi.submit_signed_tx` verification
+        # is bypassed
+        result.digest = api.tokens.submit_signed_tx(tx)
+    except Exception as ex:
+        result.status = STATUS_SUBMIT_FAILED
+        result.error = f"{type(ex).__name__}: {ex}"
+    return result
+
+
+def submit_batch(api: LedgerApi, records: Iterable[BatchRecord], pipeline: int = 16,
+                 sync: bool = False, sync_timeout: Optional[float] = 120,
+                 report: Optional[TextIO] = None) -> List[SubmitResult]:
+    """
+    Submits pre-signed txs with up to `pipeline` submissions in flight
+
+    Records are consumed lazily (the batch file is streamed). Txs whose validity window has already passed
+    (according to a single current block query) are not submitted.
+
+    :param sync: Wait for execution of all submitted txs and report their final status & fee
+    :param report: Optional text stream JSONL report is written to: one record per tx as soon as it is submitted
+                   and, with `sync`, one more record per submitted tx with its final status (the latest wins)
+    :return: Results in order of the records
+    """
+    block = api.tokens.current_block_number()
+    results = []  # type: List[SubmitResult]
+    pending = set()
+    records = enumerate(records)
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=pipeline) as executor:
+        while pending or not exhausted:
+            while not exhausted and len(pending) < 2 * pipeline:
+                record = next(records, None)
+                if record is None:
+                    exhausted = True
+                else:
+                    index, batch_record = record
+                    pending.add(executor.submit(_submit_one, api, index, batch_record, block))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results.append(future.result())
+                _write_report(report, [results[-1]])
+
+    results.sort(key=lambda r: r.index)
+    if sync:
+        statuses = sync_txs(api, (r.digest for r in results if r.digest), timeout=sync_timeout)
+        synced = [r for r in results if r.digest]
+        for result in synced:
+            status = statuses.get(result.digest)
+            result.status = status.status if status else STATUS_TIMEOUT
+            result.fee = status.fee if status else None
+        _write_report(report, synced)
+    return results
+
+
+def _write_report(report: Optional[TextIO], results: Iterable[SubmitResult]):
+    if report is None:
+        return
+    for result in results:
+        report.write(json.dumps(result.to_dict()) + "\n")
+    report.flush()
+
+
+def summarize(results: Iterable[SubmitResult]) -> Dict[str, int]:
+    summary = {}
+    for result in results:
+        summary[result.status] = summary.get(result.status, 0) + 1
+    return summary
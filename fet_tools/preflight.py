@@ -0,0 +1,187 @@
+import time
+import logging
+import threading
+from typing import Optional, Iterable, Dict, List, Tuple
+
+from fetchai.ledger.api import LedgerApi
+from fetchai.ledger.crypto import Address
+
+from fet_tools.status import ContractStatus, NOT_SETTLED, StatusResult, query_contract_status, query_status_many
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_STATUS_TTL = 300.0
+
+# Messages of the `escrow.etch` asserts checked locally
+MSG_INIT_TRANSFERS = "There must be 2 native transfers defined in the transaction."
+MSG_NOT_ACTIVE = "Contract has been settled and is no more active."
+MSG_DEPOSIT_TRANSFERS = "There must be 1 native transfers defined in the transaction."
+MSG_DEPOSIT_DESTINATION = "Transfer destination address must be contract address."
+MSG_DEPOSIT_SENDER = "Deposit must be done from buyer address."
+MSG_NOT_OWNER = "Tx sender must be owner address of the contract."
+
+# Contract action -> its asserts in order: contract is active, sender is the escrow, deposit transfer & sender
+_ACTION_ASSERTS = {
+    "accept": ("active",),
+    "cancel": ("active",),
+    "deposit": ("active", "deposit"),
+    "kill": ("owner", "active"),
+    "withdrawExcessBalance": ("owner",),
+}
+
+
+def check_deploy(transfers: Optional[List[Tuple[Address, int]]]) -> Optional[str]:
+    """
+    Checks deployment tx against asserts of the contract `init`
+
+    :return: Message of the assert the tx would fail, None if it passes
+    """
+    if len(transfers or ()) != 2:
+        return MSG_INIT_TRANSFERS
+    return None
+
+
+def check_action(contract_address, action: str, from_address, transfers: Optional[List[Tuple[Address, int]]],
+                 status: Optional[ContractStatus]) -> Optional[str]:
+    """
+    Checks contract action tx against asserts of the action in `escrow.etch`, in the order the contract checks
+    them. Parties of a contract never change and settlement is final, so status however old never rejects tx which
+    would pass (stale status may only let through tx which will fail). Transfer destination is checked for
+    `deposit` even without status.
+
+    :param status: Last known status of the contract, only status independent asserts are checked if None
+    :return: Message of the assert the tx would fail, None if it passes (or can not be checked)
+    """
+    transfers = transfers or []
+    for check in _ACTION_ASSERTS.get(action, ()):
+        if check == "active":
+            if status is not None and int(status.settledSinceBlock) != NOT_SETTLED:
+                return MSG_NOT_ACTIVE
+        elif check == "owner":
+            if status is not None and status.escrow is not None and str(from_address) != str(status.escrow):
+                return MSG_NOT_OWNER
+        elif check == "deposit":
+            if len(transfers) != 1:
+                return MSG_DEPOSIT_TRANSFERS
+            if str(transfers[0][0]) != str(contract_address):
+                return MSG_DEPOSIT_DESTINATION
+            if status is not None and status.buyer is not None and str(from_address) != str(status.buyer):
+                return MSG_DEPOSIT_SENDER
+    return None
+
+
+class StatusCache:
+    """
+    Cache of contract statuses with time-to-live, failed queries are not cached
+
+    :param ttl: Time-to-live of the entries in [s]
+    :param parallelism: Max. number of concurrent queries of `get_many`
+    """
+    def __init__(self, api: LedgerApi, ttl: float = DEFAULT_STATUS_TTL, parallelism: int = 16):
+        self.api = api
+        self.ttl = ttl
+        self.parallelism = parallelism
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # type: Dict[str, Tuple[float, ContractStatus]]
+        self._lock = threading.Lock()
+
+    def _lookup(self, address: str) -> Optional[ContractStatus]:
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, address, status: ContractStatus):
+        with self._lock:
+            self._entries[str(address)] = (time.monotonic() + self.ttl, status)
+
+    def get(self, address) -> Optional[ContractStatus]:
+        """
+        :return: Status of the contract, None if its query failed
+        """
+        address = str(address)
+        status = self._lookup(address)
+        if status is None:
+            status = query_contract_status(self.api, address)
+            if status is not None:
+                self.put(address, status)
+        return status
+
+    def get_many(self, addresses: Iterable) -> Dict[str, StatusResult]:
+        """
+        Statuses of many contracts, those not cached are queried concurrently
+
+        :return: Address -> result (with `error` for contracts whose query failed)
+        """
+        results = {}
+        missing = []
+        for address in set(str(a) for a in addresses):
+            status = self._lookup(address)
+            if status is not None:
+                results[address] = StatusResult(address, status)
+            else:
+                missing.append(address)
+
+        for result in query_status_many(self.api, missing, self.parallelism):
+            if result.status is not None:
+                self.put(result.address, result.status)
+            results[result.address] = result
+        return results
+
+    def invalidate(self, address=None):
+        """
+        Drops cached status of the contract, or all entries if `address` is None
+        """
+        with self._lock:
+            if address is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(address), None)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "ttl_s": self.ttl}
+
+
+class PreflightChecker:
+    """
+    Rejects contract actions which would fail on the ledger, before they are signed & submitted (saves the fee,
+    the signing and the round-trip): asserts of the contract are checked against cached contract statuses
+
+    Contracts whose status can not be queried are let through (the ledger decides).
+    """
+    def __init__(self, statuses: StatusCache):
+        self.statuses = statuses
+        self.rejected = {}  # type: Dict[str, int]
+        self._lock = threading.Lock()
+
+    def prefetch(self, contract_addresses: Iterable) -> Dict[str, Optional[ContractStatus]]:
+        """
+        Statuses of many contracts (e.g. of a whole chunk of actions), not cached ones are queried concurrently
+
+        :return: Address -> status, None if its query failed
+        """
+        return {address: result.status for address, result in self.statuses.get_many(contract_addresses).items()}
+
+    def check(self, contract_address, action: str, from_address,
+              transfers: Optional[List[Tuple[Address, int]]] = None,
+              status: Optional[ContractStatus] = None) -> Optional[str]:
+        """
+        :param status: Status of the contract (`prefetch`, `statuses.get`), None if not known
+        :return: Reason of rejection (message of the failing assert), None if the action may be submitted
+        """
+        reason = check_action(contract_address, action, from_address, transfers, status)
+        if reason is not None:
+            with self._lock:
+                self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return reason
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            rejected = dict(self.rejected)
+        return {"rejected": rejected, "statuses": self.statuses.to_dict()}
@@ -0,0 +1,260 @@
+import heapq
+import logging
+import threading
+from typing import Optional, Iterable, Dict, List, Tuple, TextIO
+
+from fetchai.ledger.api import LedgerApi
+
+from fet_tools.status import ContractStatus, NOT_SETTLED, query_status_many
+from fet_tools.index import ContractIndex
+from fet_tools.actions import ActionEngine, ActionItem, ActionResult
+from fet_tools.watch import RELEASE_TIMEOUT_BLOCKS, DEFAULT_BLOCK_TIME
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_REFRESH_BLOCKS = 360
+DEFAULT_RETRY_BLOCKS = 6
+SENDER_ROLES = ("escrow", "buyer")
+
+
+class BlockClock:
+    """
+    Block clock of the ledger: current block is queried from the ledger, waiting for a future block sleeps for
+    the expected number of block times (re-checking the ledger at least every `max_sleep` seconds)
+    """
+    def __init__(self, api: LedgerApi, block_time: float = DEFAULT_BLOCK_TIME, max_sleep: float = 60.0):
+        self.api = api
+        self.block_time = block_time
+        self.max_sleep = max_sleep
+
+    def current(self) -> int:
+        return self.api.tokens.current_block_number()
+
+    def wait_until(self, block: int, stop: threading.Event):
+        while not stop.is_set():
+            current = self.current()
+            if current >= block:
+                return
+            stop.wait(min(self.max_sleep, (block - current) * self.block_time))
+
+
+class FakeBlockClock:
+    """
+    Manually driven block clock for tests & simulation: `wait_until` jumps right to the block
+
+    :param ledger: Optional simulated ledger (`fet_tools.simulator.SimulatedLedgerApi`) whose block number is
+                   the clock, it is advanced together with the clock
+    """
+    def __init__(self, block: int = 0, ledger=None):
+        self.ledger = ledger
+        self._block = block
+
+    def current(self) -> int:
+        return self.ledger.block_number if self.ledger is not None else self._block
+
+    def advance(self, blocks: int = 1):
+        if self.ledger is not None:
+            self.ledger.advance(blocks)
+        else:
+            self._block += blocks
+
+    def wait_until(self, block: int, stop: threading.Event):
+        if not stop.is_set() and block > self.current():
+            self.advance(block - self.current())
+
+
+def release_block(status: ContractStatus) -> int:
+    """
+    First block in which `accept` releases deposited balance to buyer (`blockNumber > start + 259200`)
+    """
+    return int(status.start) + RELEASE_TIMEOUT_BLOCKS + 1
+
+
+def is_releasable(status: ContractStatus, block: int) -> bool:
+    """
+    Whether `accept` (by anyone but the seller) settles the contract in the `block`: buyer has accepted, seller
+    not and the release timeout has passed
+    """
+    return (int(status.settledSinceBlock) == NOT_SETTLED and bool(status.buyerOk) and not status.sellerOk
+            and block >= release_block(status))
+
+
+class ExpiryScheduler:
+    """
+    Tracks escrow contracts and triggers their time-based settlement: once release timeout of a contract where
+    buyer has accepted and seller not passes, `accept` is submitted on its behalf (funds go to the buyer)
+
+    Contracts are kept in a heap keyed by the block they are due in (release block, or the next refresh of their
+    status for contracts which are not waiting for release yet), so scheduling is O(log n) and every round only
+    touches the contracts due. Due contracts are re-queried before the action (their state may have changed in
+    the meantime), releasable ones are submitted in batches by the `engine`. Settled contracts are dropped.
+
+    :param engine: Engine submitting the `accept` actions (its sync decides whether results carry final statuses)
+    :param clock: Block clock (`BlockClock`, or `FakeBlockClock` for tests)
+    :param from_address: Sender of all `accept` txs, otherwise party of the contract in `sender_role`
+    :param sender_role: `escrow` or `buyer`, contracts whose sender would be the seller are not released
+                        (seller's `accept` pays the seller instead)
+    :param batch_size: Max. number of due contracts processed per round
+    :param refresh_blocks: Interval of status refresh of contracts not waiting for release
+    :param retry_blocks: Delay of re-check of contracts after their action, or after their status query failed
+    :param index: Optional contract index statuses are backfilled to
+    """
+    def __init__(self, api: LedgerApi, engine: ActionEngine, clock, from_address: Optional[str] = None,
+                 sender_role: str = "escrow", batch_size: int = DEFAULT_BATCH_SIZE,
+                 refresh_blocks: int = DEFAULT_REFRESH_BLOCKS, retry_blocks: int = DEFAULT_RETRY_BLOCKS,
+                 parallelism: int = 16, index: Optional[ContractIndex] = None):
+        if sender_role not in SENDER_ROLES:
+            raise ValueError(f'Unknown sender role "{sender_role}"')
+        self.api = api
+        self.engine = engine
+        self.clock = clock
+        self.from_address = from_address
+        self.sender_role = sender_role
+        self.batch_size = batch_size
+        self.refresh_blocks = refresh_blocks
+        self.retry_blocks = retry_blocks
+        self.parallelism = parallelism
+        self.index = index
+        self.stats = {"released": 0, "submitted": 0, "failed": 0, "skipped": 0, "settled": 0, "rounds": 0}
+        # (due block, address), entries which do not match `_due` are stale (lazy deletion)
+        self._heap = []  # type: List[Tuple[int, str]]
+        self._due = {}  # type: Dict[str, int]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def __len__(self):
+        return len(self._due)
+
+    @property
+    def next_block(self) -> Optional[int]:
+        """
+        Block the earliest tracked contract is due in, None if no contract is tracked
+        """
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def _schedule(self, address: str, block: int):
+        with self._lock:
+            self._due[address] = block
+            heapq.heappush(self._heap, (block, address))
+
+    def _forget(self, address: str):
+        with self._lock:
+            self._due.pop(address, None)
+
+    def add(self, address, status: Optional[ContractStatus] = None, block: Optional[int] = None):
+        """
+        Starts tracking the contract, with unknown status it is queried in the next round
+        """
+        if status is None:
+            self._schedule(str(address), 0)
+        else:
+            self.track(str(address), status, self.clock.current() if block is None else block)
+
+    def add_many(self, addresses: Iterable):
+        for address in addresses:
+            self.add(address)
+
+    def track(self, address: str, status: ContractStatus, block: int):
+        """
+        (Re)schedules the contract according to its `status` observed in the `block`
+        """
+        if int(status.settledSinceBlock) != NOT_SETTLED:
+            self._forget(address)
+            self.stats["settled"] += 1
+        elif status.buyerOk and not status.sellerOk:
+            self._schedule(address, max(block, release_block(status)))
+        else:
+            self._schedule(address, block + self.refresh_blocks)
+
+    def _pop_due(self, block: int) -> List[str]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= block and len(due) < self.batch_size:
+                when, address = heapq.heappop(self._heap)
+                if self._due.get(address) == when:
+                    del self._due[address]
+                    due.append(address)
+        return due
+
+    def _sender(self, status: ContractStatus) -> Optional[str]:
+        sender = self.from_address or getattr(status, self.sender_role)
+        if sender is None or str(sender) == str(status.seller):
+            return None
+        return str(sender)
+
+    def run_once(self, block: int, report: Optional[TextIO] = None) -> List[ActionResult]:
+        """
+        Processes contracts due in the `block` (up to `batch_size` of them): re-queries their status, submits
+        `accept` for releasable ones and reschedules the rest
+
+        :return: Results of the submitted actions
+        """
+        due = self._pop_due(block)
+        if not due:
+            return []
+        self.stats["rounds"] += 1
+
+        items = []
+        for result in query_status_many(self.api, due, self.parallelism):
+            status = result.status
+            if status is None:
+                logger.warning(f"Unable to query status of {result.address} contract: {result.error}")
+                self._schedule(result.address, block + self.retry_blocks)
+                continue
+            if self.index is not None:
+                self.index.update_from_status(result.address, status)
+
+            if not is_releasable(status, block):
+                self.track(result.address, status, block)
+                continue
+            sender = self._sender(status)
+            if sender is None:
+                logger.warning(f"Contract {result.address} can not be released by its seller, dropping it")
+                self.stats["skipped"] += 1
+                continue
+            items.append(ActionItem(result.address, "accept", sender))
+
+        if not items:
+            return []
+        # Every contract is re-checked after its action: settled ones are dropped then, the rest (failed, not yet
+        # synced, or buyer cancelled in the meantime) is handled according to its new status
+        results = self.engine.run(items, report)
+        for result in results:
+            if result.status == "Executed":
+                self.stats["released"] += 1
+            else:
+                self.stats["submitted" if result.status == "Submitted" else "failed"] += 1
+            self._schedule(result.contract_address, block + self.retry_blocks)
+        logger.info(f"Block {block}: submitted release of {len(items)} contract(s), {len(self)} tracked")
+        return results
+
+    def run(self, report: Optional[TextIO] = None, until_empty: bool = False, until_block: Optional[int] = None):
+        """
+        Processes due contracts as blocks pass, until `stop()`
+
+        :param until_empty: Stop once no contract is tracked any more
+        :param until_block: Stop once the block has been processed
+        """
+        while not self._stop.is_set():
+            block = self.clock.current()
+            if until_block is not None and block > until_block:
+                break
+            self.run_once(block, report)
+
+            next_block = self.next_block
+            if next_block is None:
+                if until_empty:
+                    break
+                next_block = block + self.refresh_blocks
+            if until_block is not None:
+                next_block = min(next_block, until_block + 1)
+            if next_block > block:
+                self.clock.wait_until(next_block, self._stop)
+
+    def stop(self):
+        self._stop.set()
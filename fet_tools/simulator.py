@@ -0,0 +1,505 @@
+import os
+import sys
+import json
+import base64
+import struct
+import hashlib
+import logging
+import threading
+import argparse as ap
+from array import array
+from typing import Optional, Dict, List, Tuple
+
+from fetchai.ledger.api.tx import TxStatus
+from fetchai.ledger.crypto import Address
+from fetchai.ledger.serialisation import transaction
+from fetchai.ledger.transaction import Transaction
+
+from fet_tools.stub import DEFAULT_BLOCK_VALIDITY_PERIOD, _StubEndpoint, _StubTransactionApi
+from fet_tools.deeds import tx_operations
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Constants of escrow.etch
+NOT_SETTLED = 18446744073709551615
+RELEASE_TIMEOUT_BLOCKS = 259200
+FEE_DIVISOR = 100
+
+_BUYER_OK = 0x01
+_SELLER_OK = 0x02
+
+STATUS_EXECUTED = "Executed"
+STATUS_EXECUTION_FAILURE = "Contract Execution Failure"
+STATUS_LOOKUP_FAILURE = "Contract Lookup Failure"
+STATUS_INSUFFICIENT_FUNDS = "Insufficient available funds"
+STATUS_INSUFFICIENT_CHARGE = "Insufficient charge"
+STATUS_NOT_VALID = "Tx not valid for current block"
+
+# Charge units of each tx (fee = units * charge rate), applied unless overridden per action
+DEFAULT_CHARGE_UNITS = 1
+
+# State file: header (magic, version, block number, number of accounts, number of contracts), followed by
+# account addresses, account balances and contract addresses & state columns (little endian)
+STATE_MAGIC = b"FETS"
+STATE_VERSION = 2
+_STATE_HEADER = struct.Struct("<4sBQQQ")
+
+
+class ContractAssertion(Exception):
+    """
+    Failed `assert` of the contract code
+    """
+
+
+class _SimTokenApi(_StubEndpoint):
+    def balance(self, address) -> int:
+        return self._ledger.balance(address)
+
+    def current_block_number(self) -> int:
+        return self._ledger.block_number
+
+    def query_deed(self, address):
+        return self._ledger.deeds.get(Address(address)) or {}
+
+    def submit_signed_tx(self, tx: Transaction):
+        return self._ledger.execute(tx)
+
+
+class _SimContractsApi(_StubEndpoint):
+    def query(self, contract_owner: Address, query: str, **kwargs):
+        row = self._ledger.contract_row(contract_owner)
+        if row is None:
+            return False, {"status": "failed", "msg": "Contract does not exist"}
+
+        if query == "status":
+            return True, {"status": "success", "result": self._ledger.contract_status(row)}
+        elif query == "deposited_balance":
+            return True, {"status": "success", "result": self._ledger.deposited[row]}
+
+        return False, {"status": "failed", "msg": f"Unknown query {query}"}
+
+
+class SimulatedLedgerApi:
+    """
+    In-process ledger executing `escrow.etch` contracts, exposes the same subset of `LedgerApi` interface
+    as `fet_tools.stub.StubLedgerApi` (`contracts.query`, `submit_signed_tx`, `sync`, `tx.status`, ...)
+
+    Contrary to the stub, submitted txs are executed (deploy = `init`, `deposit`, `accept`, `cancel`, `kill`,
+    `withdrawExcessBalance`) with the semantics of `escrow.etch` in the current block: contract asserts, native
+    transfers, 1% fee of `payBalance`, `selfdestruct` refund and release to buyer after the timeout. `deed` txs
+    set deed of the sender. Tx executes immediately on submission, block number advances only explicitly
+    (`advance`, `wait_for_blocks`).
+
+    State is held in columns (arrays of fixed width ints, party addresses interned to 32 bit ids), so a contract
+    costs roughly its address key plus ~50 bytes and millions of contracts fit in memory.
+
+    :param enforce_balances: Reject txs whose sender can not pay the fee & transfers, otherwise account balances
+                             may go negative (no need to fund parties for throughput tests)
+    :param verify_signatures: Verify signatures of txs submitted via `submit_signed_tx` (as `LedgerApi` does),
+                              `tokens.submit_signed_tx` never verifies them
+    :param enforce_deeds: Reject txs (on submission, as the ledger node does) whose signers do not meet deed
+                          thresholds of the sender, or which are not signed by the sender if it has no deed
+    :param charge_units: Charge units per action ('create' for deployment), `DEFAULT_CHARGE_UNITS` otherwise
+    """
+    def __init__(self, block_number: int = 0, enforce_balances: bool = False, verify_signatures: bool = True,
+                 enforce_deeds: bool = True, charge_units: Optional[Dict[str, int]] = None):
+        self.tokens = _SimTokenApi(self)
+        self.contracts = _SimContractsApi(self)
+        self.tx = _StubTransactionApi(self)
+        self.block_number = block_number
+        self.enforce_balances = enforce_balances
+        self.enforce_deeds = enforce_deeds
+        self.verify_signatures = verify_signatures
+        self.charge_units = dict(charge_units or {})
+        self.deeds = {}  # type: Dict[Address, dict]
+
+        # Accounts: address -> id, balances indexed by id
+        self._account_ids = {}  # type: Dict[bytes, int]
+        self._accounts = []  # type: List[bytes]
+        self._displays = {}  # type: Dict[int, str]
+        self.funds = array('q')
+
+        # Contracts: address -> row of state columns
+        self._rows = {}  # type: Dict[bytes, int]
+        self.deposited = array('Q')
+        self.contract_balance = array('Q')
+        self.start = array('Q')
+        self.settled_since = array('Q')
+        self.buyer = array('I')
+        self.seller = array('I')
+        self.escrow = array('I')
+        self.flags = bytearray()
+
+        # digest -> (status, exit code, charge limit, charge rate, fee)
+        self._tx_statuses = {}  # type: Dict[str, Tuple[str, int, int, int, int]]
+        self._lock = threading.Lock()
+
+    @property
+    def contract_count(self) -> int:
+        return len(self._rows)
+
+    @property
+    def account_count(self) -> int:
+        return len(self._accounts)
+
+    # ---- accounts ----
+
+    def _account(self, address: bytes) -> int:
+        account = self._account_ids.get(address)
+        if account is None:
+            account = self._account_ids[address] = len(self._accounts)
+            self._accounts.append(address)
+            self.funds.append(0)
+        return account
+
+    def _display(self, account: int) -> str:
+        display = self._displays.get(account)
+        if display is None:
+            display = self._displays[account] = str(Address(self._accounts[account]))
+        return display
+
+    def balance(self, address) -> int:
+        raw = bytes(Address(address))
+        row = self._rows.get(raw)
+        if row is not None:
+            return self.contract_balance[row]
+        account = self._account_ids.get(raw)
+        return 0 if account is None else self.funds[account]
+
+    def set_balance(self, address, amount: int):
+        with self._lock:
+            self.funds[self._account(bytes(Address(address)))] = amount
+
+    def _credit(self, address: bytes, amount: int):
+        row = self._rows.get(address)
+        if row is not None:
+            self.contract_balance[row] += amount
+        else:
+            self.funds[self._account(address)] += amount
+
+    def _pay_from_contract(self, row: int, account: int, amount: int):
+        self.contract_balance[row] -= amount
+        self.funds[account] += amount
+
+    # ---- contracts ----
+
+    def contract_row(self, contract_address) -> Optional[int]:
+        return self._rows.get(bytes(Address(contract_address)))
+
+    def contract_status(self, row: int) -> dict:
+        """
+        Result of the `status` query of the contract
+        """
+        flags = self.flags[row]
+        return {
+            "deposited_balance": self.deposited[row],
+            "buyer": self._display(self.buyer[row]),
+            "seller": self._display(self.seller[row]),
+            "escrow": self._display(self.escrow[row]),
+            "start": self.start[row],
+            "buyerOk": "true" if flags & _BUYER_OK else "false",
+            "sellerOk": "true" if flags & _SELLER_OK else "false",
+            "settledSinceBlock": self.settled_since[row],
+        }
+
+    def _verify_is_active(self, row: int):
+        if not self.block_number < self.settled_since[row]:
+            raise ContractAssertion("Contract has been settled and is no more active.")
+
+    def _authorise(self, row: int, sender: int):
+        if sender != self.escrow[row]:
+            raise ContractAssertion("Tx sender must be owner address of the contract.")
+
+    def _selfdestruct(self, row: int):
+        deposited = self.deposited[row]
+        if deposited > 0:
+            self._pay_from_contract(row, self.buyer[row], deposited)
+            self.deposited[row] = 0
+        self.settled_since[row] = self.block_number
+
+    def _pay_balance(self, row: int):
+        deposited = self.deposited[row]
+        fee = deposited // FEE_DIVISOR
+        self._pay_from_contract(row, self.escrow[row], fee)
+        self._pay_from_contract(row, self.seller[row], deposited - fee)
+        self.deposited[row] = 0
+        self._selfdestruct(row)
+
+    def _init(self, address: bytes, owner: int, transfers: List[Tuple[bytes, int]]):
+        if address in self._rows:
+            raise ContractAssertion("Contract already exists")
+        if len(transfers) != 2:
+            raise ContractAssertion("There must be 2 native transfers defined in the transaction.")
+
+        self._rows[address] = len(self.deposited)
+        self.deposited.append(0)
+        self.contract_balance.append(0)
+        self.start.append(self.block_number)
+        self.settled_since.append(NOT_SETTLED)
+        self.escrow.append(owner)
+        self.seller.append(self._account(transfers[0][0]))
+        self.buyer.append(self._account(transfers[1][0]))
+        self.flags.append(0)
+
+    def _accept(self, row: int, sender: int):
+        self._verify_is_active(row)
+        if sender == self.buyer[row]:
+            self.flags[row] |= _BUYER_OK
+        elif sender == self.seller[row]:
+            self.flags[row] |= _SELLER_OK
+
+        flags = self.flags[row]
+        if flags == _BUYER_OK | _SELLER_OK:
+            self._pay_balance(row)
+        elif flags == _BUYER_OK and self.block_number > self.start[row] + RELEASE_TIMEOUT_BLOCKS:
+            self._selfdestruct(row)
+
+    def _deposit(self, row: int, sender: int, address: bytes, transfers: List[Tuple[bytes, int]]):
+        self._verify_is_active(row)
+        if len(transfers) != 1:
+            raise ContractAssertion("There must be 1 native transfers defined in the transaction.")
+        if transfers[0][0] != address:
+            raise ContractAssertion("Transfer destination address must be contract address.")
+        if sender != self.buyer[row]:
+            raise ContractAssertion("Deposit must be done from buyer address.")
+        self.deposited[row] += transfers[0][1]
+
+    def _cancel(self, row: int, sender: int):
+        self._verify_is_active(row)
+        if sender == self.buyer[row]:
+            self.flags[row] &= ~_BUYER_OK
+        elif sender == self.seller[row]:
+            self.flags[row] &= ~_SELLER_OK
+
+        if self.flags[row] == 0:
+            self._selfdestruct(row)
+
+    def _kill(self, row: int, sender: int):
+        self._authorise(row, sender)
+        self._verify_is_active(row)
+        self._selfdestruct(row)
+
+    def _withdraw_excess_balance(self, row: int, sender: int):
+        self._authorise(row, sender)
+        contract_balance = self.contract_balance[row]
+        bonded = self.deposited[row]
+        if contract_balance < bonded:
+            raise ContractAssertion("INCONSISTENCY: Insufficient contract deposited_balance.")
+        self._pay_from_contract(row, self.escrow[row], contract_balance - bonded)
+
+    # ---- tx execution ----
+
+    def _execute(self, tx: Transaction) -> Tuple[str, int, int]:
+        """
+        Executes the tx in the current block
+
+        Contract code runs first, native transfers of the tx are applied only if it succeeds (as the ledger does),
+        so e.g. `withdrawExcessBalance` does not see transfers of its own tx. Fee is charged in any case once
+        the tx is valid for the block.
+
+        :return: Status, exit code and fee
+        """
+        if not tx.valid_from <= self.block_number < tx.valid_until:
+            return STATUS_NOT_VALID, 0, 0
+
+        action = tx.action
+        sender = self._account(bytes(tx.from_address))
+        transfers = [(bytes(address), amount) for address, amount in tx.transfers.items()]
+        units = self.charge_units.get(action, DEFAULT_CHARGE_UNITS)
+        fee = min(units, tx.charge_limit) * tx.charge_rate
+
+        if self.enforce_balances and self.funds[sender] < fee + sum(a for _, a in transfers):
+            return STATUS_INSUFFICIENT_FUNDS, 0, 0
+        self.funds[sender] -= fee
+        if units > tx.charge_limit:
+            return STATUS_INSUFFICIENT_CHARGE, 0, fee
+
+        if action == "deed":
+            deed = json.loads(tx.data) if tx.data else {}
+            if deed:
+                self.deeds[Address(tx.from_address)] = deed
+            else:
+                self.deeds.pop(Address(tx.from_address), None)
+            return STATUS_EXECUTED, 0, fee
+
+        try:
+            if action == "create":
+                nonce = base64.b64decode(json.loads(tx.data)["nonce"])
+                owner = bytes(tx.from_address)
+                self._init(hashlib.sha256(owner + nonce).digest(), sender, transfers)
+            else:
+                address = bytes(tx.contract_address) if tx.contract_address is not None else None
+                row = self._rows.get(address)
+                if row is None:
+                    return STATUS_LOOKUP_FAILURE, 0, fee
+
+                if action == "accept":
+                    self._accept(row, sender)
+                elif action == "deposit":
+                    self._deposit(row, sender, address, transfers)
+                elif action == "cancel":
+                    self._cancel(row, sender)
+                elif action == "kill":
+                    self._kill(row, sender)
+                elif action == "withdrawExcessBalance":
+                    self._withdraw_excess_balance(row, sender)
+                else:
+                    raise ContractAssertion(f'Unknown action "{action}"')
+        except ContractAssertion as ex:
+            logger.debug(f"Tx {action} failed: {ex}")
+            return STATUS_EXECUTION_FAILURE, 1, fee
+
+        for address, amount in transfers:
+            self.funds[sender] -= amount
+            self._credit(address, amount)
+        return STATUS_EXECUTED, 0, fee
+
+    def execute(self, tx: Transaction) -> str:
+        """
+        Executes the tx without verification of its signatures
+
+        :return: Digest of the tx
+        """
+        digest = hashlib.sha256(transaction.encode_transaction(tx)).hexdigest()
+        with self._lock:
+            if self.enforce_deeds and not self._authorised(tx):
+                raise RuntimeError(f"Signers of the tx do not meet deed of the {Address(tx.from_address)} sender")
+            status, exit_code, fee = self._execute(tx)
+            self._tx_statuses[digest] = (status, exit_code, tx.charge_limit, tx.charge_rate, fee)
+        return digest
+
+    def _authorised(self, tx: Transaction) -> bool:
+        signers = set(Address(signer) for signer in tx.signers)
+        deed = self.deeds.get(Address(tx.from_address))
+        if deed is None:
+            return Address(tx.from_address) in signers
+
+        weight = sum(w for signee, w in deed["signees"].items() if Address(signee) in signers)
+        for operation in tx_operations(tx.action, bool(tx.transfers)):
+            threshold = deed["thresholds"].get(str(operation))
+            if threshold is None or weight < threshold:
+                return False
+        return True
+
+    def submit_signed_tx(self, tx: Transaction) -> str:
+        if self.verify_signatures and not tx.is_valid():
+            raise RuntimeError('Signed transaction failed validation checks')
+        return self.execute(tx)
+
+    def tx_status(self, tx_digest: str) -> TxStatus:
+        digest = bytes.fromhex(tx_digest)
+        status = self._tx_statuses.get(tx_digest)
+        if status is None:
+            return TxStatus(digest, "Unknown", 0, 0, 0, 0)
+        return TxStatus(digest, *status)
+
+    def sync(self, txs, timeout: Optional[int] = None, hold_state_sec: int = 0, extend_success_status=None):
+        digests = [txs] if isinstance(txs, str) else list(txs)
+        statuses = [self.tx_status(d) for d in digests]
+        failed = [s for s in statuses if not s.successful]
+        if failed:
+            raise RuntimeError('Some transactions have failed: {}'.format(
+                ', '.join('{}:{}'.format(s.digest_hex, s.status) for s in failed)))
+        return statuses
+
+    def set_validity_period(self, tx: Transaction, period: Optional[int] = None):
+        tx.valid_from = self.block_number
+        tx.valid_until = self.block_number + (period or DEFAULT_BLOCK_VALIDITY_PERIOD)
+        return tx.valid_until
+
+    def advance(self, blocks: int = 1):
+        with self._lock:
+            self.block_number += blocks
+
+    def wait_for_blocks(self, n: int):
+        self.advance(n + 1)
+
+    # ---- persistence ----
+
+    def save(self, path: str):
+        """
+        Writes accounts, contract states & deeds (JSON trailer) to binary state file (tx statuses are not persisted)
+        """
+        tmp = f"{path}.tmp"
+        with self._lock, open(tmp, 'wb') as f:
+            f.write(_STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION, self.block_number, len(self._accounts),
+                                       len(self._rows)))
+            f.write(b"".join(self._accounts))
+            f.write(b"".join(self._rows))
+            for column in self._columns():
+                if sys.byteorder == "big":
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                f.write(column.tobytes())
+            f.write(json.dumps({str(address): deed for address, deed in self.deeds.items()}).encode())
+        os.replace(tmp, path)
+
+    def _columns(self) -> List[array]:
+        return [self.funds, self.deposited, self.contract_balance, self.start, self.settled_since,
+                self.buyer, self.seller, self.escrow, array('B', self.flags)]
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'SimulatedLedgerApi':
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, block_number, accounts, contracts = _STATE_HEADER.unpack_from(data)
+        if magic != STATE_MAGIC:
+            raise ValueError(f"{path} is not a simulator state file")
+        if version not in (1, STATE_VERSION):
+            raise ValueError(f"Unsupported simulator state file version {version}")
+
+        api = cls(block_number, **kwargs)
+        offset = _STATE_HEADER.size
+        for account in range(accounts):
+            address = data[offset:offset + Address.BYTE_LENGTH]
+            api._account_ids[address] = account
+            api._accounts.append(address)
+            offset += Address.BYTE_LENGTH
+        for row in range(contracts):
+            api._rows[data[offset:offset + Address.BYTE_LENGTH]] = row
+            offset += Address.BYTE_LENGTH
+
+        columns = api._columns()
+        for column in columns:
+            count = accounts if column is columns[0] else contracts
+            size = count * column.itemsize
+            column.frombytes(data[offset:offset + size])
+            if sys.byteorder == "big":
+                column.byteswap()
+            offset += size
+        api.flags = bytearray(columns[-1].tobytes())
+        if version >= 2:
+            api.deeds = {Address(address): deed for address, deed in json.loads(data[offset:].decode()).items()}
+        return api
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> 'SimulatedLedgerApi':
+        """
+        Loads state file if it exists, otherwise returns empty simulator
+        """
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            return cls.load(path, **kwargs)
+        return cls(**kwargs)
+
+
+def main():
+    parser = ap.ArgumentParser(description="Manages state file of the escrow contract simulator "
+                                           "(see `--simulate` option of contract_cli.py)")
+    parser.add_argument("state", type=str, help="Simulator state file (created if it does not exist)")
+    parser.add_argument("--advance", type=int, default=0, help="Number of blocks to advance the block number by")
+    parser.add_argument("--fund", type=str, nargs=2, action="append", default=[], metavar=("ADDRESS", "AMOUNT"),
+                        help="Sets balance of the address")
+    args = parser.parse_args()
+
+    api = SimulatedLedgerApi.open(args.state)
+    api.advance(args.advance)
+    for address, amount in args.fund:
+        api.set_balance(address, int(amount))
+    api.save(args.state)
+    print(json.dumps({"block_number": api.block_number, "contracts": api.contract_count,
+                      "accounts": api.account_count}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import sys
+import time
+import builtins
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, TextIO
+
+# NOTE: This module must stay importable with standard library only, it is loaded by CLI before anything else.
+
+
+class StartupProfiler:
+    """
+    Collects wall time of named startup phases and import time per top-level package
+
+    Import times are exclusive (time spent importing nested packages is attributed to them, not to the importer),
+    so the breakdown shows which dependencies the startup time is actually spent in. Only imports executed after
+    `install()` are measured.
+    """
+    def __init__(self):
+        self.phases = []  # type: List[Tuple[str, float]]
+        self.imports = defaultdict(float)  # type: Dict[str, float]
+        self.imported_modules = 0
+        self._stack = []  # type: List[float]
+        self._original_import = None
+        self._started = time.perf_counter()
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level:
+            package = (globals or {}).get("__package__") or ""
+        else:
+            package = name
+        top_level = package.split(".", 1)[0] or name
+
+        known = len(sys.modules)
+        self._stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self._stack.pop()
+            self.imports[top_level] += elapsed - nested
+            if self._stack:
+                self._stack[-1] += elapsed
+            else:
+                self.imported_modules += max(0, len(sys.modules) - known)
+
+    def install(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def report(self, stream: TextIO = sys.stderr, top: int = 15):
+        total = time.perf_counter() - self._started
+        stream.write("Startup profile [ms]:\n")
+        for name, elapsed in self.phases:
+            stream.write(f"  {name:<32} {elapsed * 1000:10.1f}\n")
+        stream.write(f"  {'total (since profiler start)':<32} {total * 1000:10.1f}\n")
+
+        imports = sorted(((p, t) for p, t in self.imports.items() if t >= 0.0001), key=lambda i: i[1], reverse=True)
+        stream.write(f"Import time by top-level package [ms] ({self.imported_modules} modules loaded):\n")
+        for package, elapsed in imports[:top]:
+            stream.write(f"  {package:<32} {elapsed * 1000:10.1f}\n")
+        stream.write(f"  {'total imports':<32} {sum(self.imports.values()) * 1000:10.1f}\n")
+        stream.flush()
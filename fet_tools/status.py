@@ -0,0 +1,378 @@
+import csv
+import json
+import time
+import logging
+from array import array
+from functools import total_ordering
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Iterable, Iterator, List, TextIO
+
+from fetchai.ledger.api import LedgerApi
+from fetchai.ledger.crypto import Address
+
+from fet_tools.tools import AddressEx, encode_bool, decode_bool, decode_fetch_address
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+NOT_SETTLED = 0xFFFFFFFFFFFFFFFF
+
+
+def _decode_bool(value) -> Optional[bool]:
+    if value is None or isinstance(value, bool):
+        return value
+    return decode_bool(value)
+
+
+def _encode_bool(value: Optional[bool]) -> Optional[str]:
+    return None if value is None else encode_bool(value)
+
+
+@total_ordering
+class ContractStatus:
+    """
+    Result of the contract `status` query
+
+    Hand-written codec compatible with JSON produced by the contract (and with former `dataclasses_json` based
+    implementation, incl. `deposited_balance` field name). Party addresses are kept as received and converted
+    to `Address` (which involves base58 decoding & checksum verification) lazily, on the first attribute access.
+    """
+    __slots__ = ("_buyer", "_seller", "_escrow", "balance", "start", "settledSinceBlock", "sellerOk", "buyerOk")
+
+    def __init__(self, buyer=None, seller=None, escrow=None, balance: int = 0, start: int = 0,
+                 settledSinceBlock: int = NOT_SETTLED, sellerOk: Optional[bool] = None,
+                 buyerOk: Optional[bool] = None):
+        self._buyer = buyer
+        self._seller = seller
+        self._escrow = escrow
+        self.balance = balance
+        self.start = start
+        self.settledSinceBlock = settledSinceBlock
+        self.sellerOk = sellerOk
+        self.buyerOk = buyerOk
+
+    @staticmethod
+    def _address(value) -> Optional[Address]:
+        if value is None or isinstance(value, AddressEx):
+            return value
+        return decode_fetch_address(value) if isinstance(value, str) else AddressEx(value)
+
+    @property
+    def buyer(self) -> Optional[Address]:
+        self._buyer = self._address(self._buyer)
+        return self._buyer
+
+    @buyer.setter
+    def buyer(self, value):
+        self._buyer = value
+
+    @property
+    def seller(self) -> Optional[Address]:
+        self._seller = self._address(self._seller)
+        return self._seller
+
+    @seller.setter
+    def seller(self, value):
+        self._seller = value
+
+    @property
+    def escrow(self) -> Optional[Address]:
+        self._escrow = self._address(self._escrow)
+        return self._escrow
+
+    @escrow.setter
+    def escrow(self, value):
+        self._escrow = value
+
+    def raw_party(self, role: str):
+        """
+        Party address (`buyer`, `seller` or `escrow`) as received, without decoding it to `Address`
+        """
+        return getattr(self, "_" + role)
+
+    @classmethod
+    def from_dict(cls, kvs: dict) -> 'ContractStatus':
+        get = kvs.get
+        return cls(get("buyer") or None, get("seller") or None, get("escrow") or None,
+                   get("deposited_balance", 0), get("start", 0), get("settledSinceBlock", NOT_SETTLED),
+                   _decode_bool(get("sellerOk")), _decode_bool(get("buyerOk")))
+
+    def to_dict(self, encode_json: bool = False) -> dict:
+        """
+        :param encode_json: Accepted for compatibility, the result is always JSON encodable
+        """
+        return {
+            "buyer": None if self._buyer is None else str(self._buyer),
+            "seller": None if self._seller is None else str(self._seller),
+            "escrow": None if self._escrow is None else str(self._escrow),
+            "deposited_balance": self.balance,
+            "start": self.start,
+            "settledSinceBlock": self.settledSinceBlock,
+            "sellerOk": _encode_bool(self.sellerOk),
+            "buyerOk": _encode_bool(self.buyerOk),
+        }
+
+    def _astuple(self) -> tuple:
+        return (self.buyer, self.seller, self.escrow, self.balance, self.start, self.settledSinceBlock,
+                self.sellerOk, self.buyerOk)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __lt__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._astuple() < other._astuple()
+
+    def __repr__(self):
+        return (f"ContractStatus(buyer={self.buyer!r}, seller={self.seller!r}, escrow={self.escrow!r}, "
+                f"balance={self.balance!r}, start={self.start!r}, settledSinceBlock={self.settledSinceBlock!r}, "
+                f"sellerOk={self.sellerOk!r}, buyerOk={self.buyerOk!r})")
+
+
+STATUS_FIELDS = ("deposited_balance", "buyer", "seller", "escrow", "start", "buyerOk", "sellerOk", "settledSinceBlock")
+
+
+def query_contract_status(api: LedgerApi, contract_address) -> Optional[ContractStatus]:
+    """
+    Queries `status` of the contract
+
+    :return: Decoded status, or None if the query did not succeed
+    """
+    success, contract_status = api.contracts.query(Address(contract_address), "status")
+    if success and contract_status and contract_status["status"] == "success":
+        return ContractStatus.from_dict(contract_status["result"])
+    return None
+
+
+class StatusColumns:
+    """
+    Columnar representation of many contract statuses for analytics
+
+    Numeric fields are held in compact arrays (`balance`, `start`, `settled_since` as unsigned 64 bit ints),
+    flags as signed bytes (1 = true, 0 = false, -1 = not set), party addresses as lists of strings (no `Address`
+    objects are created). Rows of failed queries have `valid` flag 0 and zero/empty values in all other columns.
+    """
+    __slots__ = ("addresses", "valid", "balance", "start", "settled_since", "seller_ok", "buyer_ok",
+                 "buyer", "seller", "escrow")
+
+    def __init__(self):
+        self.addresses = []  # type: List[Optional[str]]
+        self.valid = array('B')
+        self.balance = array('Q')
+        self.start = array('Q')
+        self.settled_since = array('Q')
+        self.seller_ok = array('b')
+        self.buyer_ok = array('b')
+        self.buyer = []  # type: List[str]
+        self.seller = []  # type: List[str]
+        self.escrow = []  # type: List[str]
+
+    def __len__(self):
+        return len(self.valid)
+
+    @staticmethod
+    def _flag(value) -> int:
+        value = _decode_bool(value)
+        return -1 if value is None else int(value)
+
+    def append(self, result: Optional[dict], address: Optional[str] = None):
+        """
+        :param result: Raw `status` query result (as accepted by `ContractStatus.from_dict`), None for failed query
+        """
+        self.addresses.append(address)
+        if result is None:
+            self.valid.append(0)
+            for column in (self.balance, self.start, self.settled_since):
+                column.append(0)
+            for column in (self.seller_ok, self.buyer_ok):
+                column.append(-1)
+            for column in (self.buyer, self.seller, self.escrow):
+                column.append("")
+            return
+
+        get = result.get
+        self.valid.append(1)
+        self.balance.append(int(get("deposited_balance", 0)))
+        self.start.append(int(get("start", 0)))
+        self.settled_since.append(int(get("settledSinceBlock", NOT_SETTLED)))
+        self.seller_ok.append(self._flag(get("sellerOk")))
+        self.buyer_ok.append(self._flag(get("buyerOk")))
+        self.buyer.append(get("buyer") or "")
+        self.seller.append(get("seller") or "")
+        self.escrow.append(get("escrow") or "")
+
+    def row(self, i: int) -> Optional[ContractStatus]:
+        if not self.valid[i]:
+            return None
+        return ContractStatus(self.buyer[i] or None, self.seller[i] or None, self.escrow[i] or None,
+                              self.balance[i], self.start[i], self.settled_since[i],
+                              None if self.seller_ok[i] < 0 else bool(self.seller_ok[i]),
+                              None if self.buyer_ok[i] < 0 else bool(self.buyer_ok[i]))
+
+    def to_dict(self) -> dict:
+        return {name: list(getattr(self, name)) for name in self.__slots__}
+
+
+def decode_status_columns(results: Iterable[Optional[dict]],
+                          addresses: Optional[Iterable[str]] = None) -> StatusColumns:
+    """
+    Decodes many raw `status` query results into columnar structure
+
+    :param results: Raw query results (`result` member of successful query response), None for failed queries
+    :param addresses: Optional contract addresses, in the same order as `results`
+    """
+    columns = StatusColumns()
+    if addresses is None:
+        for result in results:
+            columns.append(result)
+    else:
+        for result, address in zip(results, addresses):
+            columns.append(result, str(address))
+    return columns
+
+
+@dataclass
+class StatusResult:
+    address: str
+    status: Optional[ContractStatus] = None
+    error: Optional[str] = None
+    latency: float = 0.0
+
+    def to_dict(self) -> dict:
+        record = {"address": self.address}
+        status = self.status.to_dict(encode_json=True) if self.status else {}
+        record.update({f: status.get(f) for f in STATUS_FIELDS})
+        record["error"] = self.error
+        record["latency_ms"] = round(self.latency * 1000, 3)
+        return record
+
+
+RESULT_FIELDS = ("address",) + STATUS_FIELDS + ("error", "latency_ms")
+
+
+class QueryStats:
+    """
+    Collects latencies of individual queries and computes throughput & latency percentiles
+    """
+    def __init__(self):
+        self.latencies = []  # type: List[float]
+        self.errors = 0
+        self._started = time.monotonic()
+        self._finished = None
+
+    def add(self, result: StatusResult):
+        self.latencies.append(result.latency)
+        if result.error:
+            self.errors += 1
+
+    def finish(self):
+        self._finished = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return (self._finished or time.monotonic()) - self._started
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+    def to_dict(self) -> dict:
+        elapsed = self.elapsed
+        return {
+            "count": len(self.latencies),
+            "errors": self.errors,
+            "elapsed_s": round(elapsed, 3),
+            "queries_per_s": round(len(self.latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+            "latency_p50_ms": round(self.percentile(50) * 1000, 3),
+            "latency_p95_ms": round(self.percentile(95) * 1000, 3),
+            "latency_p99_ms": round(self.percentile(99) * 1000, 3),
+            "latency_max_ms": round(max(self.latencies, default=0.0) * 1000, 3),
+        }
+
+
+def _query_status_timed(api: LedgerApi, address: str) -> StatusResult:
+    started = time.monotonic()
+    result = StatusResult(address)
+    try:
+        result.status = query_contract_status(api, address)
+        if result.status is None:
+            result.error = "Query of contract status failed"
+    except Exception as ex:
+        result.error = f"{type(ex).__name__}: {ex}"
+    result.latency = time.monotonic() - started
+    return result
+
+
+def query_status_many(api: LedgerApi, addresses: Iterable[str], parallelism: int = 16,
+                      stats: Optional[QueryStats] = None) -> Iterator[StatusResult]:
+    """
+    Queries `status` of many contracts concurrently, results are yielded in order of completion
+
+    Input iterable is consumed lazily, so at most `2 * parallelism` queries are in flight/buffered at any time
+    and the input can be an (unbounded) stream.
+
+    :param parallelism: Number of worker threads issuing queries
+    :param stats: Optional collector of throughput & latency statistics
+    """
+    max_pending = 2 * parallelism
+    pending = set()
+    addresses = iter(addresses)
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                address = next(addresses, None)
+                if address is None:
+                    exhausted = True
+                else:
+                    pending.add(executor.submit(_query_status_timed, api, address))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if stats is not None:
+                    stats.add(result)
+                yield result
+
+    if stats is not None:
+        stats.finish()
+
+
+def read_addresses(stream: TextIO) -> Iterator[str]:
+    """
+    Reads contract addresses from text stream, one address per line, empty lines & `#` comments are ignored
+    """
+    for line in stream:
+        address = line.split("#", 1)[0].strip()
+        if address:
+            yield address
+
+
+class StatusResultWriter:
+    def __init__(self, stream: TextIO, fmt: str = "jsonl"):
+        if fmt not in ("jsonl", "csv"):
+            raise ValueError(f'Unsupported output format "{fmt}"')
+
+        self._stream = stream
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(stream, fieldnames=RESULT_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, result: StatusResult):
+        if self._csv:
+            self._csv.writerow(result.to_dict())
+        else:
+            self._stream.write(json.dumps(result.to_dict()) + "\n")
+        self._stream.flush()
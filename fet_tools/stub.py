@@ -0,0 +1,161 @@
+import time
+import hashlib
+import functools
+import threading
+from collections import defaultdict
+from typing import Optional, Dict, List
+
+import requests
+
+from fetchai.ledger.api.tx import TxStatus
+from fetchai.ledger.crypto import Address
+from fetchai.ledger.serialisation import transaction
+from fetchai.ledger.transaction import Transaction
+
+DEFAULT_BLOCK_VALIDITY_PERIOD = 100
+
+
+class _StubEndpoint:
+    def __init__(self, ledger: 'StubLedgerApi'):
+        self._ledger = ledger
+
+
+class _StubTokenApi(_StubEndpoint):
+    def balance(self, address) -> int:
+        return self._ledger.balances[Address(address)]
+
+    def current_block_number(self) -> int:
+        return self._ledger.block_number
+
+    def query_deed(self, address):
+        deed = self._ledger.deeds.get(Address(address))
+        if deed is None:
+            return {}
+        return deed
+
+    def submit_signed_tx(self, tx: Transaction):
+        return self._ledger.submit_signed_tx(tx)
+
+
+class _StubContractsApi(_StubEndpoint):
+    def query(self, contract_owner: Address, query: str, **kwargs):
+        state = self._ledger.contract_states.get(Address(contract_owner))
+        if state is None:
+            return False, {"status": "failed", "msg": "Contract does not exist"}
+
+        if query == "status":
+            return True, {"status": "success", "result": dict(state)}
+        elif query == "deposited_balance":
+            return True, {"status": "success", "result": state["deposited_balance"]}
+
+        return False, {"status": "failed", "msg": f"Unknown query {query}"}
+
+
+class _StubTransactionApi(_StubEndpoint):
+    def status(self, tx_digest) -> TxStatus:
+        return self._ledger.tx_status(tx_digest)
+
+
+class StubLedgerApi:
+    """
+    In-process stand-in for `LedgerApi` exposing the subset of its interface used by this tooling
+
+    Contract states are canned (see `set_contract_status`), submitted transactions are recorded
+    and reported with `tx_status` status (by default 'Executed') and `tx_fee` fee.
+    Intended for testing & benchmarking the tooling without ledger node.
+    """
+    def __init__(self, block_number: int = 0, tx_status: str = "Executed", tx_fee: int = 1):
+        self.tokens = _StubTokenApi(self)
+        self.contracts = _StubContractsApi(self)
+        self.tx = _StubTransactionApi(self)
+        self.block_number = block_number
+        self.default_tx_status = tx_status
+        self.default_tx_fee = tx_fee
+        self.balances = defaultdict(int)  # type: Dict[Address, int]
+        self.deeds = {}  # type: Dict[Address, dict]
+        self.contract_states = {}  # type: Dict[Address, dict]
+        self.submitted = []  # type: List[Transaction]
+        self._tx_statuses = {}  # type: Dict[str, TxStatus]
+        self._lock = threading.Lock()
+
+    def set_contract_status(self, contract_address, status: dict):
+        """
+        Sets state returned by `status` & `deposited_balance` queries of the contract
+
+        :param status: Raw `status` query result, e.g. `ContractStatus(...).to_dict(encode_json=True)`
+        """
+        self.contract_states[Address(contract_address)] = dict(status)
+
+    def set_validity_period(self, tx: Transaction, period: Optional[int] = None):
+        tx.valid_from = self.block_number
+        tx.valid_until = self.block_number + (period or DEFAULT_BLOCK_VALIDITY_PERIOD)
+        return tx.valid_until
+
+    def submit_signed_tx(self, tx: Transaction) -> str:
+        if not tx.is_valid():
+            raise RuntimeError('Signed transaction failed validation checks')
+
+        digest = hashlib.sha256(transaction.encode_transaction(tx)).digest()
+        with self._lock:
+            self.submitted.append(tx)
+            self._tx_statuses[digest.hex()] = TxStatus(digest, self.default_tx_status, 0, tx.charge_limit,
+                                                      tx.charge_rate, self.default_tx_fee)
+        return digest.hex()
+
+    def tx_status(self, tx_digest: str) -> TxStatus:
+        status = self._tx_statuses.get(tx_digest)
+        if status is None:
+            return TxStatus(bytes.fromhex(tx_digest), "Unknown", 0, 0, 0, 0)
+        return status
+
+    def sync(self, txs, timeout: Optional[int] = None, hold_state_sec: int = 0, extend_success_status=None):
+        digests = [txs] if isinstance(txs, str) else list(txs)
+        statuses = [self.tx_status(d) for d in digests]
+        failed = [s for s in statuses if not s.successful]
+        if failed:
+            raise RuntimeError('Some transactions have failed: {}'.format(
+                ', '.join('{}:{}'.format(s.digest_hex, s.status) for s in failed)))
+        return statuses
+
+    def wait_for_blocks(self, n: int):
+        self.block_number += n + 1
+
+
+class _StubNodeEndpoint:
+    def __init__(self, node: 'StubNode', target):
+        self._node = node
+        self._target = target
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        return functools.partial(self._node._call, value) if callable(value) else value
+
+
+class StubNode(_StubNodeEndpoint):
+    """
+    One node of local stub network: proxy of ledger shared by all the nodes (`StubLedgerApi`, or simulated
+    ledger) injecting latency and outages into every call, to test multi-node routing & failover
+    (`fet_tools.multinode`) with several local nodes
+
+    :param latency: Delay of every call in [s]
+    """
+    def __init__(self, ledger, name: str = "stub", latency: float = 0.0):
+        super().__init__(self, ledger)
+        self.name = name
+        self.latency = latency
+        self.down = False
+        self.timeout = False
+        self.calls = 0
+        self.tokens = _StubNodeEndpoint(self, ledger.tokens)
+        self.contracts = _StubNodeEndpoint(self, ledger.contracts)
+        self.tx = _StubNodeEndpoint(self, ledger.tx)
+
+    def _call(self, func, *args, **kwargs):
+        self.calls += 1
+        if self.down:
+            raise requests.exceptions.ConnectionError(f"Node {self.name} is down")
+        if self.latency:
+            time.sleep(self.latency)
+        if self.timeout:
+            raise requests.exceptions.ReadTimeout(f"Node {self.name} timed out")
+        return func(*args, **kwargs)
@@ -1,22 +1,29 @@
 import os
+import re
+import copy
 import time
-import types
+import hashlib
+import threading
 import logging
 import base64 as b64
 from pathlib import Path
-from contextlib import contextmanager
-from typing import List, Optional, Tuple, Iterable
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple, Iterable, Dict, Sequence
 from getpass import getpass
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-from fetchai.ledger.api import LedgerApi, TokenApi, ApiError
+from fetchai.ledger.api import LedgerApi
 from fetchai.ledger.api.contracts import ContractTxFactory
-from fetchai.ledger.api.token import AddressLike, TokenTxFactory
+from fetchai.ledger.api.token import AddressLike
 from fetchai.ledger.crypto import Entity, Address, Identity
-from fetchai.ledger.crypto.deed import Deed
 from fetchai.ledger.contract import Contract
+from fetchai.ledger.transaction import Transaction
+
+from fet_tools.client import get_client, TRANSIENT_ERRORS
+from fet_tools.metrics import get_metrics, instrument
 
 
 EntityList = List[Entity]
@@ -30,148 +37,377 @@ if os.path.exists("../erc20_migration_contract.etch"):
 else:
     ETCH_CONTRACT_ROOT = Path(__file__).resolve().parent.parent / 'ERC20-migration' / 'fet_contrat'
 
-FETFees = 100000
-
 
-@contextmanager
-def track_cost(api: TokenApi, entity: Entity, message: str):
+def connect_ledger(network: Optional[str] = None, host: Optional[str] = '127.0.0.1', port: Optional[int] = 8000):
     """
-    Context manager for recording the change in balance over a set of actions
-    Will be inaccurate if other factors change an account balance
+    Returns `LedgerApi` of the process-wide shared `LedgerClient` for given ledger, see `fet_tools.client`,
+    instrumented if metrics are enabled (see `fet_tools.metrics.enable_metrics`)
     """
-    if isinstance(entity, Entity):
-        entity = Address(entity)
-    elif not isinstance(entity, Address):
-        raise TypeError("Expecting Entity or Address")
-
-    balance_before = api.balance(entity)
-    yield
-
-    if not message:
-        message = "Actions cost: "
-
-    print(message + "{} TOK".format(api.balance(entity) - balance_before))
-
+    try:
+        return instrument(get_client(network=network, host=host, port=port).api)
+    except ConnectionError as ex:
+        logger.error(str(ex))
+        exit(1)
 
-def connect_ledger(network: Optional[str] = None, host: Optional[str] = '127.0.0.1', port: Optional[int] = 8000):
-    for _ in range(0, 200):
-        try:
-            if network:
-                logger.info(f"Connecting to {network} ledger network ...")
-                api = LedgerApi(network=network)
-            else:
-                logger.info("Connecting to ledger {}:{} ...".format(host, port))
-                api = LedgerApi(host, port)
 
-            break
+def derive_contract_address(owner: AddressLike, nonce: bytes) -> Address:
+    """
+    Derives address of the contract deployed by `owner` with `nonce`, the same way as `Contract(...)` does,
+    but without parsing the contract source
+    """
+    hasher = hashlib.sha256()
+    hasher.update(bytes(Address(owner)))
+    hasher.update(nonce)
+    return Address(hasher.digest())
 
-        except Exception as ex:
-            logger.error("Unable to connect to ledger {}:{} ...".format(host, port))
-            time.sleep(5)
 
-    if not api:
-        exit(1)
+class _TemplatedContract(Contract):
+    """
+    Contract instance sharing source, digest and parsed form with its `ContractTemplate`
+    """
+    @property
+    def encoded_source(self) -> str:
+        return self._encoded_source
 
-    tokens_api = api.tokens
-    if not callable(getattr(tokens_api, "query_deed", None)):
-        def query_deed(self, address: AddressLike):
-            """
-            Query the deed for a given address from the remote node
 
-            :param address: The base58 encoded string containing the address of the node
-            :return: The deed json response received from ledger
-            :raises: ApiError on any failures
-            """
+class ContractTemplate:
+    """
+    Contract source with its digest and parsed (validated) form, computed once and shared by all contract
+    instances created from the template, so instantiation pays only for owner, nonce & address derivation
+    """
+    def __init__(self, source: str):
+        # Parse & digest the source once, using placeholder owner & nonce
+        self._prototype = _TemplatedContract(source, Address(bytes(Address.BYTE_LENGTH)), b'')
+        self._prototype._encoded_source = Contract.encoded_source.fget(self._prototype)
+        self.content_hash = hashlib.sha256(source.encode()).hexdigest()
 
-            # convert the input to an address
-            address = Address(address)
+    @property
+    def source(self) -> str:
+        return self._prototype.source
 
-            # format and make the request
-            request = {
-                'address': str(address)
-            }
-            success, data = self._post_json('queryDeed', request)
+    @property
+    def digest(self) -> str:
+        return self._prototype.digest
 
-            # check for error cases
-            if not success:
-                raise ApiError(f'Failed to query deed for the {address} address')
+    def instantiate(self, owner: AddressLike, nonce: bytes) -> Contract:
+        contract = copy.copy(self._prototype)
+        contract._owner = Address(owner)
+        contract._nonce = nonce
+        contract._address = derive_contract_address(contract._owner, nonce)
+        return contract
 
-            return data
 
-        # Extend instance of the TokenApi class with missing method
-        tokens_api.query_deed = types.MethodType(query_deed, tokens_api)
+_templates_by_hash = {}  # type: Dict[str, ContractTemplate]
+_templates_by_file = {}  # type: Dict[str, Tuple[int, int, ContractTemplate]]
+_templates_lock = threading.Lock()
 
-    def deploy_deed(self, address: AddressLike, deed: Optional[Deed], fee: int, signatories: Iterable[Identity]):
-        """
-        Deploys the deed on `address`.
-
-        :param address: Address where the deed will be deployed
-        :param deed: The deed to set
-        :param fee: Fee in Canonical FET
-        :param signatories: The entities that will sign this action
-        :return: The digest of the submitted transaction
-        :raises: ApiError on any failures
-        """
 
-        tx = TokenTxFactory.deed(address, deed, fee, signatories)
-        self._set_validity_period(tx)
+def get_contract_template_from_text(source: str) -> ContractTemplate:
+    """
+    Returns cached template for the contract source, keyed by content hash
+    """
+    content_hash = hashlib.sha256(source.encode()).hexdigest()
+    with _templates_lock:
+        template = _templates_by_hash.get(content_hash)
+    if template is None:
+        template = ContractTemplate(source)
+        with _templates_lock:
+            template = _templates_by_hash.setdefault(content_hash, template)
+    return template
 
-        for signatory in signatories:
-            tx.sign(signatory)
 
-        return self.submit_signed_tx(tx)
+def get_contract_template(contract_file) -> ContractTemplate:
+    """
+    Returns cached template for the contract file, keyed by file path + mtime (+ size), falling back to
+    content hash when the file has been touched but its content did not change
+    """
+    path = str(Path(contract_file).resolve())
+    stat = os.stat(path)
+    with _templates_lock:
+        cached = _templates_by_file.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
 
-    # Extend instance of the TokenApi class with missing method
-    tokens_api.deed = types.MethodType(deploy_deed, tokens_api)
+    with open(path, 'r') as f:
+        template = get_contract_template_from_text(f.read())
 
-    return api
+    with _templates_lock:
+        _templates_by_file[path] = (stat.st_mtime_ns, stat.st_size, template)
+    return template
 
 
 def get_contract_text(contract_dir, contract_name: str):
-    with open(contract_dir / contract_name, 'r') as f:
-        contract_text = f.read()
-    return contract_text
+    return get_contract_template(Path(contract_dir) / contract_name).source
 
 
 def get_contract(contract_dir: Path, contract_name: str, owner: Entity, contract_nonce: str):
     owner_addr = Address(owner)
-    contract_text = get_contract_text(contract_dir, contract_name)
-    contract = Contract(contract_text, owner_addr, contract_nonce.encode())
+    template = get_contract_template(Path(contract_dir) / contract_name)
+    contract = template.instantiate(owner_addr, contract_nonce.encode())
     logger.info(f"Contract text for {contract_name} loaded:")
     logger.info(f"Address: {contract.address}")
     logger.info(f"Owner: f{owner_addr}")
     return contract
 
 
-def deploy_contract(api: LedgerApi, contract: Contract, fee: int, signatories: EntityList,
-                    transfers: Optional[List[Tuple]] = None):
-    #TODO(pb: issue_with_v1.0.2): Commenting out as temorary workaround bellow
-    #tx = contract.create_as_tx(api=api, from_address=contract.owner, fee=fee, signers=signatories)
-
-    #TODO(pb: issue_with_v1.0.2): Temorary workaround for above commented-out code
+def create_deploy_tx(contract: Contract, fee: int, signatories: EntityList,
+                     transfers: Optional[List[Tuple]] = None) -> Transaction:
+    #TODO(pb: issue_with_v1.0.2): Temorary workaround for `contract.create_as_tx(...)`
     shard_mask = None
     tx = ContractTxFactory.create(contract.owner, contract, fee, signatories, shard_mask)
-    api.set_validity_period(tx)
 
     for address, amount in transfers if transfers else []:
         tx.add_transfer(address, amount)
 
+    return tx
+
+
+def create_action_tx(contract_address: AddressLike, from_address: AddressLike, action: str, fee: int,
+                     signatories: EntityList, transfers: Optional[List[Tuple]] = None,
+                     args: Sequence = ()) -> Transaction:
+    tx = ContractTxFactory.action(Address(from_address),
+                                  Address(contract_address),
+                                  action,
+                                  fee,
+                                  signatories,
+                                  *args)
+
+    for address, amount in transfers if transfers else []:
+        tx.add_transfer(address, amount)
+
+    return tx
+
+
+def sign_tx(tx: Transaction, signatories: EntityList) -> Transaction:
     for signatory in signatories:
         tx.sign(signatory)
+    return tx
+
+
+_worker_signatories = []  # type: EntityList
+
+
+def _init_signing_worker(private_keys: List[bytes]):
+    global _worker_signatories
+    _worker_signatories = [Entity(key) for key in private_keys]
+
+
+def _sign_payloads(items: List[Tuple[bytes, int]]) -> List[bytes]:
+    return [_worker_signatories[key_index].sign(payload) for payload, key_index in items]
+
+
+class ParallelSigner:
+    """
+    Signs transactions in a pool of worker processes, so CPU-bound ECDSA signing is not serialised by the GIL
+
+    Private keys of `signatories` are passed to each worker only once at its start, work items are then just
+    (tx payload, signatory index) pairs, hence even single tx with many signatories is signed in parallel.
+
+    :param signatories: All entities which might be requested to sign
+    :param processes: Number of worker processes, defaults to number of CPUs
+    :param chunksize: Number of signatures computed by a worker in one go
+    """
+    def __init__(self, signatories: EntityList, processes: Optional[int] = None, chunksize: int = 32):
+        self._key_index = {Identity(s): i for i, s in enumerate(signatories)}
+        self.chunksize = chunksize
+        self._pool = ProcessPoolExecutor(max_workers=processes,
+                                         initializer=_init_signing_worker,
+                                         initargs=([s.private_key_bytes for s in signatories],))
+
+    def sign(self, txs: Iterable[Tuple[Transaction, EntityList]]) -> List[Transaction]:
+        """
+        Signs each transaction with its signatories
+
+        :param txs: (tx, signatories) pairs, validity period must already be set
+        :return: Signed transactions in the same order
+        """
+        txs = list(txs)
+        items = []
+        targets = []
+        for tx, signatories in txs:
+            payload = tx.encode_payload()
+            for signatory in signatories:
+                identity = Identity(signatory)
+                items.append((payload, self._key_index[identity]))
+                targets.append((tx, identity))
+
+        chunks = [items[i:i + self.chunksize] for i in range(0, len(items), self.chunksize)]
+        signatures = (sig for chunk in self._pool.map(_sign_payloads, chunks) for sig in chunk)
+        for (tx, identity), signature in zip(targets, signatures):
+            tx.add_signature(identity, signature)
+
+        return [tx for tx, _ in txs]
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def sign_txs(txs: Iterable[Tuple[Transaction, EntityList]], processes: int = 0) -> List[Transaction]:
+    """
+    Signs each transaction with its signatories, serially on the calling thread if `processes` is 0 (or 1),
+    otherwise in a pool of `processes` worker processes
+
+    :param txs: (tx, signatories) pairs, validity period must already be set
+    :return: Signed transactions in the same order
+    """
+    txs = list(txs)
+    # Signatories without local private key (e.g. signer agent) can not be used in worker processes
+    if processes <= 1 or not all(isinstance(s, Entity) for _, signatories in txs for s in signatories):
+        return [sign_tx(tx, signatories) for tx, signatories in txs]
+
+    all_signatories = list({Identity(s): s for _, signatories in txs for s in signatories}.values())
+    with ParallelSigner(all_signatories, processes) as signer:
+        return signer.sign(txs)
+
+
+def set_validity_period_batch(api: LedgerApi, txs: Iterable[Transaction], period: Optional[int] = None):
+    """
+    Sets the same validity period for all transactions using a single block number query
+
+    :param api: Ledger API
+    :param txs: Transactions (not signed yet) to set validity period for
+    :param period: Validity period in blocks, ledger api default is used when not provided
+    :return: The `valid_until` block number, or None if there were no transactions
+    """
+    valid_from = valid_until = None
+    for tx in txs:
+        if valid_until is None:
+            api.set_validity_period(tx, period)
+            valid_from, valid_until = tx.valid_from, tx.valid_until
+        else:
+            tx.valid_from = valid_from
+            tx.valid_until = valid_until
+    return valid_until
+
+
+def submit_txs(api: LedgerApi, txs: Iterable[Transaction]) -> List[Tuple[Optional[str], Optional[Exception]]]:
+    """
+    Submits signed transactions back to back without waiting for any of them to be executed
+
+    :return: List of (digest, error) tuples in the same order as input transactions
+    """
+    results = []
+    for tx in txs:
+        try:
+            results.append((api.submit_signed_tx(tx), None))
+        except Exception as ex:
+            logger.error(f"Submission of tx failed: {ex}")
+            results.append((None, ex))
+    return results
+
+
+def submit_txs_pipelined(api: LedgerApi, txs: Iterable[Transaction],
+                         pipeline: int = 16) -> List[Tuple[Optional[str], Optional[Exception]]]:
+    """
+    Submits signed transactions with up to `pipeline` submissions in flight
+
+    :return: List of (digest, error) tuples in the same order as input transactions
+    """
+    txs = list(txs)
+    if pipeline <= 1 or len(txs) <= 1:
+        return submit_txs(api, txs)
+
+    def submit(tx: Transaction) -> Tuple[Optional[str], Optional[Exception]]:
+        try:
+            return api.submit_signed_tx(tx), None
+        except Exception as ex:
+            logger.error(f"Submission of tx failed: {ex}")
+            return None, ex
+
+    with ThreadPoolExecutor(max_workers=pipeline) as executor:
+        return list(executor.map(submit, txs))
+
+
+def sync_txs(api: LedgerApi, digests: Iterable[str], timeout: Optional[float] = 120, poll_interval: float = 1.0):
+    """
+    Waits for the whole set of transactions to reach terminal state
+
+    Contrary to `LedgerApi.sync(...)` it does not raise on the first failed transaction,
+    status of *each* transaction is returned instead. Status queries failing with transient (connection/timeout)
+    errors are repeated in the next polling round.
+
+    :return: Dictionary digest -> TxStatus, status is None for transactions which did not reach terminal
+             state before timeout
+    """
+    remaining = set(d for d in digests if d)
+    finished = {}
+    started = time.monotonic()
+    deadline = started + timeout if timeout is not None else None
+    metrics = get_metrics()
+    txs = len(remaining)
+
+    while remaining:
+        for digest in list(remaining):
+            try:
+                status = api.tx.status(digest)
+            except TRANSIENT_ERRORS as ex:
+                logger.warning(f"Status query of tx {digest} failed, retrying in the next round: {ex}")
+                continue
+            if not status.non_terminal:
+                finished[digest] = status
+                remaining.discard(digest)
+
+        if not remaining or (deadline is not None and time.monotonic() >= deadline):
+            break
+
+        if metrics is not None:
+            metrics.retry("sync")
+        time.sleep(poll_interval)
+
+    if metrics is not None and txs:
+        metrics.observe("sync", time.monotonic() - started, "Timeout" if remaining else None, txs=txs)
+
+    for digest in remaining:
+        finished[digest] = None
+
+    return finished
+
+
+def deploy_contract(api: LedgerApi, contract: Contract, fee: int, signatories: EntityList,
+                    transfers: Optional[List[Tuple]] = None, sync: bool = True):
+    """
+    Deploys the contract
+
+    :param sync: Wait for the tx to be executed, if False the digest is returned right after submission
+    :return: Digest of the deployment tx
+    """
+    #TODO(pb: issue_with_v1.0.2): Commenting out as temorary workaround bellow
+    #tx = contract.create_as_tx(api=api, from_address=contract.owner, fee=fee, signers=signatories)
+
+    #TODO(pb: issue_with_v1.0.2): Temorary workaround for above commented-out code
+    tx = create_deploy_tx(contract, fee, signatories, transfers)
+    api.set_validity_period(tx)
+    sign_tx(tx, signatories)
 
     tx_hash = api.submit_signed_tx(tx)
-    api.sync([tx_hash])
+    if sync:
+        api.sync([tx_hash])
     return tx_hash
 
 
+_HEX_PRIVATE_KEY = re.compile(r'[0-9a-fA-F]{64}')
+
+
+@lru_cache(maxsize=None)
 def entity_from_string(priv_key: str):
+    """
+    Parses private key in hex or base64 form, parsed entities are cached for the process lifetime
+
+    :return: Entity or None if the key can not be parsed
+    """
+    priv_key = priv_key.strip()
     try:
-        return Entity.from_hex(priv_key)
+        if _HEX_PRIVATE_KEY.fullmatch(priv_key):
+            return Entity.from_hex(priv_key)
+        return Entity.from_base64(priv_key)
     except Exception as _:
-        try:
-            return Entity.from_base64(priv_key)
-        except Exception as _:
-            pass
+        pass
 
     return None
 
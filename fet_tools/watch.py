@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Iterable, Iterator, Dict, List
+
+from fetchai.ledger.api import LedgerApi
+
+from fet_tools.status import ContractStatus, NOT_SETTLED, query_status_many
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Release timeout of the `accept` action in escrow.etch: 30 days in blocks (10 s per block)
+RELEASE_TIMEOUT_BLOCKS = 259200
+DEFAULT_BLOCK_TIME = 10.0
+CHECKPOINT_VERSION = 1
+
+EVENT_DEPOSITED = "deposited"
+EVENT_BUYER_OK = "buyer-ok"
+EVENT_SELLER_OK = "seller-ok"
+EVENT_BUYER_CANCEL = "buyer-cancel"
+EVENT_SELLER_CANCEL = "seller-cancel"
+EVENT_PAID = "paid"
+EVENT_REFUNDED = "refunded"
+
+
+@dataclass
+class EscrowEvent:
+    contract_address: str
+    event: str
+    block: int
+    amount: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        record = {"contract_address": self.contract_address, "event": self.event, "block": self.block}
+        if self.amount is not None:
+            record["amount"] = self.amount
+        return record
+
+
+@dataclass
+class _Tracked:
+    """
+    Last observed state of the contract, kept in compact form (this is also what the checkpoint holds)
+    """
+    balance: int = 0
+    buyer_ok: bool = False
+    seller_ok: bool = False
+    settled_since: int = NOT_SETTLED
+    start: Optional[int] = None
+    interval: float = 0.0
+
+    @property
+    def settled(self) -> bool:
+        return self.settled_since != NOT_SETTLED
+
+    def to_list(self) -> list:
+        return [self.balance, self.buyer_ok, self.seller_ok, self.settled_since, self.start]
+
+    @staticmethod
+    def from_list(values: list) -> '_Tracked':
+        return _Tracked(*values)
+
+
+@dataclass(order=True)
+class _Poll:
+    when: float
+    address: str = field(compare=False)
+
+
+def diff_status(address: str, previous: _Tracked, status: ContractStatus, block: int) -> List[EscrowEvent]:
+    """
+    State-transition events between the previously observed state and the current `status` of the contract
+
+    Settlement (`selfdestruct`) is reported as `paid` if both parties have accepted (=> `payBalance` has been
+    executed), otherwise as `refunded` (cancel by both parties, `kill`, or release to buyer after timeout).
+    Amount of settlement is the last observed deposited balance.
+    """
+    events = []
+    balance = int(status.balance or 0)
+    if balance > previous.balance:
+        events.append(EscrowEvent(address, EVENT_DEPOSITED, block, balance - previous.balance))
+
+    for flag, current, ok_event, cancel_event in (
+            ("buyer_ok", bool(status.buyerOk), EVENT_BUYER_OK, EVENT_BUYER_CANCEL),
+            ("seller_ok", bool(status.sellerOk), EVENT_SELLER_OK, EVENT_SELLER_CANCEL)):
+        if current != getattr(previous, flag):
+            events.append(EscrowEvent(address, ok_event if current else cancel_event, block))
+
+    settled_since = int(status.settledSinceBlock)
+    if settled_since != NOT_SETTLED and not previous.settled:
+        amount = max(balance, previous.balance)
+        paid = bool(status.buyerOk) and bool(status.sellerOk)
+        events.append(EscrowEvent(address, EVENT_PAID if paid else EVENT_REFUNDED, settled_since, amount))
+    return events
+
+
+class EscrowWatcher:
+    """
+    Follows escrow contracts and yields their state-transition events
+
+    Only contracts which are still active are polled. Each of them has its own poll interval which grows
+    (`multiplier`) from `min_interval` up to `max_interval` while the contract does not change, is reset on
+    change, and is shortened so that the contract is polled right after its release timeout expires
+    (`start` + 259200 blocks) when buyer has accepted and seller not - that is when the buyer can settle it.
+
+    Observed states are saved to `checkpoint` file (if given), so a restarted watcher resumes from the last
+    known states and settled contracts are not queried again. Checkpoint is saved at most every
+    `checkpoint_interval` seconds (and on exit), events emitted after the last save are emitted again
+    after an unclean restart (at-least-once delivery).
+
+    :param api: Ledger API
+    :param addresses: Contract addresses to watch, more can be added later (`add`)
+    :param checkpoint: Path of the JSON checkpoint file
+    :param block_time: Expected block time in [s], used to convert blocks to release timeout to seconds
+    """
+    def __init__(self, api: LedgerApi, addresses: Iterable[str] = (), checkpoint: Optional[str] = None,
+                 min_interval: float = 10.0, max_interval: float = 600.0, multiplier: float = 2.0,
+                 parallelism: int = 16, block_time: float = DEFAULT_BLOCK_TIME, checkpoint_interval: float = 10.0):
+        self.api = api
+        self.checkpoint = checkpoint
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.parallelism = parallelism
+        self.block_time = block_time
+        self.checkpoint_interval = checkpoint_interval
+        self.block = 0
+        self._tracked = {}  # type: Dict[str, _Tracked]
+        self._schedule = []  # type: List[_Poll]
+        self._last_checkpoint = 0.0
+        self._dirty = False
+        self._stop = threading.Event()
+
+        if checkpoint and os.path.exists(checkpoint):
+            self._load_checkpoint()
+        for address in addresses:
+            self.add(address)
+
+    @property
+    def active(self) -> int:
+        return sum(1 for t in self._tracked.values() if not t.settled)
+
+    def add(self, address: str):
+        address = str(address)
+        if address in self._tracked:
+            return
+        self._tracked[address] = _Tracked(interval=self.min_interval)
+        self._dirty = True
+        heapq.heappush(self._schedule, _Poll(time.monotonic(), address))
+
+    def _load_checkpoint(self):
+        with open(self.checkpoint, 'r') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {checkpoint.get('version')}")
+
+        self.block = checkpoint.get("block", 0)
+        now = time.monotonic()
+        for address, values in checkpoint["contracts"].items():
+            tracked = _Tracked.from_list(values)
+            tracked.interval = self.min_interval
+            self._tracked[address] = tracked
+            if not tracked.settled:
+                heapq.heappush(self._schedule, _Poll(now, address))
+        logger.info(f"Resumed from {self.checkpoint} checkpoint: {len(self._tracked)} contract(s), "
+                    f"{self.active} active")
+
+    def save_checkpoint(self):
+        if not self.checkpoint:
+            return
+        checkpoint = {
+            "version": CHECKPOINT_VERSION,
+            "block": self.block,
+            "contracts": {a: t.to_list() for a, t in self._tracked.items()},
+        }
+        tmp = f"{self.checkpoint}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(checkpoint, f, separators=(",", ":"))
+        os.replace(tmp, self.checkpoint)
+        self._dirty = False
+        self._last_checkpoint = time.monotonic()
+
+    def _next_interval(self, tracked: _Tracked, changed: bool) -> float:
+        interval = self.min_interval if changed else min(self.max_interval, tracked.interval * self.multiplier)
+        tracked.interval = interval
+
+        if tracked.buyer_ok and not tracked.seller_ok and tracked.start is not None:
+            blocks_to_release = tracked.start + RELEASE_TIMEOUT_BLOCKS + 1 - self.block
+            if blocks_to_release > 0:
+                interval = min(interval, max(self.min_interval, blocks_to_release * self.block_time))
+        return interval
+
+    def poll_once(self) -> List[EscrowEvent]:
+        """
+        Queries all contracts which are due now
+
+        :return: Events of this round, in order of contract status query completion
+        """
+        now = time.monotonic()
+        due = []
+        while self._schedule and self._schedule[0].when <= now:
+            address = heapq.heappop(self._schedule).address
+            if not self._tracked[address].settled:
+                due.append(address)
+        if not due:
+            return []
+
+        self.block = self.api.tokens.current_block_number()
+        events = []
+        for result in query_status_many(self.api, due, self.parallelism):
+            tracked = self._tracked[result.address]
+            if result.status is None:
+                logger.warning(f"Unable to query status of {result.address} contract: {result.error}")
+                changed = False
+            else:
+                status = result.status
+                contract_events = diff_status(result.address, tracked, status, self.block)
+                changed = bool(contract_events) or tracked.start is None
+                tracked.balance = int(status.balance or 0)
+                tracked.buyer_ok = bool(status.buyerOk)
+                tracked.seller_ok = bool(status.sellerOk)
+                tracked.settled_since = int(status.settledSinceBlock)
+                tracked.start = int(status.start)
+                events.extend(contract_events)
+                self._dirty = self._dirty or changed
+
+            if not tracked.settled:
+                interval = self._next_interval(tracked, changed)
+                heapq.heappush(self._schedule, _Poll(time.monotonic() + interval, result.address))
+
+        if self._dirty and time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+            self.save_checkpoint()
+        return events
+
+    def events(self, until_settled: bool = False) -> Iterator[EscrowEvent]:
+        """
+        Polls contracts as they become due and yields their events, checkpoint is saved on exit
+
+        :param until_settled: Stop once all watched contracts are settled, otherwise run until `stop()`
+        """
+        try:
+            while not self._stop.is_set():
+                yield from self.poll_once()
+                if until_settled and self.active == 0:
+                    break
+                delay = max(0.0, self._schedule[0].when - time.monotonic()) if self._schedule else self.min_interval
+                self._stop.wait(delay)
+        finally:
+            if self._dirty:
+                self.save_checkpoint()
+
+    def stop(self):
+        self._stop.set()
+
+
+def watch_contracts(api: LedgerApi, addresses: Iterable[str], checkpoint: Optional[str] = None,
+                    until_settled: bool = False, **kwargs) -> Iterator[EscrowEvent]:
+    """
+    Generator of state-transition events of escrow contracts, see `EscrowWatcher`
+    """
+    yield from EscrowWatcher(api, addresses, checkpoint, **kwargs).events(until_settled)